@@ -0,0 +1,166 @@
+"""Асинхронные версии самых частых GET-запросов для запуска под ASGI.
+
+Подключаются в foodgram/urls.py при ASYNC_READ_VIEWS поверх маршрутов DRF:
+список и детальная страница рецептов, автодополнение ингредиентов и
+короткие ссылки. Рецепты проходят через тот же RecipesViewSet, что и
+sync-маршрут: аутентификация, права, троттлинг, фильтры и пагинация
+выполняются его кодом в sync_to_async, а в event loop остаются кэш
+фрагментов и рендеринг. Запись и нечёткий поиск ингредиентов уходят
+в вьюсеты DRF целиком.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponseBase,
+    HttpResponseRedirect,
+    JsonResponse,
+)
+from rest_framework.response import Response
+
+from api.serializers import RecipeGetSerializer
+from api.views import IngredientsViewSet, RecipesViewSet
+from posts import ingredient_index, short_codes
+from posts.cache import aget_recipe_fragments
+
+recipes_list_fallback = RecipesViewSet.as_view(
+    {"get": "list", "post": "create"}
+)
+recipe_detail_fallback = RecipesViewSet.as_view(
+    {
+        "get": "retrieve",
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    }
+)
+ingredients_list_fallback = IngredientsViewSet.as_view({"get": "list"})
+
+
+def csrf_exempt(view):
+    # Декоратор Django до 5.0 оборачивает корутину в обычную функцию;
+    # CSRF не нужен: запись уходит в DRF, а там токены
+    view.csrf_exempt = True
+    return view
+
+
+def json_response(data, status=200):
+    # Как JSONRenderer DRF: UTF-8 без \u-экранирования и без пробелов
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+async def fallback(view, request, *args, **kwargs):
+    return await sync_to_async(view)(request, *args, **kwargs)
+
+
+def finalize(view, response):
+    """Ответ DRF с заголовками и рендерером вьюсета, как после dispatch."""
+    response = view.finalize_response(view.request, response)
+    return response.render()
+
+
+def load(request, action, loader, **kwargs):
+    """Синхронная часть запроса: проверки и выборка RecipesViewSet.
+
+    Повторяет APIView.dispatch до вызова обработчика: initial() проводит
+    ту же аутентификацию, проверку прав и троттлинг, что и sync-маршрут,
+    исключения превращаются в ответ через handle_exception.
+    Возвращает (view, результат loader(view) или готовый ответ).
+    """
+    view = RecipesViewSet(action_map={"get": action}, args=(), kwargs=kwargs)
+    view.request = view.initialize_request(request, **kwargs)
+    view.headers = view.default_response_headers
+    try:
+        view.initial(view.request)
+        result = loader(view)
+    except Exception as error:
+        result = view.handle_exception(error)
+    if isinstance(result, Response):
+        result = finalize(view, result)
+    return view, result
+
+
+def load_page(view):
+    queryset = view.list_queryset()
+    if queryset is None:
+        return Response(status=404)
+    return view.paginate_queryset(queryset)
+
+
+def load_recipe(view):
+    recipe = view.get_recipe()
+    if recipe is None:
+        return Response(status=404)
+    return recipe
+
+
+async def serialize_recipes(recipes, request):
+    """RecipeGetSerializer без потоков.
+
+    Фрагменты берутся из кэша, флаги пользователя — из аннотаций.
+
+    Промахи кэша собираются синхронно: prefetch_related в async ORM нет.
+    """
+    serializer = RecipeGetSerializer(context={"request": request})
+    fragments = await aget_recipe_fragments([recipe.pk for recipe in recipes])
+    missing = [recipe.pk for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        fragments.update(
+            await sync_to_async(serializer.build_fragments)(missing)
+        )
+    return [
+        serializer.overlay(fragments[recipe.pk], recipe)
+        for recipe in recipes
+        if recipe.pk in fragments
+    ]
+
+
+@csrf_exempt
+async def recipes_list(request):
+    if request.method != "GET":
+        return await fallback(recipes_list_fallback, request)
+    view, page = await sync_to_async(load)(request, "list", load_page)
+    if isinstance(page, HttpResponseBase):
+        return page
+    results = await serialize_recipes(page, view.request)
+    return finalize(view, view.get_paginated_response(results))
+
+
+@csrf_exempt
+async def recipe_detail(request, pk):
+    if request.method != "GET":
+        return await fallback(recipe_detail_fallback, request, pk=str(pk))
+    view, recipe = await sync_to_async(load)(
+        request, "retrieve", load_recipe, pk=str(pk)
+    )
+    if isinstance(recipe, HttpResponseBase):
+        return recipe
+    data = (await serialize_recipes([recipe], view.request))[0]
+    return finalize(view, Response(data))
+
+
+async def ingredients_list(request):
+    params = request.GET
+    # Нечёткий поиск и ?search= остаются у вьюсета
+    if not set(params) <= {"name", "limit"}:
+        return await fallback(ingredients_list_fallback, request)
+    limit = params.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) == 0:
+            return await fallback(ingredients_list_fallback, request)
+        limit = min(int(limit), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+
+    index = await ingredient_index.aget_index()
+    return json_response(index.search(params.get("name", ""), limit))
+
+
+async def short_link_redirect(request, code):
+    recipe_id = await short_codes.aresolve(code)
+    if recipe_id is None:
+        raise Http404
+    return HttpResponseRedirect(f"/recipes/{recipe_id}/")
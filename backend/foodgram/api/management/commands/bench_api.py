@@ -0,0 +1,202 @@
+import json
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from posts import short_codes
+from posts.models import Ingredient, LegacyShortCode, Recipe
+from users.models import User
+
+SCENARIOS = [
+    "recipes_list",
+    "recipe_detail",
+    "ingredients",
+    "subscriptions",
+    "download_shopping_cart",
+    "short_link",
+    "short_link_legacy",
+]
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет основные эндпоинты внутри процесса и печатает p50/p95/p99 "
+        "и число SQL-запросов; с --baseline падает при регрессии"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--baseline", help="JSON с результатами прошлого прогона"
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Записать результат в --baseline",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Допустимый рост p95 относительно базового (доля)",
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.prepare()
+
+        results = {}
+        # Тестовый клиент ходит на testserver
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            for name in options["scenarios"] or SCENARIOS:
+                results[name] = self.run(
+                    getattr(self, name), options["requests"], options["warmup"]
+                )
+                self.print_result(name, results[name])
+
+        if options["baseline"]:
+            path = Path(options["baseline"])
+            if options["save_baseline"]:
+                path.write_text(
+                    json.dumps(results, indent=2, ensure_ascii=False)
+                )
+                self.stdout.write(f"Базовые результаты записаны в {path}")
+            else:
+                self.compare(results, path, options["tolerance"])
+
+    def prepare(self):
+        """Выбирает данные для запросов; нужна база после generate_data."""
+        self.recipe_ids = list(
+            Recipe.objects.values_list("id", flat=True)[:10_000]
+        )
+        names = Ingredient.objects.values_list("name", flat=True)[:1000]
+        self.prefixes = sorted({name[:2] for name in names if len(name) >= 2})
+        # Самый «тяжёлый» читатель: больше всего подписок и корзина не пустая
+        self.user = (
+            User.objects.filter(shopping_cart__isnull=False)
+            .annotate(follows=Count("subscriptions", distinct=True))
+            .order_by("-follows")
+            .first()
+        )
+        if not self.recipe_ids or not self.prefixes or self.user is None:
+            raise CommandError(
+                "Нет данных для замеров, сначала запустите generate_data"
+            )
+        self.legacy_codes = list(
+            LegacyShortCode.objects.values_list("code", flat=True)[:10_000]
+        )
+        self.anon = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, client, url, status=200):
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        if response.status_code != status:
+            raise CommandError(f"{url}: ответ {response.status_code}")
+
+    def recipes_list(self):
+        page = self.random.randint(1, 20)
+        self.request(self.client, f"/api/recipes/?page={page}&limit=6")
+
+    def recipe_detail(self):
+        recipe_id = self.random.choice(self.recipe_ids)
+        self.request(self.client, f"/api/recipes/{recipe_id}/")
+
+    def ingredients(self):
+        prefix = self.random.choice(self.prefixes)
+        self.request(self.anon, f"/api/ingredients/?name={prefix}")
+
+    def subscriptions(self):
+        self.request(
+            self.client, "/api/users/subscriptions/?limit=6&recipes_limit=3"
+        )
+
+    def download_shopping_cart(self):
+        self.request(self.client, "/api/recipes/download_shopping_cart/")
+
+    def short_link(self):
+        code = short_codes.encode(self.random.choice(self.recipe_ids))
+        self.request(self.anon, f"/api/short_link/{code}/", status=302)
+
+    def short_link_legacy(self):
+        # Без старых кодов (после generate_data) меряем промахи: их кэширует
+        # отрицательный кэш
+        if self.legacy_codes:
+            code = self.random.choice(self.legacy_codes)
+            self.request(self.anon, f"/api/short_link/{code}/", status=302)
+        else:
+            code = f"{self.random.randrange(16**6):06x}"
+            self.request(self.anon, f"/api/short_link/{code}/", status=404)
+
+    def run(self, scenario, count, warmup):
+        for _ in range(warmup):
+            scenario()
+
+        timings, queries = [], []
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                scenario()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+
+        return {
+            "p50": round(percentile(timings, 0.50), 3),
+            "p95": round(percentile(timings, 0.95), 3),
+            "p99": round(percentile(timings, 0.99), 3),
+            "queries": max(queries),
+        }
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f"{name:24} p50={result['p50']:8.2f} мс  "
+            f"p95={result['p95']:8.2f} мс  p99={result['p99']:8.2f} мс  "
+            f"запросов={result['queries']}"
+        )
+
+    def compare(self, results, path, tolerance):
+        if not path.exists():
+            raise CommandError(f"Нет базовых результатов: {path}")
+        baseline = json.loads(path.read_text())
+
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["p95"] > base["p95"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: p95 {base['p95']:.2f} -> {result['p95']:.2f} мс"
+                )
+            if result["queries"] > base["queries"]:
+                regressions.append(
+                    f"{name}: запросов {base['queries']} -> "
+                    f"{result['queries']}"
+                )
+
+        if regressions:
+            raise CommandError("Регрессия:\n" + "\n".join(regressions))
+        self.stdout.write(
+            self.style.SUCCESS("Регрессий относительно базовых нет")
+        )
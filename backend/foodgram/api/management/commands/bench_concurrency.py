@@ -0,0 +1,204 @@
+import asyncio
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.bench_api import percentile
+
+DEFAULT_PATHS = [
+    "/api/recipes/?limit=6",
+    "/api/recipes/?limit=6&page=2",
+    "/api/ingredients/?name=са",
+]
+
+
+class Target:
+    def __init__(self, spec):
+        label, _, url = spec.partition("=")
+        if not url:
+            raise CommandError(f"Ожидается label=url, получено {spec!r}")
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError(
+                f"Поддерживается только http://host[:port]: {url}"
+            )
+        self.label = label
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.connects = 0
+
+
+async def read_response(reader):
+    """Статус и признак keep-alive; тело читается и отбрасывается."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Сервер закрыл соединение")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def virtual_client(
+    target, paths, token, deadline, timeout, stats, offset
+):
+    """Одно соединение с keep-alive; если сервер его закрыл — новое."""
+    reader = writer = None
+    number = offset
+    while time.perf_counter() < deadline:
+        path = quote(target.prefix + paths[number % len(paths)], safe="/?=&")
+        number += 1
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: {target.host}:{target.port}\r\n"
+            "Accept: application/json\r\nConnection: keep-alive\r\n"
+        )
+        if token:
+            request += f"Authorization: Token {token}\r\n"
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(target.host, target.port), timeout
+                )
+                stats.connects += 1
+            writer.write((request + "\r\n").encode())
+            status, keep_alive = await asyncio.wait_for(
+                read_response(reader), timeout
+            )
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            ValueError,
+        ):
+            stats.errors += 1
+            keep_alive = False
+        else:
+            stats.latencies.append((time.perf_counter() - started) * 1000)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(target, paths, token, connections, duration, timeout):
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            virtual_client(
+                target, paths, token, deadline, timeout, stats, number
+            )
+            for number in range(connections)
+        )
+    )
+    return stats, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Держит заданное число одновременных соединений к запущенному серверу "
+        "и печатает req/s и p50/p95/p99; для сравнения WSGI и ASGI на одном "
+        "наборе запросов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="label=http://host:port, можно несколько: "
+            "--target wsgi=http://127.0.0.1:8000 "
+            "--target asgi=http://127.0.0.1:8001",
+        )
+        parser.add_argument("--paths", nargs="*", default=DEFAULT_PATHS)
+        parser.add_argument(
+            "--connections",
+            nargs="*",
+            type=int,
+            default=[10, 50, 200, 500],
+            help="Уровни числа одновременных соединений",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Секунд на каждый уровень",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10,
+            help="Таймаут запроса, секунды",
+        )
+        parser.add_argument(
+            "--token", help="Токен пользователя для Authorization"
+        )
+
+    def handle(self, *args, **options):
+        targets = [Target(spec) for spec in options["target"]]
+        self.stdout.write(
+            f"{'сервер':<10} {'соед.':>6} {'запросов':>9} {'req/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'ошибок':>7} {'≥400':>7}"
+        )
+        for connections in options["connections"]:
+            for target in targets:
+                stats, elapsed = asyncio.run(
+                    run_level(
+                        target,
+                        options["paths"],
+                        options["token"],
+                        connections,
+                        options["duration"],
+                        options["timeout"],
+                    )
+                )
+                self.print_level(target.label, connections, stats, elapsed)
+
+    def print_level(self, label, connections, stats, elapsed):
+        done = len(stats.latencies)
+        not_ok = sum(
+            count
+            for status, count in stats.statuses.items()
+            if not 200 <= status < 400
+        )
+        if done:
+            latency = " ".join(
+                f"{percentile(stats.latencies, share):>6.1f}мс"
+                for share in (0.5, 0.95, 0.99)
+            )
+        else:
+            latency = f"{'—':>8} {'—':>8} {'—':>8}"
+        self.stdout.write(
+            f"{label:<10} {connections:>6} {done:>9} {done / elapsed:>8.1f} "
+            f"{latency} {stats.errors:>7} {not_ok:>7}"
+        )
@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import SHOPPING_LIST_RENDERERS
+
+UNITS = ["г", "кг", "мл", "л", "шт", "ст. л.", "ч. л.", "по вкусу"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет выгрузку списка покупок: время до первого куска, общее "
+        "время и пик памяти для каждого формата"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument(
+            "--formats",
+            nargs="*",
+            default=[renderer.format for renderer in SHOPPING_LIST_RENDERERS],
+        )
+
+    def rows(self, count):
+        # Уже отсортированы по единице и названию, как из базы
+        per_unit = count // len(UNITS) + 1
+        produced = 0
+        for unit in sorted(UNITS):
+            for number in range(per_unit):
+                if produced == count:
+                    return
+                produced += 1
+                yield f"ингредиент {number:06d}", unit, number + 1
+
+    def handle(self, *args, **options):
+        renderers = {
+            renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS
+        }
+        for name in options["formats"]:
+            renderer = renderers[name]
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            first_byte = None
+            size = 0
+            for chunk in renderer.stream(self.rows(options["rows"])):
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+            total = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:5} ttfb={first_byte * 1000:.2f} мс  "
+                f"всего={total * 1000:.0f} мс  размер={size / 1024:.0f} КиБ  "
+                f"пик памяти={peak / 1024:.0f} КиБ"
+            )
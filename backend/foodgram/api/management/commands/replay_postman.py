@@ -0,0 +1,116 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.management.commands.bench_api import percentile
+from api.postman_replay import load_collection, replay
+
+DEFAULT_COLLECTIONS = [
+    settings.BASE_DIR / "add_users_and_recipes.postman_collection.json",
+    settings.BASE_DIR.parent.parent
+    / "postman_collection/foodgram.postman_collection.json",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Воспроизводит Postman-коллекции проекта как нагрузку и печатает "
+        "пропускную способность и задержки по эндпоинтам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "collections",
+            nargs="*",
+            help="Коллекции (по умолчанию обе из репозитория)",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="Сколько виртуальных пользователей",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Сколько одновременно"
+        )
+        parser.add_argument(
+            "--pool", choices=["thread", "process"], default="thread"
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Адрес запущенного сервера; без него — внутри процесса "
+            "через test client",
+        )
+        parser.add_argument(
+            "--include-bad-requests",
+            action="store_true",
+            help="Не пропускать папки *bad_requests (проверки ошибок)",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["collections"] or [
+            str(path) for path in DEFAULT_COLLECTIONS if path.exists()
+        ]
+        if not paths:
+            raise CommandError("Не найдено ни одной коллекции")
+        collections = [
+            load_collection(path, options["include_bad_requests"])
+            for path in paths
+        ]
+        steps = sum(len(steps) for steps, _ in collections)
+        self.stdout.write(
+            f"Коллекций: {len(paths)}, шагов на пользователя: {steps}, "
+            f"пользователей: {options['users']}, "
+            f"одновременно: {options['concurrency']}"
+        )
+
+        # Тестовый клиент ходит на testserver
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            results, elapsed = replay(
+                collections,
+                options["users"],
+                options["concurrency"],
+                pool=options["pool"],
+                base_url=options["base_url"],
+            )
+        self.report(results, elapsed)
+
+    def report(self, results, elapsed):
+        by_endpoint = defaultdict(list)
+        for name, status, ms in results:
+            by_endpoint[name].append((status, ms))
+
+        self.stdout.write(
+            f"{'эндпоинт':45} {'всего':>6} {'2xx':>5} {'4xx':>5} {'5xx':>5} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8}"
+        )
+        for name in sorted(
+            by_endpoint, key=lambda key: key.split(" ", 1)[::-1]
+        ):
+            rows = by_endpoint[name]
+            timings = [ms for _, ms in rows]
+            classes = defaultdict(int)
+            for status, _ in rows:
+                classes[status // 100] += 1
+            self.stdout.write(
+                f"{name:45} {len(rows):6} {classes[2]:5} {classes[4]:5} "
+                f"{classes[5] + classes[0]:5} {percentile(timings, 0.5):8.1f} "
+                f"{percentile(timings, 0.95):8.1f} "
+                f"{percentile(timings, 0.99):8.1f}"
+            )
+
+        failed = sum(
+            1 for _, status, _ in results if status == 0 or status >= 500
+        )
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f"Запросов: {len(results)} за {elapsed:.1f} с "
+                f"({len(results) / elapsed:.0f} в секунду), "
+                f"ошибок сервера: {failed}"
+            )
+        )
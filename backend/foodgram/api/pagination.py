@@ -1,4 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    _positive_int,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по статистике планировщика PostgreSQL.
+
+    Возвращает None, если база не PostgreSQL или план разобрать не удалось.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (LookupError, TypeError, ValueError):
+        return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который на больших выборках не делает COUNT(*).
+
+    Если оценка планировщика меньше порога, считаем точно: на маленьких
+    таблицах COUNT(*) дешёвый, а оценка там неточная.
+    """
+
+    threshold = 0
+
+    @cached_property
+    def count(self):
+        if self.threshold:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= self.threshold:
+                return estimate
+        return super().count
 
 
 # не стал объединять в один класс для потенциального изменения какого-то конкретного
@@ -13,6 +70,167 @@ class RecipePagination(PageNumberPagination):
     page_query_param = "page"
     page_limit = 1
 
+    def django_paginator_class(self, *args, **kwargs):
+        paginator = EstimatedCountPaginator(*args, **kwargs)
+        paginator.threshold = settings.RECIPE_COUNT_ESTIMATE_THRESHOLD
+        return paginator
+
+
+class RecipeCursorPagination(BasePagination):
+    """Keyset-пагинация ленты рецептов по (pub_date, id).
+
+    Без COUNT(*) и OFFSET: каждая страница — это условие
+    (pub_date, id) < (последний pub_date, последний id) по индексу.
+    Курсор непрозрачный: base64 от JSON с ключом и направлением.
+    Подклассы могут сортировать по другой паре полей (key_field, id_field).
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    max_page_size = 100
+    invalid_cursor_message = "Неверный курсор"
+    key_field = "pub_date"
+    id_field = "id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        key, pk = self.key_field, self.id_field
+        queryset = queryset.order_by(f"-{key}", f"-{pk}")
+        reverse = False
+        if self.cursor is not None:
+            value, last_pk, reverse = self.cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f"{key}__gt": value})
+                    | Q(**{key: value, f"{pk}__gt": last_pk})
+                ).order_by(key, pk)
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{key}__lt": value})
+                    | Q(**{key: value, f"{pk}__lt": last_pk})
+                )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK["PAGE_SIZE"]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            value = self.parse_key(data["d"])
+            pk = int(data["i"])
+            reverse = bool(data.get("r", False))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, reverse
+
+    def parse_key(self, raw):
+        return parse_datetime(raw)
+
+    def dump_key(self, value):
+        return value.isoformat()
+
+    def encode_cursor(self, item, reverse=False):
+        data = {
+            "d": self.dump_key(getattr(item, self.key_field)),
+            "i": getattr(item, self.id_field),
+        }
+        if reverse:
+            data["r"] = True
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(data, separators=(",", ":")).encode()
+        )
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            encoded.decode().rstrip("="),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                },
+                "results": schema,
+            },
+        }
+
+
+class PopularCursorPagination(RecipeCursorPagination):
+    """Курсор по строкам рейтинга PopularRecipe: (score, recipe_id)."""
+
+    key_field = "score"
+    id_field = "recipe_id"
+
+    def parse_key(self, raw):
+        if isinstance(raw, bool) or not isinstance(raw, int):
+            raise ValueError(raw)
+        return raw
+
+    def dump_key(self, value):
+        return value
+
 
 class UsersPagination(PageNumberPagination):
     page_size_query_param = "limit"
@@ -0,0 +1,336 @@
+"""Воспроизведение Postman-коллекций проекта как нагрузки на API.
+
+Коллекция разворачивается в последовательность шагов (метод, URL, тело,
+авторизация). Переменные {{...}} подставляются из переменных коллекции и
+из ответов: тестовые скрипты вида
+    const recipeId = _.get(responseData, "id");
+    pm.collectionVariables.set("firstRecipeId", recipeId);
+разбираются в правила «взять поле ответа в переменную». Каждый
+виртуальный пользователь проходит шаги по порядку со своими
+переменными; email, username и названия рецептов получают его метку,
+чтобы параллельные прогоны не упирались в уникальность.
+"""
+import json
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+VARIABLE = re.compile(r"\{\{([^{}$]+)\}\}")
+ALIAS = re.compile(
+    r'const\s+(\w+)\s*=\s*_\.get\(\s*responseData\s*,\s*"([^"]+)"\s*\)'
+)
+SETTER = re.compile(
+    r"pm\.(?:collectionVariables|environment|globals)\.set\("
+    r"\s*[\"'](\w+)[\"']\s*,\s*(.+?)\s*\)\s*;?\s*$"
+)
+RESPONSE_PATH = re.compile(
+    r"responseData((?:\[\d+\]|\.\w+)*)(?:\.slice\(\s*(\d+)\s*,\s*(\d+)\s*\))?$"
+)
+PATH_TOKEN = re.compile(r"\[(\d+)\]|\.?(\w+)")
+# Переменные, которые должны быть уникальны у каждого виртуального пользователя
+UNIQUE_VARIABLE = re.compile(r"email|username", re.IGNORECASE)
+
+
+class Step:
+    """Один запрос коллекции и правила извлечения переменных из ответа."""
+
+    def __init__(self, folder, name, method, url, headers, body, extractors):
+        self.folder = folder
+        self.name = name
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.extractors = extractors
+
+
+def parse_path(path):
+    """'a.b[0].c' или '[0].id' -> ['a', 'b', 0, 'c']."""
+    tokens = []
+    for index, name in PATH_TOKEN.findall(path):
+        tokens.append(int(index) if index else name)
+    return tokens
+
+
+def parse_extractors(lines):
+    """Правила (переменная, путь в ответе, срез) из тестового скрипта."""
+    aliases = {}
+    extractors = []
+    for line in lines:
+        line = line.strip()
+        alias = ALIAS.search(line)
+        if alias:
+            aliases[alias.group(1)] = (parse_path(alias.group(2)), None)
+            continue
+        setter = SETTER.search(line)
+        if not setter:
+            continue
+        variable, expression = setter.groups()
+        if expression in aliases:
+            extractors.append((variable, *aliases[expression]))
+            continue
+        match = RESPONSE_PATH.match(expression)
+        if match:
+            path, start, stop = match.groups()
+            bounds = (int(start), int(stop)) if start is not None else None
+            extractors.append((variable, parse_path(path), bounds))
+    return extractors
+
+
+def extract(data, path, bounds):
+    for token in path:
+        data = data[token]
+    if bounds is not None:
+        data = data[bounds[0]:bounds[1]]
+    return data
+
+
+def auth_headers(auth):
+    if not auth or auth.get("type") != "apikey":
+        return {}
+    fields = {item["key"]: item["value"] for item in auth.get("apikey", [])}
+    if fields.get("in", "header") != "header" or "key" not in fields:
+        return {}
+    return {fields["key"]: fields.get("value", "")}
+
+
+def load_collection(path, include_bad=False):
+    """Шаги и переменные коллекции. Папки *bad_requests пропускаются."""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+
+    variables = {
+        item["key"]: str(item.get("value", ""))
+        for item in collection.get("variable", [])
+    }
+    steps = []
+
+    def walk(items, folder, inherited_auth):
+        for item in items:
+            auth = item.get("auth") or inherited_auth
+            if "item" in item:
+                name = f"{folder}/{item['name']}" if folder else item["name"]
+                if not include_bad and "bad_request" in item["name"]:
+                    continue
+                walk(item["item"], name, auth)
+                continue
+
+            request = item["request"]
+            url = request["url"]
+            url = url["raw"] if isinstance(url, dict) else url
+            headers = {
+                header["key"]: header["value"]
+                for header in request.get("header", [])
+                if not header.get("disabled")
+            }
+            headers.update(auth_headers(request.get("auth") or inherited_auth))
+            body = request.get("body") or {}
+            test_lines = [
+                line
+                for event in item.get("event", [])
+                if event.get("listen") == "test"
+                for line in event["script"].get("exec", [])
+            ]
+            steps.append(
+                Step(
+                    folder=folder,
+                    name=item["name"],
+                    method=request["method"],
+                    url=url,
+                    headers=headers,
+                    body=(
+                        body.get("raw") if body.get("mode") == "raw" else None
+                    ),
+                    extractors=parse_extractors(test_lines),
+                )
+            )
+
+    walk(collection["item"], "", collection.get("auth"))
+    return steps, variables
+
+
+def endpoint(method, url):
+    """'GET /api/recipes/{id}/' — ключ для агрегирования по эндпоинтам."""
+    path = url.split("?", 1)[0]
+    path = re.sub(r"^https?://[^/]+", "", path)
+    return f"{method} {re.sub(r'/[0-9]+(?=/|$)', '/{id}', path)}"
+
+
+def tag_value(name, value, tag):
+    quoted = value.startswith('"') and value.endswith('"')
+    inner = value[1:-1] if quoted else value
+    if "@" in inner:
+        local, domain = inner.split("@", 1)
+        inner = f"{local}+{tag}@{domain}"
+    else:
+        inner = f"{inner}-{tag}"
+    return f'"{inner}"' if quoted else inner
+
+
+class ClientTransport:
+    """Запросы через django.test.Client — внутри процесса, без сети."""
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def send(self, method, url, headers, body):
+        extra = {
+            "HTTP_" + key.upper().replace("-", "_"): value
+            for key, value in headers.items()
+            if key.lower() != "content-type"
+        }
+        response = self.client.generic(
+            method,
+            url,
+            data=body or "",
+            content_type=headers.get("Content-Type", "application/json"),
+            **extra,
+        )
+        content = (
+            b"".join(response.streaming_content)
+            if response.streaming
+            else response.content
+        )
+        return response.status_code, content
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу (например gunicorn) по HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, method, url, headers, body):
+        request = Request(
+            self.base_url + url,
+            data=body.encode() if body else None,
+            headers={"Content-Type": "application/json", **headers},
+            method=method,
+        )
+        try:
+            with urlopen(request, timeout=60) as response:
+                return response.status, response.read()
+        except HTTPError as error:
+            return error.code, error.read()
+
+
+class VirtualUser:
+    def __init__(self, collections, transport, tag):
+        self.collections = collections
+        self.transport = transport
+        self.tag = tag
+        self.recipes = 0
+
+    def substitute(self, text, variables):
+        return VARIABLE.sub(
+            lambda m: variables.get(m.group(1), m.group(0)), text
+        )
+
+    def run(self):
+        """Проходит все шаги, возвращает [(эндпоинт, статус, мс)]."""
+        results = []
+        for steps, defaults in self.collections:
+            variables = {
+                name: (
+                    tag_value(name, value, self.tag)
+                    if UNIQUE_VARIABLE.search(name)
+                    and not name.startswith("tooLong")
+                    else value
+                )
+                for name, value in defaults.items()
+            }
+            variables["baseUrl"] = ""
+            for step in steps:
+                results.append(self.send(step, variables))
+        return results
+
+    def send(self, step, variables):
+        url = self.substitute(step.url, variables)
+        headers = {
+            key: self.substitute(value, variables)
+            for key, value in step.headers.items()
+        }
+        body = self.substitute(step.body, variables) if step.body else None
+        if (
+            body
+            and step.method in ("POST", "PUT", "PATCH")
+            and "/recipes/" in url
+        ):
+            body = self.tag_recipe_name(body)
+
+        started = time.perf_counter()
+        try:
+            status, content = self.transport.send(
+                step.method, url, headers, body
+            )
+        except Exception:  # сетевые ошибки считаем как отказ
+            status, content = 0, b""
+        elapsed = (time.perf_counter() - started) * 1000
+
+        if step.extractors and 200 <= status < 300:
+            try:
+                data = json.loads(content)
+            except ValueError:
+                data = None
+            for variable, path, bounds in step.extractors:
+                try:
+                    variables[variable] = str(extract(data, path, bounds))
+                except (LookupError, TypeError):
+                    pass
+        return endpoint(step.method, url), status, elapsed
+
+    def tag_recipe_name(self, body):
+        # Название рецепта уникально, а обе коллекции создают рецепты с
+        # одинаковыми названиями — метка пользователя плюс номер запроса
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if isinstance(data, dict) and isinstance(data.get("name"), str):
+            self.recipes += 1
+            data["name"] = f"{data['name']} {self.tag}-{self.recipes}"
+            return json.dumps(data, ensure_ascii=False)
+        return body
+
+
+def run_virtual_user(collections, base_url):
+    tag = uuid.uuid4().hex[:8]
+    if base_url:
+        return VirtualUser(collections, HttpTransport(base_url), tag).run()
+
+    from django.db import connections
+
+    try:
+        return VirtualUser(collections, ClientTransport(), tag).run()
+    finally:
+        # Каждый поток пула держит своё соединение с базой
+        connections.close_all()
+
+
+def replay(collections, users, concurrency, pool="thread", base_url=None):
+    """Прогоняет users виртуальных пользователей по concurrency одновременно.
+
+    Возвращает все замеры и общее время прогона в секундах.
+    """
+    if pool == "process":
+        from django.db import connections
+
+        # Дочерние процессы наследуют сокеты соединений — закрываем до fork
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+    else:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    started = time.perf_counter()
+    with executor:
+        futures = [
+            executor.submit(run_virtual_user, collections, base_url)
+            for _ in range(users)
+        ]
+        results = [item for future in futures for item in future.result()]
+    return results, time.perf_counter() - started
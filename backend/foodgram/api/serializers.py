@@ -1,9 +1,16 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 
+from posts import cart_totals
+from posts.cache import get_recipe_fragments, set_recipe_fragments
 from posts.models import Ingredient, Recipe, RecipeIngredient
 from users.models import User
 from .pagination import RecipePagination
 
+from foodgram import images
+from foodgram.db_router import primary
 from foodgram.common_classes import (
     Base64ImageField,
     min_cooking_time,
@@ -19,8 +26,28 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit")
 
 
+def image_sizes(field_file, context):
+    """Карта производных размеров изображения с абсолютными URL."""
+    sizes = images.size_urls(field_file.name if field_file else None)
+    request = context.get("request")
+    if sizes is None or request is None:
+        return sizes
+    return absolute_sizes(sizes, request)
+
+
+def absolute_sizes(sizes, request):
+    return {
+        size: {
+            ext: request.build_absolute_uri(url)
+            for ext, url in formats.items()
+        }
+        for size, formats in sizes.items()
+    }
+
+
 class AuthorGetSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_sizes = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -32,6 +59,7 @@ class AuthorGetSerializer(serializers.ModelSerializer):
             "last_name",
             "is_subscribed",
             "avatar",
+            "avatar_sizes",
         )
 
     def get_is_subscribed(self, obj):
@@ -40,6 +68,9 @@ class AuthorGetSerializer(serializers.ModelSerializer):
             return False
         return user.subscriptions.filter(author=obj).exists()
 
+    def get_avatar_sizes(self, obj):
+        return image_sizes(obj.avatar, self.context)
+
 
 class IngredientInRecipeReadSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source="ingredient.id")
@@ -51,6 +82,70 @@ class IngredientInRecipeReadSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+    avatar_sizes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = (
+            "email",
+            "id",
+            "username",
+            "first_name",
+            "last_name",
+            "avatar",
+            "avatar_sizes",
+        )
+
+    def get_avatar_sizes(self, obj):
+        # Во фрагменте относительные URL, абсолютными их делает overlay
+        return images.size_urls(obj.avatar.name)
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Часть рецепта, одинаковая для всех пользователей. Кэшируется."""
+
+    author = AuthorFragmentSerializer(read_only=True)
+    ingredients = IngredientInRecipeReadSerializer(
+        many=True, source="recipeingredient_set", read_only=True
+    )
+    image_sizes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            "id",
+            "author",
+            "ingredients",
+            "name",
+            "image",
+            "image_sizes",
+            "text",
+            "cooking_time",
+        )
+
+    def get_image_sizes(self, obj):
+        return images.size_urls(obj.image.name)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data)
+        fragments = get_recipe_fragments([recipe.pk for recipe in recipes])
+
+        missing = [
+            recipe.pk for recipe in recipes if recipe.pk not in fragments
+        ]
+        if missing:
+            fragments.update(self.child.build_fragments(missing))
+
+        return [
+            self.child.overlay(fragments[recipe.pk], recipe)
+            for recipe in recipes
+            if recipe.pk in fragments
+        ]
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -71,11 +166,88 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_sizes",
             "text",
             "cooking_time",
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        fragment = get_recipe_fragments([instance.pk]).get(instance.pk)
+        if fragment is None:
+            fragment = self.build_fragments([instance.pk])[instance.pk]
+        return self.overlay(fragment, instance)
+
+    @staticmethod
+    def build_fragments(recipe_ids):
+        """Собирает и кэширует фрагменты рецептов, которых нет в кэше."""
+        recipes = (
+            Recipe.objects.filter(id__in=recipe_ids)
+            .select_related("author")
+            .prefetch_related(
+                Prefetch(
+                    "recipeingredient_set",
+                    queryset=RecipeIngredient.objects.select_related(
+                        "ingredient"
+                    ),
+                )
+            )
+        )
+        # Фрагмент живёт в кэше до инвалидации: с отстающей реплики не берём
+        with primary():
+            fragments = {
+                recipe.pk: RecipeFragmentSerializer(recipe).data
+                for recipe in recipes
+            }
+        set_recipe_fragments(fragments)
+        return fragments
+
+    def overlay(self, fragment, instance):
+        """Накладывает на фрагмент флаги текущего пользователя."""
+        author = dict(fragment["author"])
+        author["is_subscribed"] = self.get_author_is_subscribed(instance)
+        author["avatar"] = self.absolute_url(author["avatar"])
+        author["avatar_sizes"] = self.absolute_sizes(author["avatar_sizes"])
+
+        data = dict(fragment)
+        data["author"] = {
+            field: author[field] for field in AuthorGetSerializer.Meta.fields
+        }
+        data["image"] = self.absolute_url(data["image"])
+        data["image_sizes"] = self.absolute_sizes(data["image_sizes"])
+        data["is_favorited"] = self.get_is_favorited(instance)
+        data["is_in_shopping_cart"] = self.get_is_in_shopping_cart(instance)
+        return {field: data[field] for field in self.Meta.fields}
+
+    def absolute_url(self, url):
+        request = self.context.get("request")
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def absolute_sizes(self, sizes):
+        request = self.context.get("request")
+        if sizes and request is not None:
+            return absolute_sizes(sizes, request)
+        return sizes
+
+    def get_author_is_subscribed(self, obj):
+        annotated = getattr(obj, "author_is_subscribed", None)
+        if annotated is not None:
+            return annotated
+
+        user = self.context["request"].user
+
+        if not user.is_authenticated:
+            return False
+
+        return user.subscriptions.filter(author_id=obj.author_id).exists()
 
     def get_is_favorited(self, obj):
+        annotated = getattr(obj, "is_favorited", None)
+        if annotated is not None:
+            return annotated
+
         user = self.context["request"].user
 
         if not user.is_authenticated:
@@ -84,6 +256,10 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         return obj.favorited_by.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        annotated = getattr(obj, "is_in_shopping_cart", None)
+        if annotated is not None:
+            return annotated
+
         user = self.context["request"].user
 
         if not user.is_authenticated:
@@ -158,6 +334,7 @@ class RecipePostSerializer(serializers.ModelSerializer):
         # Создаем все связи одним запросом
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("recipeingredient_set")
 
@@ -170,9 +347,13 @@ class RecipePostSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
 
         self._create_recipe_ingredients(recipe, ingredients)
+        images.schedule_processing(recipe, "image")
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        # Рецепт и его ингредиенты сохраняются вместе, после коммита
+        # сигнал публикует изменение в индекс ингредиентов
         ingredients = validated_data.pop("recipeingredient_set", None)
 
         if ingredients is not None:
@@ -182,13 +363,21 @@ class RecipePostSerializer(serializers.ModelSerializer):
             self._validate_unique_ingredient_ids(ingredients)
 
             # Пересоздание списка ингредиентов
+            old_amounts = cart_totals.recipe_amounts(instance.pk)
             instance.recipeingredient_set.all().delete()
             self._create_recipe_ingredients(instance, ingredients)
+            cart_totals.recipe_changed(
+                instance.pk,
+                old_amounts,
+                {ing["id"]: ing["amount"] for ing in ingredients},
+            )
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         instance.save()
+        if "image" in validated_data:
+            images.schedule_processing(instance, "image")
         return instance
 
     def validate_name(self, value):
@@ -207,14 +396,18 @@ class RecipePostSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeInfoSerializer(serializers.ModelSerializer):
+    image_sizes = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_sizes", "cooking_time")
+
+    def get_image_sizes(self, obj):
+        return image_sizes(obj.image, self.context)
 
 
 class SubscribtionsSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source="recipes.count", read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -235,13 +428,18 @@ class SubscribtionsSerializer(serializers.ModelSerializer):
         return True
 
     def get_recipes(self, obj):
-        request = self.context["request"]
-        limit = request.query_params.get("recipes_limit")
+        # Подготовлено во вьюсете одним оконным запросом на всю страницу
+        recipes_by_author = self.context.get("recipes_by_author")
+        if recipes_by_author is not None:
+            queryset = recipes_by_author.get(obj.id, [])
+        else:
+            request = self.context["request"]
+            limit = request.query_params.get("recipes_limit")
 
-        queryset = obj.recipes.all()
+            queryset = obj.recipes.all()
 
-        if limit and limit.isdigit():
-            queryset = queryset[: int(limit)]
+            if limit and limit.isdigit():
+                queryset = queryset[: int(limit)]
 
         serializer = ShortRecipeInfoSerializer(
             queryset, many=True, context=self.context
@@ -278,7 +476,6 @@ class UserCreateSerializer(serializers.ModelSerializer):
 class UserOutputSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -303,12 +500,17 @@ class UserOutputSerializer(serializers.ModelSerializer):
         return user.subscriptions.filter(author=obj).exists()
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()  # Вместо Recipe.objects.filter(author=obj)
-        request = self.context["request"]
-        limit = request.query_params.get("recipes_limit")
-
-        if limit and limit.isdigit():
-            recipes = recipes[: int(limit)]
+        recipes_by_author = self.context.get("recipes_by_author")
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.id, [])
+        else:
+            # Вместо Recipe.objects.filter(author=obj)
+            recipes = obj.recipes.all()
+            request = self.context["request"]
+            limit = request.query_params.get("recipes_limit")
+
+            if limit and limit.isdigit():
+                recipes = recipes[: int(limit)]
         return [
             {
                 "id": recipe.id,
@@ -319,8 +521,15 @@ class UserOutputSerializer(serializers.ModelSerializer):
             for recipe in recipes
         ]
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()  # Вместо Recipe.objects.filter(author=obj).count()
+
+class IdListSerializer(serializers.Serializer):
+    """Список id для пакетных избранного, корзины и подписок."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_MAX_IDS,
+    )
 
 
 class UserSetPasswordSerializer(serializers.Serializer):
@@ -339,3 +548,8 @@ class UserAvatarSerializer(serializers.ModelSerializer):
         if value is None:
             raise serializers.ValidationError("avatar cannot be null")
         return value
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        images.schedule_processing(instance, "avatar")
+        return instance
@@ -0,0 +1,174 @@
+"""Потоковая выгрузка списка покупок в txt, csv, json и pdf.
+
+Каждый формат — генератор байтовых кусков поверх итератора строк
+(название, единица измерения, количество), отсортированных по единице
+измерения и названию. Текстовые форматы держат в памяти не больше
+одной страницы.
+
+PDF собирается fpdf2 по страницам и отдаётся одним куском: ссылки на
+страницы и подмножество шрифта известны только после последней страницы.
+Он текстовый: встраивается подмножество шрифта TrueType
+(SHOPPING_LIST_PDF_FONT) с использованными глифами, так что текст ищется
+и копируется.
+"""
+import csv
+import io
+import json
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from fpdf import FPDF
+from rest_framework.renderers import BaseRenderer
+
+# Страница A4, размеры в пунктах
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 56
+FONT_SIZE = 12
+LINE_HEIGHT = 18
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT
+PDF_FONT_FAMILY = "shopping-list"
+
+
+def text_lines(rows):
+    """Строки списка, группы единиц измерения разделены пустой строкой."""
+    first = True
+    for _, group in groupby(rows, key=itemgetter(1)):
+        if not first:
+            yield ""
+        first = False
+        for name, unit, amount in group:
+            yield f"{name} ({unit}) — {amount}"
+
+
+def render_txt(rows):
+    for line in text_lines(rows):
+        yield f"{line}\n".encode()
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("name", "measurement_unit", "amount"))
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 8192:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def render_json(rows):
+    separator = b"["
+    for name, unit, amount in rows:
+        item = {"name": name, "measurement_unit": unit, "amount": amount}
+        yield separator + json.dumps(item, ensure_ascii=False).encode()
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def pdf_document(font_path):
+    """Пустой документ fpdf2 A4 со шрифтом списка покупок."""
+    pdf = FPDF(unit="pt", format=(PAGE_WIDTH, PAGE_HEIGHT))
+    pdf.set_auto_page_break(False)
+    pdf.add_font(PDF_FONT_FAMILY, fname=font_path)
+    pdf.set_font(PDF_FONT_FAMILY, size=FONT_SIZE)
+    return pdf
+
+
+@lru_cache(maxsize=1)
+def pdf_font():
+    """Путь к шрифту для PDF, проверенный пробным документом.
+
+    fontTools на повреждённом файле падает с чем угодно (TTLibError,
+    KeyError, AssertionError, struct.error...), причём часть ошибок
+    всплывает только при сборке подмножества. Поэтому шрифт один раз
+    проверяется целиком, а не по типу исключения.
+    """
+    path = settings.SHOPPING_LIST_PDF_FONT
+    try:
+        pdf = pdf_document(path)
+        pdf.add_page()
+        pdf.text(MARGIN, MARGIN, "Список покупок (г) — 0123456789")
+        pdf.output()
+    except Exception as error:
+        # Без шрифта кириллица в PDF не выводится: лучше ошибка,
+        # чем пустой файл
+        raise ImproperlyConfigured(
+            f"Шрифт для PDF недоступен ({error!r}). Установите "
+            "fonts-dejavu-core или укажите TrueType-шрифт "
+            "в SHOPPING_LIST_PDF_FONT"
+        )
+    return path
+
+
+def render_pdf(rows):
+    """PDF по страницам; собирается до начала ответа.
+
+    fpdf2 всё равно держит документ в памяти до output(), так что ошибка
+    даёт обычный ответ 500, а не оборванный файл.
+    """
+    pdf = pdf_document(pdf_font())
+
+    def page(lines):
+        pdf.add_page()
+        baseline = MARGIN + FONT_SIZE
+        for line in lines:
+            if line:
+                pdf.text(MARGIN, baseline, line)
+            baseline += LINE_HEIGHT
+
+    lines = ["Список покупок", ""]
+    for line in text_lines(rows):
+        lines.append(line)
+        if len(lines) == LINES_PER_PAGE:
+            page(lines)
+            lines = []
+    if lines or not pdf.pages:
+        page(lines)
+    return [bytes(pdf.output())]
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Формат выгрузки для согласования контента DRF (?format= или Accept).
+
+    Сам список отдаётся StreamingHttpResponse, рендерер используется только
+    для ответов с ошибками.
+    """
+
+    charset = "utf-8"
+    stream = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class TxtRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    stream = staticmethod(render_txt)
+
+
+class CsvRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    stream = staticmethod(render_csv)
+
+
+class JsonRenderer(ShoppingListRenderer):
+    media_type = "application/json"
+    format = "json"
+    stream = staticmethod(render_json)
+
+
+class PdfRenderer(ShoppingListRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    stream = staticmethod(render_pdf)
+
+
+SHOPPING_LIST_RENDERERS = [TxtRenderer, CsvRenderer, JsonRenderer, PdfRenderer]
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import logging
+import re
+import time
+import zlib
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection, connections, transaction
+from django.test import (
+    AsyncClient,
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from fontTools.ttLib import TTFont
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+
+from api import async_views, postman_replay, shopping_list
+from api.views import RecipesViewSet
+from foodgram import db_router, images, metrics
+from posts import cart_totals, ingredient_index, relations
+from posts.cache import recipe_fragment_key
+from posts.models import (
+    Favourite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    TimelineEntry,
+)
+from users.models import Subscription, User
+
+
+def make_user(number):
+    return User.objects.create_user(
+        username=f"user{number}",
+        email=f"user{number}@example.com",
+        first_name="Имя",
+        last_name="Фамилия",
+        password="password-123",
+    )
+
+
+def make_recipe(author, ingredients, number):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=f"Рецепт {number}",
+        text="Описание",
+        cooking_time=10,
+        image="recipes/images/test.png",
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, ingredient=ingredient, amount=number + 1
+        )
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content[:300])
+        return len(queries), response
+
+
+class RecipeQueryBudgetTests(APITestCase):
+    """Число запросов списка и страницы рецепта не зависит от их числа."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = make_user(1)
+        self.reader = make_user(2)
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(3)
+        ]
+        Subscription.objects.create(subscriber=self.reader, author=self.author)
+
+    def add_recipes(self, count):
+        recipes = [
+            make_recipe(self.author, self.ingredients, number)
+            for number in range(
+                Recipe.objects.count(), Recipe.objects.count() + count
+            )
+        ]
+        for recipe in recipes[::2]:
+            Favourite.objects.create(user=self.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        return recipes
+
+    def list_queries(self, client, limit):
+        cache.clear()
+        cold, response = self.count_queries(
+            client, f"/api/recipes/?limit={limit}"
+        )
+        self.assertEqual(len(response.data["results"]), limit)
+        warm, _ = self.count_queries(client, f"/api/recipes/?limit={limit}")
+        return cold, warm
+
+    def test_list_anonymous(self):
+        self.add_recipes(2)
+        small = self.list_queries(self.anon, 2)
+        self.add_recipes(8)
+        self.assertEqual(self.list_queries(self.anon, 10), small)
+        # COUNT + страница; на холодном кэше ещё рецепты с авторами
+        # и ингредиенты
+        self.assertEqual(small, (4, 2))
+
+    def test_list_authenticated(self):
+        client = self.client_for(self.reader)
+        self.add_recipes(2)
+        small = self.list_queries(client, 2)
+        self.add_recipes(8)
+        self.assertEqual(self.list_queries(client, 10), small)
+        # Флаги избранного, корзины и подписки — подзапросами в той же странице
+        self.assertEqual(small, (4, 2))
+
+    def test_list_flags(self):
+        recipes = self.add_recipes(4)
+        _, response = self.count_queries(
+            self.client_for(self.reader), "/api/recipes/?limit=4"
+        )
+        flags = {
+            item["id"]: (
+                item["is_favorited"],
+                item["is_in_shopping_cart"],
+                item["author"]["is_subscribed"],
+            )
+            for item in response.data["results"]
+        }
+        favorited = {recipe.pk for recipe in recipes[::2]}
+        for recipe in recipes:
+            in_lists = recipe.pk in favorited
+            self.assertEqual(flags[recipe.pk], (in_lists, in_lists, True))
+
+    def test_detail(self):
+        recipe = self.add_recipes(1)[0]
+        url = f"/api/recipes/{recipe.pk}/"
+        for client in (self.anon, self.client_for(self.reader)):
+            cache.clear()
+            cold, response = self.count_queries(client, url)
+            self.assertEqual(len(response.data["ingredients"]), 3)
+            warm, _ = self.count_queries(client, url)
+            self.assertEqual((cold, warm), (3, 1))
+
+
+class RecipeFragmentCacheTests(APITestCase):
+    """Любое изменение данных фрагмента сбрасывает его из кэша."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = make_user(1)
+        self.flour = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        self.recipe = make_recipe(self.author, [self.flour], 1)
+        self.url = f"/api/recipes/{self.recipe.pk}/"
+
+    def cached(self):
+        return cache.get(recipe_fragment_key(self.recipe.pk))
+
+    def detail(self):
+        _, response = self.count_queries(self.anon, self.url)
+        self.assertIsNotNone(self.cached())
+        return response.data
+
+    def test_recipe_update(self):
+        self.detail()
+        response = self.client_for(self.author).patch(
+            self.url,
+            {
+                "name": "Новое имя",
+                "ingredients": [{"id": self.flour.pk, "amount": 5}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        # Ответ на PATCH уже собран из нового фрагмента
+        self.assertEqual(self.cached()["name"], "Новое имя")
+        data = self.detail()
+        self.assertEqual(data["name"], "Новое имя")
+        self.assertEqual(data["ingredients"][0]["amount"], 5)
+
+    def test_ingredient_rename(self):
+        self.detail()
+        self.flour.name = "мука пшеничная"
+        self.flour.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(
+            self.detail()["ingredients"][0]["name"], "мука пшеничная"
+        )
+
+    def test_author_change(self):
+        self.detail()
+        # Счётчики во фрагмент не входят: кэш остаётся
+        relations.subscribe(make_user(2).pk, [self.author.pk])
+        self.assertIsNotNone(self.cached())
+        self.author.first_name = "Другое"
+        self.author.save(update_fields=["first_name"])
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.detail()["author"]["first_name"], "Другое")
+
+    def test_recipe_delete(self):
+        self.detail()
+        self.recipe.delete()
+        self.assertIsNone(self.cached())
+
+    def test_refill_before_commit(self):
+        self.detail()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = "Новое имя"
+            self.recipe.save()
+            self.assertIsNone(self.cached())
+            # Параллельный читатель успел собрать фрагмент до коммита
+            self.detail()
+        self.assertIsNone(self.cached())
+
+    def test_user_flags_are_not_cached(self):
+        reader = make_user(2)
+        self.detail()
+        relations.add_favorites(reader.pk, [self.recipe.pk])
+        _, response = self.count_queries(self.client_for(reader), self.url)
+        self.assertTrue(response.data["is_favorited"])
+        self.assertFalse(self.detail()["is_favorited"])
+
+
+class RecipeCursorPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        author = make_user(1)
+        recipes = [make_recipe(author, [], number) for number in range(7)]
+        # Одинаковые pub_date: порядок внутри них задаёт id
+        base = timezone.now()
+        for number, recipe in enumerate(recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=base - timedelta(days=number // 2)
+            )
+        self.expected = list(
+            Recipe.objects.order_by("-pub_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            queries, response = self.count_queries(self.anon, url)
+            self.assertNotIn("count", response.data)
+            pages.append([item["id"] for item in response.data["results"]])
+            url = response.data[link]
+        return pages, queries
+
+    def test_forward_and_back(self):
+        pages, queries = self.walk("/api/recipes/?cursor&limit=3", "next")
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        # Без COUNT(*): страница и фрагменты на холодном кэше
+        self.assertLessEqual(queries, 3)
+
+        _, response = self.count_queries(
+            self.anon, "/api/recipes/?cursor&limit=3"
+        )
+        _, response = self.count_queries(self.anon, response.data["next"])
+        _, last = self.count_queries(self.anon, response.data["next"])
+        back, _ = self.walk(last.data["previous"], "previous")
+        self.assertEqual(back, [self.expected[3:6], self.expected[:3]])
+
+    def test_page_mode_unchanged(self):
+        _, response = self.count_queries(
+            self.anon, "/api/recipes/?limit=3&page=3"
+        )
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            self.expected[6:],
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ("garbage", "eyJkIjoxfQ"):
+            response = self.anon.get(f"/api/recipes/?cursor={cursor}")
+            self.assertEqual(response.status_code, 404)
+
+
+class RecipeSearchTests(APITestCase):
+    """Поиск по названию и описанию (на SQLite — через icontains)."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = make_user(1)
+        self.other = make_user(2)
+        self.pancakes = make_recipe(self.author, [], 1)
+        # LIKE в SQLite не различает регистр только у латиницы
+        Recipe.objects.filter(pk=self.pancakes.pk).update(name="блины")
+        self.soup = make_recipe(self.other, [], 2)
+        Recipe.objects.filter(pk=self.soup.pk).update(text="Суп с блинами")
+        make_recipe(self.author, [], 3)
+
+    def ids(self, url):
+        _, response = self.count_queries(self.anon, f"{url}&limit=10")
+        return {item["id"] for item in response.data["results"]}
+
+    def test_search(self):
+        self.assertEqual(
+            self.ids("/api/recipes/?search=блин"),
+            {self.pancakes.pk, self.soup.pk},
+        )
+        self.assertEqual(
+            self.ids(f"/api/recipes/?search=блин&author={self.author.pk}"),
+            {self.pancakes.pk},
+        )
+        self.assertEqual(self.ids("/api/recipes/?search=пицца"), set())
+        self.assertEqual(len(self.ids("/api/recipes/?search=")), 3)
+
+    def test_search_with_cursor(self):
+        _, response = self.count_queries(
+            self.anon, "/api/recipes/?search=блин&cursor&limit=1"
+        )
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+
+
+class SubscriptionsQueryBudgetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user(0)
+        ingredient = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        self.authors = []
+        for number in range(1, 7):
+            author = make_user(number)
+            for recipe_number in range(number):
+                make_recipe(author, [ingredient], recipe_number)
+            Subscription.objects.create(subscriber=self.reader, author=author)
+            self.authors.append(author)
+        self.client = self.client_for(self.reader)
+
+    def test_constant_queries(self):
+        counts = set()
+        for limit in (1, 3, 6):
+            for recipes_limit in ("", 1, 3, 10):
+                url = (
+                    f"/api/users/subscriptions/?limit={limit}"
+                    f"&recipes_limit={recipes_limit}"
+                )
+                queries, response = self.count_queries(self.client, url)
+                counts.add(queries)
+                self.assertEqual(len(response.data["results"]), limit)
+                for item in response.data["results"]:
+                    total = item["recipes_count"]
+                    expected = (
+                        min(total, recipes_limit) if recipes_limit else total
+                    )
+                    self.assertEqual(len(item["recipes"]), expected)
+        # Страница подписок, COUNT и превью рецептов одним оконным запросом
+        self.assertEqual(counts, {3})
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=1)
+class FeedTests(APITestCase):
+    """Лента: рассылка обычных авторов и подмешивание «звёздных»."""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user(1)
+        self.author = make_user(2)
+        self.celebrity = make_user(3)
+        self.stranger = make_user(4)
+        make_recipe(self.author, [], 1)
+        make_recipe(self.celebrity, [], 2)
+        make_recipe(self.stranger, [], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            relations.subscribe(make_user(5).pk, [self.celebrity.pk])
+            relations.subscribe(
+                self.reader.pk, [self.author.pk, self.celebrity.pk]
+            )
+            self.new = make_recipe(self.author, [], 4)
+            make_recipe(self.celebrity, [], 5)
+        self.client = self.client_for(self.reader)
+
+    def walk(self):
+        recipe_ids, url = [], "/api/recipes/feed/?limit=2"
+        while url:
+            _, response = self.count_queries(self.client, url)
+            recipe_ids += [item["id"] for item in response.data["results"]]
+            url = response.data["next"]
+        return recipe_ids
+
+    def expected(self, *authors):
+        return list(
+            Recipe.objects.filter(author__in=authors)
+            .order_by("-pub_date", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def test_feed(self):
+        # Старый рецепт попал в ленту при подписке, новый — рассылкой
+        self.assertEqual(
+            set(
+                TimelineEntry.objects.filter(user=self.reader).values_list(
+                    "recipe__author", flat=True
+                )
+            ),
+            {self.author.pk},
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.reader, recipe=self.new
+            ).exists()
+        )
+        self.assertEqual(
+            self.walk(), self.expected(self.author, self.celebrity)
+        )
+
+    def test_unsubscribe(self):
+        relations.unsubscribe(self.reader.pk, [self.author.pk])
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists()
+        )
+        self.assertEqual(self.walk(), self.expected(self.celebrity))
+        relations.unsubscribe(self.reader.pk, [self.celebrity.pk])
+        self.assertEqual(self.walk(), [])
+
+    def test_anonymous(self):
+        response = self.anon.get("/api/recipes/feed/")
+        self.assertEqual(response.status_code, 401)
+
+
+class BulkEndpointsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user(1)
+        self.reader = make_user(2)
+        self.client = self.client_for(self.reader)
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        self.ids = [
+            make_recipe(self.author, [flour], number).pk for number in range(3)
+        ]
+
+    def test_favorite_and_cart(self):
+        for url in ("/api/recipes/favorite/", "/api/recipes/shopping_cart/"):
+            response = self.client.post(
+                url, {"ids": self.ids[:2]}, format="json"
+            )
+            self.assertEqual(response.data, {"added": self.ids[:2]})
+            response = self.client.post(url, {"ids": self.ids}, format="json")
+            self.assertEqual(response.data, {"added": self.ids[2:]})
+            response = self.client.post(url, {"ids": [10**6]}, format="json")
+            self.assertEqual(response.status_code, 400)
+            response = self.client.delete(
+                url, {"ids": self.ids[1:]}, format="json"
+            )
+            self.assertEqual(response.data, {"removed": self.ids[1:]})
+        self.assertEqual(
+            Recipe.objects.filter(pk=self.ids[0]).values_list(
+                "favorites_count", "in_carts_count"
+            )[0],
+            (1, 1),
+        )
+
+    def test_subscribe(self):
+        url = "/api/users/subscribe/"
+        ids = [self.author.pk]
+        self.assertEqual(
+            self.client.post(url, {"ids": ids}, format="json").data,
+            {"added": ids},
+        )
+        self.assertEqual(
+            self.client.post(url, {"ids": ids}, format="json").data,
+            {"added": []},
+        )
+        response = self.client.post(
+            url, {"ids": [self.reader.pk]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(
+            self.client.delete(url, {"ids": ids}, format="json").data,
+            {"removed": ids},
+        )
+
+
+def jpeg_data_uri(size=(300, 200)):
+    """JPEG с EXIF-поворотом на 90°, как с телефона."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    output = io.BytesIO()
+    Image.new("RGB", size, "red").save(output, format="JPEG", exif=exif)
+    return (
+        "data:image/jpeg;base64,"
+        + base64.b64encode(output.getvalue()).decode()
+    )
+
+
+class CartTotalsTests(APITestCase):
+    """Правка и удаление рецепта переносятся в суммы корзин."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = make_user(1)
+        self.readers = [make_user(2), make_user(3)]
+        self.flour = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        self.milk = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+        self.recipe = make_recipe(self.author, [self.flour, self.milk], 1)
+        other = make_recipe(self.author, [self.flour], 2)
+        for reader in self.readers:
+            relations.add_to_cart(reader.pk, [self.recipe.pk])
+        relations.add_to_cart(self.readers[1].pk, [other.pk])
+
+    def totals(self):
+        return {
+            reader.pk: dict(
+                ShoppingCartIngredient.objects.filter(user=reader).values_list(
+                    "ingredient__name", "total_amount"
+                )
+            )
+            for reader in self.readers
+        }
+
+    def test_recipe_update(self):
+        response = self.client_for(self.author).patch(
+            f"/api/recipes/{self.recipe.pk}/",
+            {"ingredients": [{"id": self.flour.pk, "amount": 10}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        first, second = self.readers
+        self.assertEqual(
+            self.totals(),
+            {first.pk: {"мука": 10}, second.pk: {"мука": 13}},
+        )
+
+    def test_recipe_delete(self):
+        response = self.client_for(self.author).delete(
+            f"/api/recipes/{self.recipe.pk}/"
+        )
+        self.assertEqual(response.status_code, 204)
+        first, second = self.readers
+        self.assertEqual(self.totals(), {first.pk: {}, second.pk: {"мука": 3}})
+
+
+class ImageUploadTests(APITestCase):
+    """URL изображения в ответе постоянный: файл уже лежит по хешу."""
+
+    def setUp(self):
+        super().setUp()
+        images._ready.clear()
+        self.user = make_user(1)
+        self.client = self.client_for(self.user)
+        self.ingredient = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+
+    def stored_name(self, url):
+        name = url.split(settings.MEDIA_URL, 1)[1]
+        self.assertTrue(images.is_content_addressed(name), name)
+        self.assertTrue(default_storage.exists(name))
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertNotIn(0x0112, image.getexif())
+        return name
+
+    def test_recipe_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/recipes/",
+                {
+                    "ingredients": [{"id": self.ingredient.pk, "amount": 10}],
+                    "image": jpeg_data_uri(),
+                    "name": "Блины",
+                    "text": "Описание",
+                    "cooking_time": 10,
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        name = self.stored_name(response.data["image"])
+        # Производные строятся после ответа
+        self.assertIsNone(response.data["image_sizes"])
+        self.assertEqual(Recipe.objects.get().image.name, name)
+        self.assertEqual(
+            sorted(default_storage.listdir("recipes/images")[1]),
+            [name.split("/")[-1]],
+        )
+
+        response = self.client.get(f"/api/recipes/{response.data['id']}/")
+        self.assertTrue(response.data["image"].endswith(name))
+        card = response.data["image_sizes"]["card"]["webp"]
+        self.assertTrue(
+            default_storage.exists(card.split(settings.MEDIA_URL, 1)[1])
+        )
+
+    def test_avatar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                "/api/users/me/avatar/",
+                {"avatar": jpeg_data_uri()},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        name = self.stored_name(response.data["avatar"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, name)
+        self.assertIsNotNone(images.size_urls(name))
+
+    def test_broken_image(self):
+        data = (
+            "data:image/png;base64,"
+            + base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64).decode()
+        )
+        response = self.client.put(
+            "/api/users/me/avatar/", {"avatar": data}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_broken_body_is_discarded_in_background(self):
+        # Заголовок цел, поэтому в запросе загрузка принимается
+        output = io.BytesIO()
+        Image.new("RGB", (300, 200), "red").save(output, format="PNG")
+        content = bytearray(output.getvalue())
+        content[-40] ^= 0xFF
+        data = "data:image/png;base64," + base64.b64encode(content).decode()
+        with self.assertLogs("foodgram.images", "WARNING"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(
+                    "/api/users/me/avatar/", {"avatar": data}, format="json"
+                )
+        self.assertEqual(response.status_code, 200, response.data)
+        name = response.data["avatar"].split(settings.MEDIA_URL, 1)[1]
+        self.assertFalse(default_storage.exists(name))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_invalid_request_writes_nothing(self):
+        def files():
+            if not default_storage.exists("recipes/images"):
+                return set()
+            return set(default_storage.listdir("recipes/images")[1])
+
+        before = files()
+        response = self.client.post(
+            "/api/recipes/",
+            {
+                "ingredients": [],
+                "image": jpeg_data_uri(),
+                "name": "Блины",
+                "text": "Описание",
+                "cooking_time": 10,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(files(), before)
+
+    def test_same_upload_is_stored_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.put(
+                "/api/users/me/avatar/",
+                {"avatar": jpeg_data_uri()},
+                format="json",
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.put(
+                "/api/users/me/avatar/",
+                {"avatar": jpeg_data_uri()},
+                format="json",
+            )
+        self.assertEqual(first.data["avatar"], second.data["avatar"])
+        self.stored_name(second.data["avatar"])
+
+    def test_decode_data_uri(self):
+        data = jpeg_data_uri()
+        upload = images.decode_data_uri(data)
+        self.assertTrue(upload.name.endswith(".jpg"))
+        self.assertEqual(
+            upload.read(), base64.b64decode(data.split(",", 1)[1])
+        )
+        upload.close()
+
+        bmp = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(bmp, format="BMP")
+        invalid = [
+            "картинка",
+            "data:image/png;base64,abc",
+            "data:image/png;base64,ab!=",
+            "data:image/png;base64,"
+            + base64.b64encode(b"text" * 100).decode(),
+            "data:image/bmp;base64,"
+            + base64.b64encode(bmp.getvalue()).decode(),
+        ]
+        for value in invalid:
+            with self.assertRaises(images.ImageUploadError, msg=value[:30]):
+                images.decode_data_uri(value)
+
+        with override_settings(IMAGE_UPLOAD_MAX_BYTES=100):
+            with self.assertRaisesMessage(images.ImageUploadError, "100 байт"):
+                images.decode_data_uri(data)
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=300 * 200 - 1):
+            with self.assertRaisesMessage(images.ImageUploadError, "300×200"):
+                images.decode_data_uri(data)
+
+
+class ShoppingListTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user(1)
+        self.client = self.client_for(self.user)
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        eggs = Ingredient.objects.create(name="яйца", measurement_unit="шт")
+        for number, ingredients in enumerate(([flour, eggs], [flour])):
+            recipe = make_recipe(self.user, ingredients, number)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+            cart_totals.add_recipes(self.user.pk, [recipe.pk])
+
+    def download(self, file_format):
+        response = self.client.get(
+            f"/api/recipes/download_shopping_cart/?format={file_format}"
+        )
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_text_formats(self):
+        self.assertEqual(
+            self.download("txt").decode(), "мука (г) — 3\n\nяйца (шт) — 1\n"
+        )
+        self.assertEqual(
+            json.loads(self.download("json")),
+            [
+                {"name": "мука", "measurement_unit": "г", "amount": 3},
+                {"name": "яйца", "measurement_unit": "шт", "amount": 1},
+            ],
+        )
+        self.assertEqual(
+            self.download("csv").decode().splitlines()[1:],
+            ["мука,г,3", "яйца,шт,1"],
+        )
+
+    def pdf_streams(self, pdf):
+        """Содержимое потоков PDF по порядку, сжатые — распакованные."""
+        streams = []
+        for match in re.finditer(rb"<<(.*?)>>\s*stream\r?\n", pdf, re.S):
+            start = match.end()
+            body = pdf[start:pdf.index(b"endstream", start)].rstrip(b"\r\n")
+            if b"/FlateDecode" in match.group(1):
+                body = zlib.decompress(body)
+            streams.append((match.group(1), body))
+        return streams
+
+    def test_pdf_is_text_with_embedded_font(self):
+        pdf = self.download("pdf")
+        self.assertTrue(pdf.startswith(b"%PDF-"))
+        self.assertTrue(pdf.rstrip().endswith(b"%%EOF"))
+        self.assertNotIn(b"/Subtype /Image", pdf)
+        self.assertIn(b"/FontFile2", pdf)
+        streams = self.pdf_streams(pdf)
+        # Обратное отображение глифов в Юникод: текст копируется и ищется
+        to_unicode = b"".join(
+            body for _, body in streams if b"beginbfchar" in body
+        )
+        for char in "мука (г) — 3":
+            self.assertIn(b"<%04X>" % ord(char), to_unicode, char)
+
+        # Встроенное подмножество рисует текст так же, как исходный шрифт
+        embedded = next(body for head, body in streams if b"/Length1" in head)
+
+        def draw(font_file):
+            image = Image.new("L", (400, 40), 255)
+            ImageDraw.Draw(image).text(
+                (0, 0), "мука (г) — 3", font=ImageFont.truetype(font_file, 24)
+            )
+            return image.tobytes()
+
+        self.assertEqual(
+            draw(io.BytesIO(embedded)), draw(settings.SHOPPING_LIST_PDF_FONT)
+        )
+
+    def test_pdf_pages(self):
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number:03}", measurement_unit="г")
+            for number in range(100)
+        )
+        recipe = make_recipe(self.user, ingredients, 10)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        cart_totals.add_recipes(self.user.pk, [recipe.pk])
+        # Заголовок, пустая строка, 101 строка граммов, пустая, 1 штук
+        lines = 2 + 101 + 2
+        pages = -(-lines // shopping_list.LINES_PER_PAGE)
+        self.assertIn(b"/Count %d" % pages, self.download("pdf"))
+
+    def test_pdf_missing_glyph(self):
+        # U+0378 не назначен в Юникоде: глифа нет ни в одном шрифте
+        Ingredient.objects.filter(name="мука").update(name="мука\u0378")
+        with self.assertLogs("fpdf", level="WARNING"):
+            pdf = self.download("pdf")
+        to_unicode = b"".join(
+            body for _, body in self.pdf_streams(pdf) if b"bfchar" in body
+        )
+        self.assertIn(b"<%04X>" % ord("м"), to_unicode)
+        self.assertNotIn(b"<0378>", to_unicode)
+
+    def test_broken_font_fails_loudly(self):
+        """Обрезанные и испорченные шрифты: ошибка настройки или PDF."""
+        source = Path(settings.SHOPPING_LIST_PDF_FONT).read_bytes()
+        # Заголовок и каталог таблиц, cmap, glyf/loca — во всём файле
+        random = Random(10)
+        broken = [b"", b"\x00\x01\x00\x00" + b"\xff" * 100]
+        broken += [source[:size] for size in (12, 300, len(source) // 2)]
+        for area in (400, len(source)):
+            data = bytearray(source)
+            for _ in range(30):
+                data[random.randrange(12, area)] = random.randrange(256)
+            broken.append(bytes(data))
+        # Целый файл без таблицы символ -> глиф
+        font = TTFont(settings.SHOPPING_LIST_PDF_FONT)
+        del font["cmap"]
+        without_cmap = io.BytesIO()
+        font.save(without_cmap)
+        broken.append(without_cmap.getvalue())
+
+        directory = Path(settings.MEDIA_ROOT)
+        shopping_list.pdf_font.cache_clear()
+        self.addCleanup(shopping_list.pdf_font.cache_clear)
+        # Предупреждения fontTools о повреждённых таблицах здесь ожидаемы
+        logger = logging.getLogger("fontTools")
+        self.addCleanup(setattr, logger, "disabled", logger.disabled)
+        logger.disabled = True
+        for number, data in enumerate(broken):
+            path = directory / f"broken-{number}.ttf"
+            path.write_bytes(data)
+            self.addCleanup(path.unlink)
+            shopping_list.pdf_font.cache_clear()
+            with self.subTest(number=number), override_settings(
+                SHOPPING_LIST_PDF_FONT=str(path)
+            ):
+                try:
+                    shopping_list.pdf_font()
+                except ImproperlyConfigured:
+                    continue
+                self.assertTrue(self.download("pdf").startswith(b"%PDF-"))
+
+    def test_missing_font_fails_loudly(self):
+        shopping_list.pdf_font.cache_clear()
+        self.addCleanup(shopping_list.pdf_font.cache_clear)
+        with override_settings(SHOPPING_LIST_PDF_FONT="/nonexistent/font.ttf"):
+            with self.assertRaises(ImproperlyConfigured):
+                self.client.get(
+                    "/api/recipes/download_shopping_cart/?format=pdf"
+                )
+
+
+class AsyncReadViewsTests(APITestCase):
+    """Async-вью отвечают так же, как вьюсеты DRF."""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.author = make_user(1)
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("мука", "мёд", "масло", "соль")
+        ]
+        self.recipes = [
+            make_recipe(self.author, ingredients[:number], number)
+            for number in range(1, 4)
+        ]
+
+    def sync_json(self, url):
+        response = self.anon.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    async def test_ingredients_cold_index(self):
+        ingredient_index._index = None
+        url = "/api/ingredients/?name=м"
+        response = await async_views.ingredients_list(self.factory.get(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["name"] for item in json.loads(response.content)],
+            ["масло", "мёд", "мука"],
+        )
+        self.assertIsNotNone(ingredient_index._index)
+
+    async def test_recipes_list(self):
+        url = "/api/recipes/?limit=2&page=2"
+        response = await async_views.recipes_list(self.factory.get(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            await sync_to_async(self.sync_json)(url),
+        )
+
+    async def test_recipe_detail(self):
+        recipe = self.recipes[-1]
+        url = f"/api/recipes/{recipe.pk}/"
+        response = await async_views.recipe_detail(
+            self.factory.get(url), recipe.pk
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            await sync_to_async(self.sync_json)(url),
+        )
+        response = await async_views.recipe_detail(
+            self.factory.get(url), 10**6
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def sync_response(self, url, token):
+        client = APIClient()
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        response = client.get(url)
+        return response.status_code, response.content
+
+    async def test_same_checks_as_viewset(self):
+        reader = await sync_to_async(make_user)(2)
+        token = (await Token.objects.acreate(user=reader)).key
+        await Favourite.objects.acreate(user=reader, recipe=self.recipes[0])
+        cases = [
+            ("/api/recipes/?is_favorited=1", token),
+            ("/api/recipes/?is_in_shopping_cart=1&limit=5", token),
+            ("/api/recipes/?cursor=&limit=2", None),
+            ("/api/recipes/?search=1", None),
+            ("/api/recipes/?unknown=1", None),
+            ("/api/recipes/?is_in_shopping_cart=x", token),
+            ("/api/recipes/?author=999", None),
+            ("/api/recipes/", "wrong"),
+        ]
+        for url, key in cases:
+            with self.subTest(url=url, token=key):
+                headers = {"Authorization": f"Token {key}"} if key else {}
+                response = await async_views.recipes_list(
+                    self.factory.get(url, headers=headers)
+                )
+                expected = await sync_to_async(self.sync_response)(url, key)
+                self.assertEqual(
+                    (response.status_code, response.content), expected
+                )
+
+    async def test_throttle_classes_apply(self):
+        class DenyAll(BaseThrottle):
+            def allow_request(self, request, view):
+                return False
+
+        recipe = self.recipes[0]
+        with mock.patch.object(RecipesViewSet, "throttle_classes", [DenyAll]):
+            response = await async_views.recipes_list(
+                self.factory.get("/api/recipes/")
+            )
+            self.assertEqual(response.status_code, 429)
+            response = await async_views.recipe_detail(
+                self.factory.get(f"/api/recipes/{recipe.pk}/"), recipe.pk
+            )
+            self.assertEqual(response.status_code, 429)
+
+
+class PostmanReplayTests(TestCase):
+    def test_extractors(self):
+        extractors = postman_replay.parse_extractors(
+            [
+                'const recipeId = _.get(responseData, "results[0].id");',
+                'pm.collectionVariables.set("recipeId", recipeId);',
+                'pm.environment.set("code", responseData.short.slice(0, 3));',
+                'pm.test("Статус", () => pm.response.to.have.status(200));',
+            ]
+        )
+        self.assertEqual(
+            extractors,
+            [
+                ("recipeId", ["results", 0, "id"], None),
+                ("code", ["short"], (0, 3)),
+            ],
+        )
+        self.assertEqual(
+            postman_replay.endpoint(
+                "GET", "http://host/api/recipes/12/?limit=1"
+            ),
+            "GET /api/recipes/{id}/",
+        )
+
+    def test_collection_replay(self):
+        # Коллекция ссылается на ингредиенты из справочника по id
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(id=1, name="мука", measurement_unit="г"),
+                Ingredient(id=2, name="молоко", measurement_unit="мл"),
+            ]
+        )
+        collections = [
+            postman_replay.load_collection(
+                settings.BASE_DIR
+                / "add_users_and_recipes.postman_collection.json"
+            )
+        ]
+        # Метки разводят пользователей и рецепты двух прогонов
+        for tag in ("first", "second"):
+            transport = postman_replay.ClientTransport()
+            results = postman_replay.VirtualUser(
+                collections, transport, tag
+            ).run()
+            failed = [
+                (name, status) for name, status, _ in results if status >= 400
+            ]
+            self.assertEqual(failed, [])
+        self.assertEqual(
+            User.objects.filter(email__contains="+second@").count(), 3
+        )
+
+
+@override_settings(SERVER_TIMING_HEADER=True)
+class TimingMiddlewareTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_recipe(make_user(1), [], 1)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anon.get("/api/recipes/")
+        header = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        for phase in ("view", "serialize", "render", "total"):
+            self.assertIn(f"{phase};dur=", header)
+
+    def test_metrics(self):
+        self.anon.get("/api/recipes/")
+        self.anon.get("/api/recipes/10000/")
+        text = metrics.metrics_view(
+            RequestFactory().get("/metrics")
+        ).content.decode()
+        self.assertRegex(
+            text,
+            r'foodgram_requests_total\{route="recipes-list",method="GET",'
+            r'status="200"\} \d+',
+        )
+        self.assertIn('route="recipes-detail",method="GET",status="404"', text)
+        self.assertIn('phase="serialize",le="+Inf"', text)
+
+    def test_serialize_phase(self):
+        key = (
+            "foodgram_request_phase_seconds",
+            (
+                ("route", "recipes-list"),
+                ("method", "GET"),
+                ("phase", "serialize"),
+            ),
+        )
+        before = metrics.registry.histograms.get(key)
+        before = before.sum if before is not None else 0
+        self.anon.get("/api/recipes/")
+        self.assertGreater(metrics.registry.histograms[key].sum, before)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_disabled(self):
+        response = self.anon.get("/api/recipes/")
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(DATABASE_REPLICA_READS=True, DATABASE_STICKY_SECONDS=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Чтение с реплики и «прилипание» к основной базе после записи.
+
+    replica1 — зеркало основной базы (settings_test), запросы к алиасам
+    считаются раздельно.
+    """
+
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        cache.clear()
+        self.set_replica_state(True)
+        self.addCleanup(db_router.health.suspect)
+        self.user = make_user(1)
+        self.recipe = make_recipe(self.user, [], 1)
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def set_replica_state(self, healthy):
+        # Без фоновой проверки: состояние реплики задаётся напрямую
+        db_router.health.states["replica1"] = healthy
+        db_router.health.checked_at["replica1"] = time.monotonic()
+
+    def request(self, method, url, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica1"]) as replica:
+                response = getattr(client, method)(url)
+        self.assertLess(response.status_code, 400, response.content[:300])
+        return response, len(primary), len(replica)
+
+    def test_router(self):
+        router = db_router.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Recipe), "default")
+        token = db_router._use_replicas.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipe), "replica1")
+            self.assertEqual(router.db_for_read(Token), "default")
+            self.assertEqual(router.db_for_write(Recipe), "default")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Recipe), "default")
+            with db_router.primary():
+                self.assertEqual(router.db_for_read(Recipe), "default")
+            self.set_replica_state(False)
+            self.assertEqual(router.db_for_read(Recipe), "default")
+        finally:
+            db_router._use_replicas.reset(token)
+        self.assertFalse(router.allow_migrate("replica1", "posts"))
+
+    def test_reads_go_to_replica(self):
+        url = f"/api/recipes/{self.recipe.pk}/"
+        # Фрагмент для кэша собирается из основной базы
+        _, primary, replica = self.request("get", url)
+        self.assertEqual((primary, replica), (3, 1))
+        # На основной — только проверка токена
+        _, primary, replica = self.request("get", url)
+        self.assertEqual((primary, replica), (1, 1))
+        _, primary, replica = self.request("get", "/api/recipes/", APIClient())
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_sticky_after_write(self):
+        url = f"/api/recipes/{self.recipe.pk}/"
+        response, _, _ = self.request("post", f"{url}favorite/")
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+
+        # Метка в кэше по токену: без cookie тоже читаем основную базу
+        self.client.cookies.clear()
+        response, _, replica = self.request("get", url)
+        self.assertEqual(replica, 0)
+        self.assertTrue(response.data["is_favorited"])
+
+        # Метка в cookie: для запросов без токена
+        anon = APIClient()
+        anon.cookies[db_router.STICKY_COOKIE] = "1"
+        _, _, replica = self.request("get", url, anon)
+        self.assertEqual(replica, 0)
+        _, _, replica = self.request("get", url, APIClient())
+        self.assertGreater(replica, 0)
+
+        # Метка истекла
+        cache.clear()
+        _, _, replica = self.request("get", url)
+        self.assertGreater(replica, 0)
+
+    def test_failed_write_is_not_sticky(self):
+        response = self.client.post("/api/recipes/0/favorite/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(db_router.STICKY_COOKIE, response.cookies)
+
+    def test_connection_error_suspends_replicas(self):
+        middleware = db_router.ReplicaMiddleware(lambda request: None)
+        request = RequestFactory().get("/api/recipes/")
+        token = db_router._use_replicas.set(True)
+        try:
+            middleware.process_exception(request, ValueError())
+            self.assertEqual(db_router.health.states, {"replica1": True})
+            middleware.process_exception(request, OperationalError())
+            self.assertEqual(db_router.health.states, {})
+        finally:
+            db_router._use_replicas.reset(token)
+
+    async def test_connection_error_under_asgi(self):
+        # AsyncClient собирает middleware в async-режиме, как под ASGI
+        client = AsyncClient()
+        url = f"/api/recipes/{self.recipe.pk}/"
+        with mock.patch.object(
+            RecipesViewSet, "retrieve", side_effect=OperationalError
+        ), self.assertRaises(OperationalError):
+            await client.get(url)
+        self.assertEqual(db_router.health.states, {})
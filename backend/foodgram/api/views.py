@@ -3,13 +3,42 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.serializers import ValidationError
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from http import HTTPStatus
-from django.db.models import Sum
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (
+    Exists,
+    OuterRef,
+    Value,
+    BooleanField,
+    F,
+    Q,
+    Window,
+)
+from django.db.models.functions import RowNumber
+from django.conf import settings
+from foodgram.metrics import TimedSerializerMixin
 from foodgram.settings import BASE_URL
 
 from users.models import User, Subscription
-from posts.models import Ingredient, Recipe, RecipeIngredient, Favourite, ShoppingCart
+from posts import (
+    feed,
+    ingredient_index,
+    pantry,
+    popular,
+    recipe_ingredient_index,
+    relations,
+    short_codes,
+)
+from posts.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Favourite,
+    PopularRecipe,
+    ShoppingCart,
+)
 from .serializers import (
     IngredientSerializer,
     RecipeGetSerializer,
@@ -21,12 +50,45 @@ from .serializers import (
     UserSetPasswordSerializer,
     UserAvatarSerializer,
     UserOutputSerializer,
+    IdListSerializer,
+)
+from .pagination import (
+    RecipePagination,
+    PopularCursorPagination,
+    RecipeCursorPagination,
+    UsersPagination,
+    SubscriptionPagination,
 )
-from .pagination import RecipePagination, UsersPagination, SubscriptionPagination
 from .permissions import OwnerOrReadOnly
+from .shopping_list import SHOPPING_LIST_RENDERERS
+
 
+def annotate_user_flags(queryset, user):
+    """Флаги избранного, корзины и подписки одним запросом через Exists."""
+    if not user.is_authenticated:
+        false = Value(False, output_field=BooleanField())
+        return queryset.annotate(
+            is_favorited=false,
+            is_in_shopping_cart=false,
+            author_is_subscribed=false,
+        )
 
-class RecipesViewSet(viewsets.ModelViewSet):
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favourite.objects.filter(user=user, recipe=OuterRef("pk"))
+        ),
+        is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+        ),
+        author_is_subscribed=Exists(
+            Subscription.objects.filter(
+                subscriber=user, author=OuterRef("author")
+            )
+        ),
+    )
+
+
+class RecipesViewSet(TimedSerializerMixin, viewsets.ModelViewSet):
     # queryset = Recipe.objects.all()
     pagination_class = RecipePagination
     permission_classes = [
@@ -34,22 +96,43 @@ class RecipesViewSet(viewsets.ModelViewSet):
     ]
     serializer_class = RecipeGetSerializer
 
+    @property
+    def paginator(self):
+        # Курсорный режим включается параметром ?cursor (в т.ч. пустым),
+        # постраничный остаётся по умолчанию для текущего фронтенда
+        if not hasattr(self, "_paginator"):
+            if "cursor" in self.request.query_params:
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
         allowed_params = {
             "page",
+            "cursor",
             "author",
             "is_favorited",
             "limit",
             "is_in_shopping_cart",
+            "search",
+            "ingredients",
+            "match",
         }
 
         for param in self.request.query_params.keys():
             if param not in allowed_params:
                 raise ValidationError({param: "Неизвестный параметр"})
 
-        queryset = Recipe.objects.all().order_by("-pub_date")
+        queryset = self.annotate_user_flags(Recipe.objects.all()).order_by(
+            "-pub_date"
+        )
         user = self.request.user
 
+        if self.action in ("list", "retrieve"):
+            # Остальное берётся из кэша фрагментов (RecipeGetSerializer)
+            queryset = queryset.only("id", "author", "pub_date")
+
         author = self.request.query_params.get("author")
         is_favorited = self.request.query_params.get("is_favorited")
 
@@ -63,12 +146,86 @@ class RecipesViewSet(viewsets.ModelViewSet):
                 )
 
             if user.is_authenticated:
-                if is_favorited == "1":
-                    queryset = queryset.filter(favorited_by__user=user)
-                else:
-                    queryset = queryset.exclude(favorited_by__user=user)
+                queryset = queryset.filter(is_favorited=is_favorited == "1")
+
+        ingredients = self.request.query_params.get("ingredients")
+        match = self.request.query_params.get("match", "all")
+        if match not in ("all", "any"):
+            raise ValidationError(
+                {"match": "Параметр должен быть 'all' или 'any'."}
+            )
+        if ingredients:
+            queryset = self.filter_by_ingredients(queryset, ingredients, match)
+
+        search = self.request.query_params.get("search")
+        if search:
+            queryset = self.search_recipes(queryset, search)
+        return queryset
+
+    def filter_by_ingredients(self, queryset, ingredients, match):
+        """Фильтр по ингредиентам: все (match=all) или любой (match=any)."""
+        ingredient_ids = ingredients.split(",")
+        if not all(
+            ingredient_id.isdigit() for ingredient_id in ingredient_ids
+        ):
+            raise ValidationError(
+                {
+                    "ingredients": "Ожидается список id ингредиентов "
+                    "через запятую."
+                }
+            )
+        ingredient_ids = {
+            int(ingredient_id) for ingredient_id in ingredient_ids
+        }
+
+        index = recipe_ingredient_index.get_index()
+        if match == "all":
+            recipe_ids = index.match_all(ingredient_ids)
+        else:
+            recipe_ids = index.match_any(ingredient_ids)
+
+        if len(recipe_ids) <= settings.RECIPE_INGREDIENT_FILTER_MAX_IDS:
+            return queryset.filter(id__in=recipe_ids)
+
+        # Слишком много id для IN (...) — пусть фильтрует база
+        if match == "any":
+            return queryset.filter(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"), ingredient_id__in=ingredient_ids
+                    )
+                )
+            )
+        for ingredient_id in ingredient_ids:
+            queryset = queryset.filter(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"), ingredient_id=ingredient_id
+                    )
+                )
+            )
         return queryset
 
+    def search_recipes(self, queryset, search):
+        """Полнотекстовый поиск по названию и описанию, по убыванию ts_rank.
+
+        В курсорном режиме порядок остаётся по дате публикации.
+        """
+        if connection.vendor != "postgresql":
+            return queryset.filter(
+                Q(name__icontains=search) | Q(text__icontains=search)
+            )
+
+        query = SearchQuery(search, config="russian", search_type="websearch")
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-pub_date")
+        )
+
+    def annotate_user_flags(self, queryset):
+        return annotate_user_flags(queryset, self.request.user)
+
     def create(self, request):
         serializer = RecipePostSerializer(
             data=request.data, context={"request": request}
@@ -103,44 +260,51 @@ class RecipesViewSet(viewsets.ModelViewSet):
         response_data = RecipeGetSerializer(instance, context={"request": request})
         return Response(response_data.data, status=HTTPStatus.OK)
 
-    def list(self, request):
+    def list_queryset(self):
+        """Выборка для list; None, если у автора из ?author= нет рецептов.
+
+        Общая с async_views.recipes_list.
+        """
         queryset = self.get_queryset()
-        user = request.user
+        user = self.request.user
 
-        if request.query_params.get("author") and not queryset.exists():
-            return Response(status=HTTPStatus.NOT_FOUND)
+        if self.request.query_params.get("author") and not queryset.exists():
+            return None
 
-        param = request.query_params.get("is_in_shopping_cart")
+        param = self.request.query_params.get("is_in_shopping_cart")
 
         if param is not None:
             try:
                 param = int(param)
             except ValueError:
-                return Response(
-                    {"error": "param must be int"}, status=HTTPStatus.BAD_REQUEST
-                )
+                raise ValidationError({"error": "param must be int"})
 
             if user.is_authenticated:
-                if param == 1:
-                    queryset = queryset.filter(in_carts__user=user)
-
-                elif param == 0:
-                    queryset = queryset.exclude(in_carts__user=user)
+                if param in (0, 1):
+                    queryset = queryset.filter(is_in_shopping_cart=param == 1)
                 else:
-                    return Response(
-                        {"error": "Parameter must be 0 or 1."},
-                        status=HTTPStatus.BAD_REQUEST,
+                    raise ValidationError(
+                        {"error": "Parameter must be 0 or 1."}
                     )
+        return queryset
+
+    def get_recipe(self):
+        """Рецепт для retrieve или None; общий с async_views.recipe_detail."""
+        return self.get_queryset().filter(id=self.kwargs.get("pk")).first()
+
+    def list(self, request):
+        queryset = self.list_queryset()
+        if queryset is None:
+            return Response(status=HTTPStatus.NOT_FOUND)
 
         page = self.paginate_queryset(queryset)
-        serializer = RecipeGetSerializer(page, context={"request": request}, many=True)
+        serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
-        recipe_id = self.kwargs.get("pk")
-        if Recipe.objects.filter(id=recipe_id).exists():
-            recipe = Recipe.objects.get(id=recipe_id)
-            serializer = RecipeGetSerializer(recipe, context={"request": request})
+        recipe = self.get_recipe()
+        if recipe is not None:
+            serializer = self.get_serializer(recipe)
             return Response(serializer.data, status=HTTPStatus.OK)
 
         return Response(status=HTTPStatus.NOT_FOUND)
@@ -156,17 +320,13 @@ class RecipesViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == "POST":
-            if not user.favorites.filter(
-                recipe=recipe
-            ).exists():  # Вместо if not Favourite.objects.filter(user=user, recipe=recipe).exists()
-                Favourite.objects.get_or_create(user=user, recipe=recipe)
+            if relations.add_favorites(user.id, [recipe.id]):
                 resp = ShortRecipeInfoSerializer(recipe)
                 return Response(resp.data, status=HTTPStatus.CREATED)
             return Response(status=HTTPStatus.BAD_REQUEST)
 
         if request.method == "DELETE":
-            if user.favorites.filter(recipe=recipe).exists():
-                user.favorites.filter(recipe=recipe).delete()
+            if relations.remove_favorites(user.id, [recipe.id]):
                 return Response(status=HTTPStatus.NO_CONTENT)
             return Response(status=HTTPStatus.BAD_REQUEST)
 
@@ -181,55 +341,212 @@ class RecipesViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == "POST":
-            if user.shopping_cart.filter(
-                recipe=recipe
-            ).exists():  # Использовано related_name
-                return Response(status=HTTPStatus.BAD_REQUEST)
-            ShoppingCart.objects.get_or_create(user=user, recipe=recipe)
-            serializer = ShortRecipeInfoSerializer(recipe)
-            return Response(serializer.data, status=HTTPStatus.CREATED)
+            if relations.add_to_cart(user.id, [recipe.id]):
+                serializer = ShortRecipeInfoSerializer(recipe)
+                return Response(serializer.data, status=HTTPStatus.CREATED)
+            return Response(status=HTTPStatus.BAD_REQUEST)
         if request.method == "DELETE":
-            if user.shopping_cart.filter(
-                recipe=recipe
-            ).exists():  # Использовано related_name
-                user.shopping_cart.filter(recipe=recipe).delete()
+            if relations.remove_from_cart(user.id, [recipe.id]):
                 return Response(status=HTTPStatus.NO_CONTENT)
             return Response(status=HTTPStatus.BAD_REQUEST)
 
+    def bulk_recipes(self, request, add, remove):
+        """Общая часть пакетных избранного и корзины: {"ids": [...]}."""
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+
+        if request.method == "DELETE":
+            removed = remove(request.user.id, ids)
+            return Response({"removed": removed}, status=HTTPStatus.OK)
+
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list("id", flat=True)
+        )
+        missing = sorted(set(ids) - found)
+        if missing:
+            return Response(
+                {"ids": f"Рецепты не найдены: {missing}"},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        added = add(request.user.id, ids)
+        return Response({"added": added}, status=HTTPStatus.OK)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="favorite",
+        url_name="favorite_bulk",
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_recipes(
+            request, relations.add_favorites, relations.remove_favorites
+        )
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="shopping_cart",
+        url_name="shopping_cart_bulk",
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_recipes(
+            request, relations.add_to_cart, relations.remove_from_cart
+        )
+
     @action(
         detail=False,
         methods=["get"],
         permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
         url_name="download_shopping_cart",
     )
     def download_shopping_cart(self, request, pk=None):
         user = request.user
-        recipes = user.shopping_cart.values_list(  # Использовано related_name
-            "recipe", flat=True
-        )
-
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe__in=recipes)
-            .values(
+        renderer = request.accepted_renderer
+        # Суммы поддерживаются при изменении корзины (posts.cart_totals),
+        # строки читаются серверным курсором и сразу уходят клиенту
+        rows = (
+            user.cart_ingredients.filter(total_amount__gt=0)
+            .order_by(
+                "ingredient__measurement_unit",
+                "ingredient__name",
+                "ingredient_id",
+            )
+            .values_list(
                 "ingredient__name",
                 "ingredient__measurement_unit",
+                "total_amount",
             )
-            .annotate(total_amount=Sum("amount"))
+            .iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
         )
 
-        lines = []
-        for item in ingredients:
-            lines.append(
-                f"{item['ingredient__name']} "
-                f"({item['ingredient__measurement_unit']}) — "
-                f"{item['total_amount']}"
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type};charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            renderer.stream(rows), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
+        )
+
+        return response
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="feed",
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала, курсорная пагинация."""
+        paginator = RecipeCursorPagination()
+        cursor = paginator.decode_cursor(request)
+        recipe_ids = feed.feed_recipe_ids(
+            request.user, cursor, paginator.get_page_size(request) + 1
+        )
+
+        queryset = self.annotate_user_flags(
+            Recipe.objects.filter(id__in=recipe_ids)
+        ).only("id", "author", "pub_date")
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = RecipeGetSerializer(
+            page, context={"request": request}, many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="popular",
+        permission_classes=[permissions.AllowAny],
+    )
+    def popular(self, request):
+        """Рецепты по числу добавлений в избранное и корзину за окно.
+
+        Рейтинг предпосчитан командой refresh_popular, здесь только чтение
+        страницы рейтинга по индексу и рецептов этой страницы.
+        """
+        window = request.query_params.get("window", "24h")
+        if window not in popular.WINDOWS:
+            return Response(
+                {
+                    "window": "Допустимые значения: "
+                    + ", ".join(popular.WINDOWS)
+                },
+                status=HTTPStatus.BAD_REQUEST,
             )
 
-        text = "\n".join(lines)
-        response = HttpResponse(text, content_type="text/plain;charset=utf-8")
-        response["Content-Disposition"] = 'attachment; filename="shopping_list.txt"'
+        paginator = PopularCursorPagination()
+        rows = paginator.paginate_queryset(
+            PopularRecipe.objects.filter(window=window, score__gt=0).only(
+                "recipe_id", "score"
+            ),
+            request,
+            view=self,
+        )
+        recipes = self.annotate_user_flags(
+            Recipe.objects.filter(id__in=[row.recipe_id for row in rows])
+        ).only("id", "author", "pub_date")
+        by_id = {recipe.id: recipe for recipe in recipes}
+        serializer = RecipeGetSerializer(
+            [by_id[row.recipe_id] for row in rows if row.recipe_id in by_id],
+            context={"request": request},
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
 
-        return response
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="pantry",
+        permission_classes=[permissions.AllowAny],
+    )
+    def pantry(self, request):
+        """Что приготовить из ?ingredients=1,2,3: рецепты по покрытию."""
+        ingredient_ids = request.query_params.get("ingredients", "").split(",")
+        if not all(
+            ingredient_id.isdigit() for ingredient_id in ingredient_ids
+        ):
+            return Response(
+                {
+                    "ingredients": "Ожидается список id ингредиентов "
+                    "через запятую."
+                },
+                status=HTTPStatus.BAD_REQUEST,
+            )
+
+        limit = request.query_params.get("limit", "10")
+        if not limit.isdigit() or int(limit) == 0:
+            return Response(
+                {"limit": "Параметр должен быть положительным числом."},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        limit = min(int(limit), settings.PANTRY_MAX_LIMIT)
+
+        ranked = pantry.get_matrix().rank(
+            {int(ingredient_id) for ingredient_id in ingredient_ids}, limit
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked]
+        )
+        index = ingredient_index.get_index()
+
+        results = []
+        for recipe_id, coverage, missing_ids in ranked:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            data = ShortRecipeInfoSerializer(
+                recipe, context={"request": request}
+            ).data
+            data["coverage"] = coverage
+            data["missing_ingredients"] = index.by_ids(missing_ids)
+            results.append(data)
+        return Response(results, status=HTTPStatus.OK)
 
     @action(
         detail=True,
@@ -241,13 +558,15 @@ class RecipesViewSet(viewsets.ModelViewSet):
         recipe = self.get_object()
         base_url = BASE_URL
         short_url = (
-            f"{base_url}/api/short_link/{recipe.short_code}"  # Вместо хардкода URL
+            f"{base_url}/api/short_link/{short_codes.encode(recipe.pk)}"
         )
 
         return Response({"short-link": short_url}, status=HTTPStatus.OK)
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(
+    TimedSerializerMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -262,26 +581,97 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(name__startswith=name)
         return qs
 
+    def list(self, request, *args, **kwargs):
+        if "search" in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        mode = request.query_params.get("mode", "prefix")
+        if mode not in ("prefix", "fuzzy"):
+            return Response(
+                {"mode": "Параметр должен быть 'prefix' или 'fuzzy'."},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+
+        # Автодополнение обслуживается индексом в памяти, без запросов к базе
+        limit = request.query_params.get("limit")
+        if limit is not None:
+            if not limit.isdigit() or int(limit) == 0:
+                return Response(
+                    {"limit": "Параметр должен быть положительным числом."},
+                    status=HTTPStatus.BAD_REQUEST,
+                )
+            limit = min(int(limit), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+
+        name = request.query_params.get("name", "")
+        if mode == "fuzzy":
+            # Выдача нечёткого поиска всегда ограничена
+            limit = limit or settings.INGREDIENT_SEARCH_MAX_LIMIT
+            return Response(ingredient_index.fuzzy_search(name, limit))
+        return Response(ingredient_index.get_index().search(name, limit))
+
+
+def recipes_limit(request):
+    limit = request.query_params.get("recipes_limit")
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
+
+def latest_recipes_by_author(author_ids, limit=None):
+    """Последние limit рецептов каждого автора одним запросом.
+
+    Ограничение на автора — через ROW_NUMBER() OVER (PARTITION BY author_id),
+    результат раскладывается по авторам: {author_id: [recipe, ...]}.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        "author_id", "-pub_date", "-id"
+    )
+    if limit is not None:
+        recipes = recipes.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F("author_id"),
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        ).filter(row_number__lte=limit)
+
+    by_author = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    return by_author
 
-class SubscribtionsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class SubscribtionsViewSet(
+    TimedSerializerMixin, viewsets.ReadOnlyModelViewSet
+):
     serializer_class = SubscribtionsSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = SubscriptionPagination
 
     def get_queryset(self):
-        return User.objects.filter(subscribers__subscriber=self.request.user).distinct()
+        return (
+            User.objects.filter(
+                Exists(
+                    Subscription.objects.filter(
+                        subscriber=self.request.user, author=OuterRef("pk")
+                    )
+                )
+            ).order_by("id")
+        )
 
     def list(self, request):
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
+        authors = page if page is not None else list(queryset)
+
+        context = self.get_serializer_context()
+        context["recipes_by_author"] = latest_recipes_by_author(
+            [author.id for author in authors], recipes_limit(request)
+        )
+        serializer = self.get_serializer(authors, many=True, context=context)
 
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(
-            queryset, many=True, context={"request": request}
-        )
         return Response(serializer.data)
 
 
@@ -383,26 +773,61 @@ class UserViewSet(viewsets.ModelViewSet):
                     status=HTTPStatus.BAD_REQUEST,
                 )
 
-            if user.subscriptions.filter(
-                author=author
-            ).exists():  # Использовано related_name
+            if not relations.subscribe(user.id, [author.id]):
                 return Response(status=HTTPStatus.BAD_REQUEST)
 
-            Subscription.objects.get_or_create(subscriber=user, author=author)
-
-            Responsedata = UserOutputSerializer(author, context={"request": request})
+            recipes_by_author = latest_recipes_by_author(
+                [author.id], recipes_limit(request)
+            )
+            Responsedata = UserOutputSerializer(
+                author,
+                context={
+                    "request": request,
+                    "recipes_by_author": recipes_by_author,
+                },
+            )
             return Response(Responsedata.data, status=HTTPStatus.CREATED)
 
         if request.method == "DELETE":
-            if user.subscriptions.filter(
-                author=author
-            ).exists():  # Использовано related_name
-                user.subscriptions.filter(
-                    author=author
-                ).delete()  # Использовано related_name
+            if relations.unsubscribe(user.id, [author.id]):
                 return Response(status=HTTPStatus.NO_CONTENT)
             return Response(status=HTTPStatus.BAD_REQUEST)
 
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="subscribe",
+        url_name="subscribe_bulk",
+    )
+    def subscribe_bulk(self, request):
+        """Подписка на нескольких авторов сразу: {"ids": [...]}."""
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        user = request.user
+
+        if request.method == "DELETE":
+            removed = relations.unsubscribe(user.id, ids)
+            return Response({"removed": removed}, status=HTTPStatus.OK)
+
+        if user.id in ids:
+            return Response(
+                {"error": "Нельзя подписаться на себя"},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        found = set(
+            User.objects.filter(id__in=ids).values_list("id", flat=True)
+        )
+        missing = sorted(set(ids) - found)
+        if missing:
+            return Response(
+                {"ids": f"Пользователи не найдены: {missing}"},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        added = relations.subscribe(user.id, ids)
+        return Response({"added": added}, status=HTTPStatus.OK)
+
     @action(
         detail=False,
         methods=["put", "delete"],
@@ -421,5 +846,7 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=HTTPStatus.OK)
 
         if request.method == "DELETE":
-            user.avatar.delete(save=True)
+            # Файл не удаляем: по хешу содержимого он может быть общим
+            user.avatar = None
+            user.save(update_fields=["avatar"])
             return Response(status=HTTPStatus.NO_CONTENT)
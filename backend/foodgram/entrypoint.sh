@@ -3,7 +3,7 @@ set -e
 
 python manage.py migrate
 
-python import_ingredients.py
+python manage.py load_ingredients ingredients.csv
 
 python manage.py collectstatic --noinput
 
@@ -0,0 +1,49 @@
+"""Фоновые задачи в пуле потоков воркера.
+
+Для коротких задач, которые не должны задерживать ответ (рассылка в ленты,
+обработка изображений). Задачи не переживают перезапуск воркера, поэтому
+всё, что они делают, должно восстанавливаться командами сверки.
+При BACKGROUND_WORKERS = 0 задачи выполняются сразу, в том же потоке.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_WORKERS,
+                    thread_name_prefix="foodgram-background",
+                )
+    return _executor
+
+
+def submit(func, *args, **kwargs):
+    if not settings.BACKGROUND_WORKERS:
+        return func(*args, **kwargs)
+    return get_executor().submit(_run, func, *args, **kwargs)
+
+
+def _run(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception(
+            "Фоновая задача %s завершилась ошибкой", func.__name__
+        )
+        raise
+    finally:
+        # У потока пула свои соединения с базой, держать их незачем
+        connections.close_all()
@@ -1,19 +1,38 @@
-import base64
-import uuid
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from foodgram.images import ImageUploadError, decode_data_uri, hashed_upload
+
 
 class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
+    """Изображение из data URI.
 
-            file_name = f"{uuid.uuid4()}.{ext}"
-            data = ContentFile(base64.b64decode(imgstr), name=file_name)
+    Декодируется порциями во временный файл с проверкой размера и
+    заголовка и получает имя по хешу содержимого (foodgram.images). В
+    хранилище файл пишет поле модели при сохранении объекта; если такой
+    файл уже есть, значение поля — его имя. Проверка целиком, удаление EXIF
+    и производные размеры делаются в фоне, поэтому после сохранения объекта
+    нужен images.schedule_processing.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str) and data.startswith("data:image"):
+                upload = decode_data_uri(data)
+            else:
+                upload = hashed_upload(super().to_internal_value(data))
+        except ImageUploadError as error:
+            raise serializers.ValidationError(str(error))
+        name = self.storage_name(upload.name)
+        if default_storage.exists(name):
+            upload.close()
+            return name
+        return upload
 
-        return super().to_internal_value(data)
+    def storage_name(self, name):
+        """Имя, под которым файл сохранило бы поле модели (с upload_to)."""
+        model_field = self.parent.Meta.model._meta.get_field(self.source)
+        return model_field.generate_filename(None, name)
 
 
 min_ingredient_amount = 1
@@ -0,0 +1,275 @@
+"""Чтение с реплик PostgreSQL, запись — в основную базу.
+
+На реплики уходят только чтения внутри безопасных HTTP-запросов
+(GET, HEAD, OPTIONS): их помечает ReplicaMiddleware. Команды, фоновые
+задачи, запросы внутри transaction.atomic() и всё, что пишет, читают
+основную базу.
+
+После успешной записи клиент «прилипает» к основной базе на
+DATABASE_STICKY_SECONDS: метка хранится в общем кэше по хешу токена и,
+для браузера и входа без токена, в cookie. Так пользователь сразу видит
+своё избранное и корзину, даже если реплика отстаёт.
+
+Каждая реплика раз в DATABASE_REPLICA_CHECK_INTERVAL проверяется в фоне
+запросом на отставание. Недоступная или отставшая больше
+DATABASE_REPLICA_MAX_LAG реплика до следующей проверки не используется,
+ошибка соединения в запросе тоже снимает реплики до проверки; если
+подходящих нет, чтение идёт в основную базу.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    DatabaseError,
+    InterfaceError,
+    OperationalError,
+    connections,
+)
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STICKY_KEY = "db-sticky:{}"
+STICKY_COOKIE = "db_primary"
+# Токены и сессии нужны сразу после входа: только из основной базы
+PRIMARY_MODELS = {"authtoken.token", "sessions.session"}
+
+# Отставание реплики в секундах; 0, если всё полученное уже применено
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+_use_replicas = ContextVar("use_replicas", default=False)
+
+
+def replica_aliases():
+    if not settings.DATABASE_REPLICA_READS:
+        return []
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def primary():
+    """Все чтения внутри блока — из основной базы.
+
+    Для того, что надолго кладётся в кэш или в память процесса: снимок с
+    отстающей реплики остался бы там до следующей инвалидации.
+    """
+    token = _use_replicas.set(False)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+class ReplicaHealth:
+    """Состояние реплик в процессе.
+
+    Проверка идёт в отдельном потоке: запрос не ждёт подключения к
+    недоступной реплике, а в async-вью нельзя ходить в базу из event loop.
+    Пока реплика не проверена, она считается негодной.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.checked_at = {}
+        self.checking = False
+
+    def healthy(self, aliases):
+        now = time.monotonic()
+        stale = [
+            alias
+            for alias in aliases
+            if alias not in self.checked_at
+            or now - self.checked_at[alias]
+            > settings.DATABASE_REPLICA_CHECK_INTERVAL
+        ]
+        if stale:
+            self.schedule(stale)
+        return [alias for alias in aliases if self.states.get(alias)]
+
+    def schedule(self, aliases):
+        with self.lock:
+            if self.checking:
+                return
+            self.checking = True
+        threading.Thread(
+            target=self.refresh,
+            args=(aliases,),
+            name="replica-health",
+            daemon=True,
+        ).start()
+
+    def refresh(self, aliases):
+        try:
+            for alias in aliases:
+                self.states[alias] = self.check(alias)
+                self.checked_at[alias] = time.monotonic()
+        finally:
+            # Соединения этого потока больше не понадобятся
+            connections.close_all()
+            self.checking = False
+
+    def check(self, alias):
+        connection = connections[alias]
+        sql = LAG_SQL if connection.vendor == "postgresql" else "SELECT 0"
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError as error:
+            logger.warning("Реплика %s недоступна: %s", alias, error)
+            return False
+        if lag > settings.DATABASE_REPLICA_MAX_LAG:
+            logger.warning("Реплика %s отстаёт на %.1f с", alias, lag)
+            return False
+        return True
+
+    def suspect(self):
+        """Ошибка соединения в запросе: реплики не используются до проверки."""
+        self.states.clear()
+        self.checked_at.clear()
+
+
+health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            not _use_replicas.get()
+            or model._meta.label_lower in PRIMARY_MODELS
+        ):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # В транзакции читаем то, что в ней же записали
+            return DEFAULT_DB_ALIAS
+        aliases = health.healthy(replica_aliases())
+        if not aliases:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def sticky_key(request):
+    authorization = request.headers.get("Authorization")
+    if not authorization:
+        return None
+    return STICKY_KEY.format(
+        hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    )
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик безопасным запросам без метки «прилипания»
+    и ставит метку после успешной записи."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = sticky_key(request)
+        use_replicas = self.may_use_replicas(request) and not (
+            key is not None and cache.get(key) is not None
+        )
+        token = _use_replicas.set(use_replicas)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replicas.reset(token)
+        if self.wrote(request, response):
+            if key is not None:
+                cache.set(key, 1, timeout=settings.DATABASE_STICKY_SECONDS)
+            self.set_cookie(response)
+        return response
+
+    async def __acall__(self, request):
+        key = sticky_key(request)
+        use_replicas = self.may_use_replicas(request) and not (
+            key is not None and await cache.aget(key) is not None
+        )
+        token = _use_replicas.set(use_replicas)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replicas.reset(token)
+        if self.wrote(request, response):
+            if key is not None:
+                await cache.aset(
+                    key, 1, timeout=settings.DATABASE_STICKY_SECONDS
+                )
+            self.set_cookie(response)
+        return response
+
+    # Django вызывает process_exception синхронно и под ASGI (через
+    # sync_to_async), поэтому хук остаётся обычной функцией
+    def process_exception(self, request, exception):
+        self._mark_suspect(exception)
+
+    async def aprocess_exception(self, request, exception):
+        self._mark_suspect(exception)
+
+    def _mark_suspect(self, exception):
+        # Сам запрос уже не спасти, но следующие пойдут в основную базу
+        if _use_replicas.get() and isinstance(
+            exception, (OperationalError, InterfaceError)
+        ):
+            health.suspect()
+
+    def may_use_replicas(self, request):
+        return (
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            and bool(replica_aliases())
+        )
+
+    def wrote(self, request, response):
+        # Без реплик «прилипать» не к чему: ни кэша, ни cookie
+        return (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and settings.DATABASE_STICKY_SECONDS > 0
+            and bool(replica_aliases())
+        )
+
+    def set_cookie(self, response):
+        response.set_cookie(
+            STICKY_COOKIE,
+            "1",
+            max_age=settings.DATABASE_STICKY_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
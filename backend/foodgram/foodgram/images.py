@@ -0,0 +1,343 @@
+"""Загрузка изображений из data URI и их фоновая обработка.
+
+Base64 декодируется порциями во временный файл, который держится в памяти
+до IMAGE_UPLOAD_SPOOL_SIZE и дальше уходит на диск. Размер в байтах
+проверяется по длине строки ещё до декодирования, размер в пикселях — по
+заголовку, как только Pillow его прочитал. Больше в запросе ничего не
+делается: файл получает имя по хешу загруженного содержимого
+(recipes/images/<sha256>.jpg) и пишется в хранилище при сохранении объекта,
+так что в ответе API уже постоянный URL. Одинаковые загрузки хранятся один
+раз, поэтому файлы по хешу при удалении объекта не удаляются.
+
+Полная проверка, удаление EXIF и пересохранение идут после коммита в
+foodgram.background (process_image): очищенный файл заменяет загрузку под
+тем же именем, затем строятся производные размеры
+(recipes/images/<sha256>/card.webp и т. д.); пока их нет, карта размеров
+пустая. Файлы под другими именами (старые загрузки) фоновая обработка
+очищает и переводит на имя по хешу очищенного содержимого.
+"""
+import binascii
+import hashlib
+import logging
+import posixpath
+import re
+from tempfile import SpooledTemporaryFile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageFile, ImageOps
+
+from foodgram import background
+
+logger = logging.getLogger(__name__)
+
+# Кратно 4 символам base64 и 3 байтам результата
+CHUNK_CHARS = 64 * 1024
+# Если за столько байт Pillow не узнал заголовок, это не изображение
+HEADER_MAX_BYTES = 1024 * 1024
+# Форматы Pillow -> расширение файла
+FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+# Производные: наибольшая сторона в пикселях; меньшие картинки не растягиваются
+SIZES = {"thumb": 160, "card": 480, "full": 1280}
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+HASHED_NAME = re.compile(
+    r"^(?:(?P<directory>.*)/)?(?P<digest>[0-9a-f]{64})\.\w+$"
+)
+# Сколько имён с готовыми производными помнить, чтобы не спрашивать хранилище
+READY_CACHE_SIZE = 100_000
+
+# Производные не удаляются, поэтому проверенное имя не проверяется снова
+_ready = set()
+
+
+class ImageUploadError(ValueError):
+    pass
+
+
+def decode_data_uri(data):
+    """data:image/...;base64,... -> File во временном файле."""
+    marker = data.find(";base64,")
+    if marker == -1:
+        raise ImageUploadError("Ожидается изображение в base64 (data URI)")
+    start = marker + len(";base64,")
+    length = len(data) - start
+    padding = data.count("=", max(start, len(data) - 2))
+    if length % 4:
+        raise ImageUploadError("Некорректная строка base64")
+    if length // 4 * 3 - padding > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise ImageUploadError(
+            f"Изображение больше {settings.IMAGE_UPLOAD_MAX_BYTES} байт"
+        )
+
+    target = SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE)
+    parser = ImageFile.Parser()
+    digest = hashlib.sha256()
+    try:
+        for position in range(start, len(data), CHUNK_CHARS):
+            try:
+                chunk = binascii.a2b_base64(
+                    data[position:position + CHUNK_CHARS], strict_mode=True
+                )
+            except binascii.Error:
+                raise ImageUploadError("Некорректная строка base64")
+            target.write(chunk)
+            digest.update(chunk)
+            if parser.image is None:
+                # Парсер нужен только до заголовка: дальше он стал бы
+                # декодировать само изображение
+                feed_header(parser, chunk)
+                if parser.image is not None:
+                    check_header(parser.image)
+                elif target.tell() > HEADER_MAX_BYTES:
+                    raise ImageUploadError("Файл не является изображением")
+        if parser.image is None:
+            raise ImageUploadError("Файл не является изображением")
+    except Exception:
+        target.close()
+        raise
+
+    target.seek(0)
+    extension = FORMATS[parser.image.format]
+    return File(target, name=f"{digest.hexdigest()}.{extension}")
+
+
+def hashed_upload(upload):
+    """Переименовывает загрузку multipart по хешу её содержимого."""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    extension = posixpath.splitext(upload.name)[1].lower()
+    upload.name = f"{digest.hexdigest()}{extension}"
+    return upload
+
+
+def feed_header(parser, chunk):
+    try:
+        parser.feed(chunk)
+    except Image.DecompressionBombError as error:
+        raise ImageUploadError(str(error))
+
+
+def check_header(image):
+    if image.format not in FORMATS:
+        raise ImageUploadError(f"Формат {image.format} не поддерживается")
+    width, height = image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ImageUploadError(
+            f"Изображение {width}×{height} больше допустимых "
+            f"{settings.IMAGE_UPLOAD_MAX_PIXELS} пикселей"
+        )
+
+
+def sanitize(source):
+    """Проверяет изображение целиком и пересохраняет его без EXIF.
+
+    Возвращает (File, формат); для анимации вместо File — None, она
+    хранится как есть.
+    """
+    with Image.open(source) as image:
+        image.verify()
+    source.seek(0)
+    with Image.open(source) as image:
+        image_format = image.format
+        if getattr(image, "n_frames", 1) > 1:
+            return None, image_format
+        cleaned = reencode(ImageOps.exif_transpose(image), image_format)
+    return cleaned, image_format
+
+
+def clean(source, directory):
+    """Пересохраняет изображение без EXIF в directory по хешу содержимого."""
+    cleaned, image_format = sanitize(source)
+    if cleaned is None:
+        source.seek(0)
+        return store(directory, File(source), image_format)
+    try:
+        return store(directory, cleaned, image_format)
+    finally:
+        cleaned.close()
+
+
+def clean_in_place(name):
+    """Заменяет загрузку name её очищенной версией под тем же именем."""
+    with default_storage.open(name, "rb") as source:
+        cleaned, _ = sanitize(source)
+    if cleaned is None:
+        return name
+    try:
+        default_storage.delete(name)
+        return default_storage.save(name, cleaned)
+    finally:
+        cleaned.close()
+
+
+def schedule_processing(instance, field_name):
+    """После коммита отправляет сохранённое изображение в фоновую обработку."""
+    name = getattr(instance, field_name).name
+    if not name:
+        return
+    transaction.on_commit(
+        lambda: background.submit(
+            process_image, instance._meta.label, instance.pk, field_name, name
+        )
+    )
+
+
+def is_content_addressed(name):
+    return bool(name) and HASHED_NAME.match(name) is not None
+
+
+def derivative_names(name):
+    """{размер: {формат: имя файла}} для имени по хешу, иначе None."""
+    match = HASHED_NAME.match(name or "")
+    if match is None:
+        return None
+    base = posixpath.join(match["directory"] or "", match["digest"])
+    return {
+        size: {ext: f"{base}/{size}.{ext}" for ext in DERIVATIVE_FORMATS}
+        for size in SIZES
+    }
+
+
+def size_urls(name):
+    """Карта размеров с URL из хранилища; None, пока производных нет."""
+    names = derivative_names(name)
+    if names is None or not derivatives_ready(name, names):
+        return None
+    return {
+        size: {ext: default_storage.url(path) for ext, path in formats.items()}
+        for size, formats in names.items()
+    }
+
+
+def derivatives_ready(name, names):
+    if name in _ready:
+        return True
+    # Производные пишутся по порядку: есть последняя — есть все
+    last = list(list(names.values())[-1].values())[-1]
+    if not default_storage.exists(last):
+        return False
+    if len(_ready) >= READY_CACHE_SIZE:
+        _ready.clear()
+    _ready.add(name)
+    return True
+
+
+def process_image(model_label, pk, field_name, name, force=False):
+    """Проверяет загрузку, убирает EXIF и строит производные.
+
+    Файл по хешу без производных ещё не обработан: очищенная версия
+    заменяет его под тем же именем. Файл под другим именем очищается и
+    переводится на имя по хешу. Битый файл удаляется, поле у объекта
+    очищается.
+    """
+    ready = is_content_addressed(name) and derivatives_ready(
+        name, derivative_names(name)
+    )
+    if ready and not force:
+        return name
+    try:
+        if not is_content_addressed(name):
+            with default_storage.open(name, "rb") as source:
+                target = clean(source, posixpath.dirname(name))
+        elif not ready:
+            target = clean_in_place(name)
+        else:
+            # Уже очищен, --force: только производные
+            target = name
+        with default_storage.open(target, "rb") as source:
+            with Image.open(source) as image:
+                make_derivatives(ImageOps.exif_transpose(image), target, force)
+    except FileNotFoundError:
+        # Объект успели удалить или заменить изображение
+        return None
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        logger.warning(
+            "Битое изображение %s у %s(%s), удаляем", name, model_label, pk
+        )
+        discard(model_label, pk, field_name, name)
+        return None
+
+    # Поле сохраняется и без смены имени: сигналы сбрасывают кэш фрагментов,
+    # собранных без размеров
+    switch(model_label, pk, field_name, name, target)
+    return target
+
+
+def store(directory, content, image_format):
+    """Кладёт файл в directory по хешу содержимого, если его там нет."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    target = posixpath.join(
+        directory, f"{digest.hexdigest()}.{FORMATS[image_format]}"
+    )
+    if not default_storage.exists(target):
+        content.seek(0)
+        target = default_storage.save(target, content)
+    return target
+
+
+def make_derivatives(image, name, force=False):
+    names = derivative_names(name)
+    if names is None:
+        # Совпадение имени при гонке двух одинаковых загрузок: без производных
+        return
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert(
+            "RGBA" if "transparency" in image.info else "RGB"
+        )
+    for size, formats in names.items():
+        resized = image.copy()
+        resized.thumbnail((SIZES[size], SIZES[size]), Image.LANCZOS)
+        for ext, path in formats.items():
+            if default_storage.exists(path):
+                if not force:
+                    continue
+                default_storage.delete(path)
+            output = resized
+            if DERIVATIVE_FORMATS[ext] == "JPEG" and output.mode != "RGB":
+                # У JPEG нет прозрачности: подкладываем белый фон
+                output = Image.new("RGB", resized.size, "white")
+                output.paste(resized, mask=resized.getchannel("A"))
+            target = SpooledTemporaryFile(
+                max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE
+            )
+            output.save(target, format=DERIVATIVE_FORMATS[ext], quality=82)
+            target.seek(0)
+            default_storage.save(path, File(target))
+            target.close()
+
+
+def reencode(image, image_format):
+    """Пересохраняет в том же формате без EXIF."""
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    target = SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE)
+    options = {"quality": 90} if image_format in ("JPEG", "WEBP") else {}
+    image.save(target, format=image_format, optimize=True, **options)
+    target.seek(0)
+    return File(target)
+
+
+def switch(model_label, pk, field_name, name, target):
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is not None and getattr(instance, field_name).name == name:
+        # save(), а не update(): сигналы сбрасывают кэш фрагментов рецептов
+        setattr(instance, field_name, target)
+        instance.save(update_fields=[field_name])
+    if target != name and not is_content_addressed(name):
+        # Исходная загрузка принадлежала только этому объекту
+        default_storage.delete(name)
+
+
+def discard(model_label, pk, field_name, name):
+    default_storage.delete(name)
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is not None and getattr(instance, field_name).name == name:
+        setattr(instance, field_name, "")
+        instance.save(update_fields=[field_name])
@@ -0,0 +1,316 @@
+"""Замеры времени запросов: заголовок Server-Timing и метрики Prometheus.
+
+Middleware заводит на запрос RequestTimings и собирает в него:
+- db — число SQL-запросов и время в них (execute_wrapper на соединениях);
+- view — время во view, включая SQL и сериализацию;
+- serialize — время в serializer.data сериализаторов, которые view
+  получила через get_serializer (TimedSerializerMixin);
+- render — время рендерера DRF после возврата из view.
+Итог уходит в заголовок Server-Timing и в гистограммы по маршрутам,
+которые отдаёт /metrics (при METRICS_ENDPOINT). Гистограммы живут в
+памяти процесса: у каждого воркера gunicorn свои, Prometheus собирает
+их с каждого воркера или суммирует по instance.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+PHASES = ("view", "db", "serialize", "render")
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    __slots__ = ("queries", "db", "view", "serialize", "render")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.view = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+
+
+def sql_timer(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+
+@contextmanager
+def timed_phase(name):
+    """Прибавляет время блока к фазе name текущего запроса."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        setattr(timings, name, getattr(timings, name) + elapsed)
+
+
+class TimedSerializer:
+    """Сериализатор, у которого чтение .data идёт в фазу serialize.
+
+    Остальные атрибуты и методы берутся у обёрнутого сериализатора.
+    """
+
+    def __init__(self, serializer):
+        self._serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self._serializer, name)
+
+    @property
+    def data(self):
+        with timed_phase("serialize"):
+            return self._serializer.data
+
+
+class TimedSerializerMixin:
+    """Миксин для GenericAPIView: замер serializer.data из get_serializer."""
+
+    def get_serializer(self, *args, **kwargs):
+        return TimedSerializer(super().get_serializer(*args, **kwargs))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Гистограммы по (метрика, метки) с одной блокировкой на запись."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+
+    def record(self, route, method, status, total, timings):
+        labels = (("route", route), ("method", method))
+        observations = [
+            (
+                "foodgram_request_duration_seconds",
+                labels,
+                DURATION_BUCKETS,
+                total,
+            ),
+            (
+                "foodgram_request_queries",
+                labels,
+                QUERY_BUCKETS,
+                timings.queries,
+            ),
+        ] + [
+            (
+                "foodgram_request_phase_seconds",
+                labels + (("phase", phase),),
+                DURATION_BUCKETS,
+                getattr(timings, phase),
+            )
+            for phase in PHASES
+        ]
+        with self.lock:
+            for name, key_labels, buckets, value in observations:
+                key = (name, key_labels)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                histogram.observe(value)
+            key = labels + (("status", str(status)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def render(self):
+        with self.lock:
+            histograms = {
+                key: (list(h.counts), h.sum, h.buckets)
+                for key, h in self.histograms.items()
+            }
+            requests = dict(self.requests)
+
+        lines = [
+            "# HELP foodgram_requests_total Обработанные запросы",
+            "# TYPE foodgram_requests_total counter",
+        ]
+        for labels, count in sorted(requests.items()):
+            lines.append(
+                f"foodgram_requests_total{format_labels(labels)} {count}"
+            )
+
+        current = None
+        for (name, labels), (counts, total, buckets) in sorted(
+            histograms.items()
+        ):
+            if name != current:
+                current = name
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), counts):
+                cumulative += count
+                le = labels + (("le", str(bound)),)
+                lines.append(f"{name}_bucket{format_labels(le)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    escaped = (
+        (
+            key,
+            value.replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+registry = Registry()
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unmatched"
+
+
+def install_sql_timer(sender=None, connection=None, **kwargs):
+    """Вешает sql_timer на соединение один раз.
+
+    Обёртка постоянная, вне запроса (фоновые задачи, команды) она просто
+    ничего не считает. Так SQL учитывается и в потоках sync_to_async у
+    async-вью, куда контекстный execute_wrapper из middleware не попадает.
+    """
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
+
+
+class TimingMiddleware:
+    """Ставится первым в MIDDLEWARE, чтобы total покрывал всю обработку.
+
+    Работает и в синхронной цепочке (WSGI), и в асинхронной (ASGI), не
+    переключая поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(install_sql_timer)
+        for connection in connections.all(initialized_only=True):
+            install_sql_timer(connection=connection)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Синхронные хуки в async-цепочке Django увёл бы в поток
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, started)
+
+    def start(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        request._timing_view_started = None
+        request._timing_view_finished = None
+        return timings, token, time.perf_counter()
+
+    def finish(self, request, response, timings, started):
+        finished = time.perf_counter()
+        view_started = request._timing_view_started
+        view_finished = request._timing_view_finished
+        if view_started is not None:
+            # Для DRF Response после view идёт рендер; для обычных ответов
+            # (редирект, стриминг) view заканчивается вместе с цепочкой
+            timings.view = (view_finished or finished) - view_started
+            if view_finished is not None:
+                timings.render = finished - view_finished
+        total = finished - started
+
+        registry.record(
+            route_name(request),
+            request.method,
+            response.status_code,
+            total,
+            timings,
+        )
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = server_timing(total, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._timing_view_finished = time.perf_counter()
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_started = time.perf_counter()
+
+    async def aprocess_template_response(self, request, response):
+        request._timing_view_finished = time.perf_counter()
+        return response
+
+
+def server_timing(total, timings):
+    return ", ".join(
+        [
+            f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+            f"view;dur={timings.view * 1000:.1f}",
+            f"serialize;dur={timings.serialize * 1000:.1f}",
+            f"render;dur={timings.render * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+    )
+
+
+def metrics_view(request):
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "djoser",
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    "foodgram.metrics.TimingMiddleware",
+    "foodgram.db_router.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -70,6 +73,80 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 1,
 }
 
+# Начиная с какой оценки планировщика PostgreSQL пагинация рецептов
+# отдаёт приблизительный count вместо COUNT(*). 0 — всегда точный подсчёт
+RECIPE_COUNT_ESTIMATE_THRESHOLD = env.int("RECIPE_COUNT_ESTIMATE_THRESHOLD", default=0)
+
+# Общий для всех воркеров кэш (например, rediscache:// или pymemcache://).
+# По умолчанию — локальный кэш процесса
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# Сколько живёт закэшированный фрагмент рецепта, секунды. Инвалидация идёт
+# сигналами, таймаут ограничивает устаревание при локальном кэше процесса
+RECIPE_FRAGMENT_CACHE_TIMEOUT = env.int("RECIPE_FRAGMENT_CACHE_TIMEOUT", default=300)
+
+# Максимальный возраст индекса ингредиентов в памяти воркера, секунды
+INGREDIENT_INDEX_TTL = env.int("INGREDIENT_INDEX_TTL", default=600)
+# Верхняя граница ?limit= для автодополнения ингредиентов
+INGREDIENT_SEARCH_MAX_LIMIT = env.int("INGREDIENT_SEARCH_MAX_LIMIT", default=100)
+# Минимальная триграммная похожесть для нечёткого поиска ингредиентов
+INGREDIENT_FUZZY_THRESHOLD = env.float("INGREDIENT_FUZZY_THRESHOLD", default=0.15)
+
+# Максимальный возраст индекса «ингредиент → рецепты» в памяти, секунды
+RECIPE_INGREDIENT_INDEX_TTL = env.int("RECIPE_INGREDIENT_INDEX_TTL", default=600)
+# Если по ?ingredients= нашлось больше рецептов, фильтр уходит в базу,
+# а не передаётся списком id в IN (...)
+RECIPE_INGREDIENT_FILTER_MAX_IDS = env.int(
+    "RECIPE_INGREDIENT_FILTER_MAX_IDS", default=10000
+)
+# Сколько рецептов максимум отдаёт /api/recipes/pantry/
+PANTRY_MAX_LIMIT = env.int("PANTRY_MAX_LIMIT", default=50)
+
+# Сколько id максимум в одном пакетном запросе избранного, корзины и подписок
+BULK_ACTION_MAX_IDS = env.int("BULK_ACTION_MAX_IDS", default=100)
+
+# Выгрузка списка покупок: размер порции серверного курсора и шрифт
+# TrueType для PDF (в образе — пакет fonts-dejavu-core)
+SHOPPING_LIST_CHUNK_SIZE = env.int("SHOPPING_LIST_CHUNK_SIZE", default=2000)
+SHOPPING_LIST_PDF_FONT = env.str(
+    "SHOPPING_LIST_PDF_FONT", default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+
+# Потоки для фоновых задач воркера (foodgram.background), 0 — синхронно
+BACKGROUND_WORKERS = env.int("BACKGROUND_WORKERS", default=2)
+
+# Лента подписок: рецепты авторов, у которых подписчиков больше порога,
+# не рассылаются по лентам, а подмешиваются при чтении
+FEED_FANOUT_THRESHOLD = env.int("FEED_FANOUT_THRESHOLD", default=10000)
+FEED_FANOUT_BATCH_SIZE = env.int("FEED_FANOUT_BATCH_SIZE", default=1000)
+# Сколько последних рецептов автора попадает в ленту при подписке
+FEED_BACKFILL_LIMIT = env.int("FEED_BACKFILL_LIMIT", default=100)
+
+# Загрузка изображений в base64: предел размера файла и числа пикселей,
+# и сколько байт временный файл держит в памяти, прежде чем уйти на диск
+IMAGE_UPLOAD_MAX_BYTES = env.int("IMAGE_UPLOAD_MAX_BYTES", default=20 * 2**20)
+IMAGE_UPLOAD_MAX_PIXELS = env.int("IMAGE_UPLOAD_MAX_PIXELS", default=40_000_000)
+IMAGE_UPLOAD_SPOOL_SIZE = env.int("IMAGE_UPLOAD_SPOOL_SIZE", default=2**20)
+
+# Ключ перестановки id в коротких ссылках (posts.short_codes). Смена ключа
+# ломает уже выданные ссылки нового формата
+SHORT_LINK_KEY = env.str("SHORT_LINK_KEY", default=SECRET_KEY)
+# LRU-кэш старых коротких кодов в процессе и сколько помнить неизвестные, секунды
+SHORT_LINK_CACHE_SIZE = env.int("SHORT_LINK_CACHE_SIZE", default=10000)
+SHORT_LINK_NEGATIVE_TTL = env.int("SHORT_LINK_NEGATIVE_TTL", default=300)
+
+# Заголовок Server-Timing с временем SQL, view, сериализации и рендера.
+# Показывает клиентам число запросов к базе, поэтому по умолчанию — как DEBUG
+SERVER_TIMING_HEADER = env.bool("SERVER_TIMING_HEADER", default=DEBUG)
+# Отдавать ли гистограммы по маршрутам на /metrics (формат Prometheus).
+# Закрывать от внешнего мира на уровне прокси
+METRICS_ENDPOINT = env.bool("METRICS_ENDPOINT", default=False)
+
+# Асинхронные версии списка и страницы рецептов, автодополнения ингредиентов
+# и коротких ссылок (api.async_views). Включать только под ASGI-сервером:
+# под WSGI каждый запрос к ним идёт через лишний event loop
+ASYNC_READ_VIEWS = env.bool("ASYNC_READ_VIEWS", default=False)
+
 DJOSER = {
     "LOGIN_FIELD": "email",
 }
@@ -98,6 +175,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "foodgram.wsgi.application"
+ASGI_APPLICATION = "foodgram.asgi.application"
 
 
 # Database
@@ -114,6 +192,30 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: хосты через запятую (host или host:port),
+# остальные параметры подключения — как у основной базы
+for number, replica in enumerate(env.list("POSTGRES_REPLICA_HOSTS", default=[]), 1):
+    replica_host, _, replica_port = replica.partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "PORT": replica_port or DATABASES["default"]["PORT"],
+        # Недоступная реплика не должна надолго задерживать проверку
+        "OPTIONS": {"connect_timeout": 2},
+        # В тестах реплика — зеркало тестовой основной базы
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["foodgram.db_router.ReplicaRouter"]
+# Читать ли с реплик; False — всё из основной базы, даже если реплики заданы
+DATABASE_REPLICA_READS = env.bool("DATABASE_REPLICA_READS", default=True)
+# Сколько секунд после записи клиент читает только из основной базы
+DATABASE_STICKY_SECONDS = env.int("DATABASE_STICKY_SECONDS", default=10)
+# Реплика, отставшая больше чем на столько секунд, не используется
+DATABASE_REPLICA_MAX_LAG = env.float("DATABASE_REPLICA_MAX_LAG", default=5)
+# Как часто каждый воркер проверяет доступность и отставание реплик, секунды
+DATABASE_REPLICA_CHECK_INTERVAL = env.int("DATABASE_REPLICA_CHECK_INTERVAL", default=5)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -0,0 +1,33 @@
+"""Настройки для тестов: SQLite вместо PostgreSQL, всё синхронно.
+
+python manage.py test --settings=foodgram.settings_test
+"""
+import os
+import tempfile
+
+os.environ.setdefault("BASE_URL", "http://testserver")
+
+from foodgram.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "test.sqlite3"),  # noqa: F405
+    },
+    # Реплика — зеркало основной базы; чтение с неё включают тесты роутера
+    "replica1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "test.sqlite3"),  # noqa: F405
+        "TEST": {"MIRROR": "default"},
+    },
+}
+DATABASE_REPLICA_READS = False
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+MEDIA_ROOT = tempfile.mkdtemp(prefix="foodgram-test-media-")
+# Фоновые задачи — в том же потоке, чтобы тесты видели результат сразу
+BACKGROUND_WORKERS = 0
+SERVER_TIMING_HEADER = False
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
+from django.shortcuts import redirect
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -11,7 +12,9 @@ from api.views import (
     SubscribtionsViewSet,
     UserViewSet,
 )
-from posts.models import Recipe
+from api import async_views
+from foodgram.metrics import metrics_view
+from posts import short_codes
 
 router = DefaultRouter()
 router.register("recipes", RecipesViewSet, basename="recipes")
@@ -20,8 +23,11 @@ router.register("users", UserViewSet, basename="users")
 
 
 def short_link_redirect(request, code):
-    recipe = get_object_or_404(Recipe, short_code=code)
-    return redirect(f"/recipes/{recipe.id}/")
+    # Новые коды разбираются без базы; существование рецепта проверит фронтенд
+    recipe_id = short_codes.resolve(code)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
 
 
 urlpatterns = [
@@ -31,5 +37,16 @@ urlpatterns = [
     path("api/", include(router.urls)),
     path("api/auth/", include("djoser.urls.authtoken")),
 ]
+if settings.ASYNC_READ_VIEWS:
+    # Раньше маршрутов роутера: остальные методы и параметры async-вьюхи
+    # сами передают в RecipesViewSet и IngredientsViewSet
+    urlpatterns[1:2] = [
+        path("api/short_link/<str:code>/", async_views.short_link_redirect),
+        path("api/recipes/", async_views.recipes_list),
+        path("api/recipes/<int:pk>/", async_views.recipe_detail),
+        path("api/ingredients/", async_views.ingredients_list),
+    ]
+if settings.METRICS_ENDPOINT:
+    urlpatterns.append(path("metrics", metrics_view))
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -13,7 +13,14 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author", "cooking_time")
+    list_display = (
+        "id",
+        "name",
+        "author",
+        "cooking_time",
+        "favorites_count",
+        "in_carts_count",
+    )
     list_filter = ("author", "cooking_time")
     search_fields = ("name", "author__username")
     ordering = ("id",)
@@ -30,7 +37,16 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ("id", "email", "username", "first_name", "last_name", "is_active")
+    list_display = (
+        "id",
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "recipes_count",
+        "subscribers_count",
+        "is_active",
+    )
     list_filter = ("id", "username", "email", "is_active")
     search_fields = ("email", "username")
     ordering = ("id",)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Увеличивается при изменении формата фрагмента, чтобы не читать старые записи
+RECIPE_FRAGMENT_VERSION = 2
+
+
+def recipe_fragment_key(recipe_id):
+    return f"recipe-fragment:v{RECIPE_FRAGMENT_VERSION}:{recipe_id}"
+
+
+def get_recipe_fragments(recipe_ids):
+    """Закэшированные фрагменты рецептов: {recipe_id: fragment}."""
+    keys = {
+        recipe_fragment_key(recipe_id): recipe_id for recipe_id in recipe_ids
+    }
+    found = cache.get_many(keys.keys())
+    return {keys[key]: fragment for key, fragment in found.items()}
+
+
+async def aget_recipe_fragments(recipe_ids):
+    keys = {
+        recipe_fragment_key(recipe_id): recipe_id for recipe_id in recipe_ids
+    }
+    found = await cache.aget_many(keys.keys())
+    return {keys[key]: fragment for key, fragment in found.items()}
+
+
+def set_recipe_fragments(fragments):
+    cache.set_many(
+        {
+            recipe_fragment_key(recipe_id): fragment
+            for recipe_id, fragment in fragments.items()
+        },
+        timeout=settings.RECIPE_FRAGMENT_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """Сбрасывает фрагменты сейчас и ещё раз после коммита.
+
+    Пока транзакция не закоммичена, параллельный запрос может снова
+    положить в кэш фрагмент из старых данных; повторное удаление после
+    коммита не даёт ему прожить весь RECIPE_FRAGMENT_CACHE_TIMEOUT.
+    """
+    keys = [recipe_fragment_key(recipe_id) for recipe_id in recipe_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,106 @@
+"""Материализованные суммы ингредиентов в корзинах покупок.
+
+Все изменения — дельты {ingredient_id: amount}, которые применяются к
+набору пользователей одним UPDATE с F() и CASE, поэтому параллельные
+изменения корзины не теряются. Вызывать внутри транзакции вместе с
+изменением, которое к ним привело.
+"""
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from posts.models import RecipeIngredient, ShoppingCart, ShoppingCartIngredient
+
+
+def recipe_amounts(recipe_id):
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .order_by()
+        .values_list("ingredient_id", "amount")
+    )
+
+
+def apply_delta(user_ids, delta):
+    """Прибавляет delta к суммам ингредиентов всех user_ids."""
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items()
+        if amount
+    }
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+
+    # Недостающие строки создаются с нулём, дальше всё делает UPDATE
+    ShoppingCartIngredient.objects.bulk_create(
+        [
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id
+            )
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0
+        ],
+        ignore_conflicts=True,
+    )
+    rows = ShoppingCartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta.keys()
+    )
+    rows.update(
+        total_amount=F("total_amount")
+        + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in delta.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    if any(amount < 0 for amount in delta.values()):
+        rows.filter(total_amount__lte=0).delete()
+
+
+def recipes_amounts(recipe_ids):
+    """Суммы ингредиентов нескольких рецептов одним запросом."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values("ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("ingredient_id", "total")
+    )
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_delta([user_id], recipes_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    amounts = recipes_amounts(recipe_ids)
+    apply_delta([user_id], {pk: -amount for pk, amount in amounts.items()})
+
+
+def recipe_changed(recipe_id, old_amounts, new_amounts):
+    """Переносит правку ингредиентов рецепта в корзины, где он лежит."""
+    delta = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    user_ids = ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+        "user_id", flat=True
+    )
+    apply_delta(user_ids, delta)
+
+
+def actual_totals(user_ids):
+    """Суммы заново по корзинам: {(user_id, ingredient_id): total}."""
+    rows = (
+        RecipeIngredient.objects.filter(recipe__in_carts__user_id__in=user_ids)
+        .order_by()
+        .values("recipe__in_carts__user_id", "ingredient_id")
+        .annotate(total=Sum("amount"))
+    )
+    return {
+        (row["recipe__in_carts__user_id"], row["ingredient_id"]): row["total"]
+        for row in rows
+    }
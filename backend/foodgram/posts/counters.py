@@ -0,0 +1,116 @@
+"""Денормализованные счётчики пользователей и рецептов.
+
+User.recipes_count, User.subscribers_count, Recipe.favorites_count и
+Recipe.in_carts_count меняются одним UPDATE с F() в той же транзакции,
+что и запись, которая к этому привела. Расхождения (каскадные удаления,
+правки через shell) чинит команда recompute_counters.
+
+Модели здесь указаны строками: миксин CounterFieldsMixin импортируют
+сами posts.models и users.models.
+"""
+from django.apps import apps
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Модель -> {счётчик: (модель, по строкам которой он считается, поле-ссылка)}
+COUNTERS = {
+    "users.User": {
+        "recipes_count": ("posts.Recipe", "author"),
+        "subscribers_count": ("users.Subscription", "author"),
+    },
+    "posts.Recipe": {
+        "favorites_count": ("posts.Favourite", "recipe"),
+        "in_carts_count": ("posts.ShoppingCart", "recipe"),
+    },
+}
+
+
+class CounterFieldsMixin:
+    """Полный save() не перезаписывает счётчики из counter_fields.
+
+    Счётчики меняются только UPDATE с F() (adjust), а экземпляр в памяти
+    может быть загружен до этого и хранить устаревшие значения. Если
+    update_fields не передан, а строка уже есть в базе, save() обновляет
+    все загруженные поля, кроме счётчиков. Отложенные поля не читаются,
+    а сохранение удалённой тем временем строки падает с DatabaseError,
+    как при явном update_fields, вместо того чтобы вставить её заново.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            self.pk is not None
+            and not self._state.adding
+            and not args
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+def counters_of(model):
+    """{счётчик: (модель-источник, поле-ссылка)} для модели со счётчиками."""
+    return {
+        field: (apps.get_model(source), link)
+        for field, (source, link) in COUNTERS[model._meta.label].items()
+    }
+
+
+def adjust(model, pks, **deltas):
+    """Прибавляет deltas к счётчикам строк pks, например recipes_count=1."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def actual_count(source, link):
+    """Подзапрос с реальным числом строк source, ссылающихся на pk."""
+    rows = (
+        source.objects.filter(**{link: OuterRef("pk")})
+        .order_by()
+        .values(link)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def actual_counts(model, pks):
+    """Хранимые и реальные значения: {pk: {field: (stored, actual)}}."""
+    counters = counters_of(model)
+    rows = (
+        model.objects.filter(pk__in=pks)
+        .order_by()
+        .annotate(
+            **{
+                f"actual_{field}": actual_count(source, link)
+                for field, (source, link) in counters.items()
+            }
+        )
+        .values("pk", *counters, *(f"actual_{field}" for field in counters))
+    )
+    return {
+        row["pk"]: {
+            field: (row[field], row[f"actual_{field}"]) for field in counters
+        }
+        for row in rows
+    }
+
+
+def recompute(model, pks):
+    """Перезаписывает счётчики строк pks реальными значениями."""
+    model.objects.filter(pk__in=pks).update(
+        **{
+            field: actual_count(source, link)
+            for field, (source, link) in counters_of(model).items()
+        }
+    )
@@ -0,0 +1,153 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт пачками раскладывается в TimelineEntry каждого подписчика
+(fan-out on write) в фоновом потоке. Авторы, у которых подписчиков больше
+FEED_FANOUT_THRESHOLD, не рассылаются: их рецепты подмешиваются при
+чтении. Лента читается keyset-пагинацией по (pub_date, id).
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from posts.models import Recipe, TimelineEntry
+from users.models import Subscription, User
+
+CELEBRITIES_KEY = "feed:celebrities"
+CELEBRITIES_TIMEOUT = 300
+
+
+def celebrity_author_ids():
+    """Авторы, чьи рецепты подмешиваются при чтении, а не рассылаются."""
+    authors = cache.get(CELEBRITIES_KEY)
+    if authors is None:
+        authors = set(
+            User.objects.filter(
+                subscribers_count__gt=settings.FEED_FANOUT_THRESHOLD
+            ).values_list("id", flat=True)
+        )
+        cache.set(CELEBRITIES_KEY, authors, timeout=CELEBRITIES_TIMEOUT)
+    return authors
+
+
+def is_celebrity(author_id):
+    return User.objects.filter(
+        id=author_id, subscribers_count__gt=settings.FEED_FANOUT_THRESHOLD
+    ).exists()
+
+
+def fan_out_recipe(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора."""
+    recipe = (
+        Recipe.objects.filter(id=recipe_id)
+        .only("id", "author_id", "pub_date")
+        .first()
+    )
+    if recipe is None or is_celebrity(recipe.author_id):
+        return
+
+    followers = (
+        Subscription.objects.filter(author_id=recipe.author_id)
+        .order_by("id")
+        .values_list("subscriber_id", flat=True)
+        .iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE)
+    )
+    while True:
+        batch = list(islice(followers, settings.FEED_FANOUT_BATCH_SIZE))
+        if not batch:
+            break
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe.id,
+                    author_id=recipe.author_id,
+                    pub_date=recipe.pub_date,
+                )
+                for user_id in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def backfill_subscription(user_id, author_id):
+    """После подписки кладёт в ленту последние рецепты автора."""
+    if is_celebrity(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        "-pub_date", "-id"
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes.values_list("id", "pub_date")[
+                : settings.FEED_BACKFILL_LIMIT
+            ]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove_subscription(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def _keyset(queryset, cursor, id_field):
+    """Условие и порядок keyset-пагинации по (pub_date, id_field)."""
+    if cursor is None:
+        return queryset.order_by("-pub_date", f"-{id_field}")
+
+    pub_date, pk, reverse = cursor
+    if reverse:
+        return queryset.filter(
+            Q(pub_date__gt=pub_date)
+            | Q(pub_date=pub_date, **{f"{id_field}__gt": pk})
+        ).order_by("pub_date", id_field)
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f"{id_field}__lt": pk})
+    ).order_by("-pub_date", f"-{id_field}")
+
+
+def feed_recipe_ids(user, cursor, size):
+    """id рецептов следующей страницы ленты (не больше size).
+
+    Слияние записей ленты и рецептов «звёздных» авторов. Записи берутся
+    только по текущим подпискам, так что отставшая рассылка не покажет
+    рецепты автора, от которого пользователь уже отписался.
+    """
+    followed = set(user.subscriptions.values_list("author_id", flat=True))
+    if not followed:
+        return []
+    celebrities = followed & celebrity_author_ids()
+
+    entries = _keyset(
+        TimelineEntry.objects.filter(user=user, author_id__in=followed),
+        cursor,
+        "recipe_id",
+    ).values_list("pub_date", "recipe_id")[:size]
+    sources = [list(entries)]
+    if celebrities:
+        recipes = _keyset(
+            Recipe.objects.filter(author_id__in=celebrities), cursor, "id"
+        ).values_list("pub_date", "id")[:size]
+        sources.append(list(recipes))
+
+    reverse = cursor is not None and cursor[2]
+    merged = heapq.merge(*sources, reverse=not reverse)
+    recipe_ids = []
+    for _, recipe_id in merged:
+        if recipe_id not in recipe_ids:
+            recipe_ids.append(recipe_id)
+        if len(recipe_ids) == size:
+            break
+    return recipe_ids
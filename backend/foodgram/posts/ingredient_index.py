@@ -0,0 +1,265 @@
+"""Индекс справочника ингредиентов в памяти воркера для автодополнения.
+
+Справочник маленький и почти не меняется, поэтому поиск по префиксу идёт
+по отсортированному массиву ключей через bisect и не ходит в базу.
+Индекс пересобирается, когда в кэше меняется номер версии (его увеличивают
+сигналы на изменение Ingredient), и не реже чем раз в INGREDIENT_INDEX_TTL.
+
+Нечёткий поиск (опечатки, вхождение в середине названия) на PostgreSQL
+идёт через pg_trgm и GIN-индекс, на остальных базах — по триграммам
+этого же индекса.
+"""
+import bisect
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import (
+    Case,
+    F,
+    IntegerField,
+    Lookup,
+    Q,
+    Value,
+    When,
+)
+
+from foodgram.db_router import primary
+from posts.models import Ingredient
+
+VERSION_KEY = "ingredient-index-version"
+
+_lock = threading.Lock()
+_index = None
+
+
+def fold(text):
+    """Ключ поиска: нижний регистр, ё заменена на е."""
+    return text.lower().replace("ё", "е")
+
+
+def trigrams(text):
+    """Триграммы как в pg_trgm: каждое слово дополняется пробелами."""
+    grams = set()
+    for word in re.findall(r"\w+", fold(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class IngredientIndex:
+    def __init__(self, rows, version=0):
+        rows = sorted(rows, key=lambda row: (fold(row[1]), row[1], row[0]))
+        self.keys = [fold(name) for _, name, _ in rows]
+        self.names = [name for _, name, _ in rows]
+        self.ids = array("q", (pk for pk, _, _ in rows))
+        # Единиц измерения единицы штук, храним номер вместо строки
+        self.units = tuple(sorted({unit for _, _, unit in rows}))
+        unit_numbers = {unit: number for number, unit in enumerate(self.units)}
+        self.unit_numbers = array(
+            "H", (unit_numbers[unit] for _, _, unit in rows)
+        )
+        self.version = version
+        self.built_at = time.monotonic()
+        self._postings = None
+        self._positions = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, чьё название начинается с prefix (не более limit)."""
+        prefix = fold(prefix)
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+
+        return [self.item(position) for position in range(start, end)]
+
+    def fuzzy_search(self, query, limit, threshold):
+        """Совпадения по подстроке и по триграммам, префиксные — первыми."""
+        query = fold(query)
+        query_grams = trigrams(query)
+        if not query:
+            return []
+
+        postings, gram_counts = self.postings()
+        common = Counter()
+        for gram in query_grams:
+            for position in postings.get(gram, ()):
+                common[position] += 1
+
+        scores = {}
+        for position, shared in common.items():
+            union = len(query_grams) + gram_counts[position] - shared
+            scores[position] = shared / union
+        for position, key in enumerate(self.keys):
+            if query in key:
+                scores.setdefault(position, 0.0)
+
+        matches = [
+            position
+            for position, score in scores.items()
+            if score >= threshold or query in self.keys[position]
+        ]
+        matches.sort(
+            key=lambda position: (
+                not self.keys[position].startswith(query),
+                -scores[position],
+                self.keys[position],
+            )
+        )
+        return [self.item(position) for position in matches[:limit]]
+
+    def postings(self):
+        """Инвертированный индекс триграмм, строится при первом обращении."""
+        if self._postings is None:
+            postings = {}
+            gram_counts = array("H")
+            for position, key in enumerate(self.keys):
+                grams = trigrams(key)
+                gram_counts.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, array("I")).append(position)
+            self._postings = postings, gram_counts
+        return self._postings
+
+    def by_ids(self, ingredient_ids):
+        """Ингредиенты по id в порядке ingredient_ids, без неизвестных."""
+        if self._positions is None:
+            self._positions = {
+                pk: position for position, pk in enumerate(self.ids)
+            }
+        return [
+            self.item(self._positions[pk])
+            for pk in ingredient_ids
+            if pk in self._positions
+        ]
+
+    def item(self, position):
+        return {
+            "id": self.ids[position],
+            "name": self.names[position],
+            "measurement_unit": self.units[self.unit_numbers[position]],
+        }
+
+
+def build_index(version=0):
+    rows = Ingredient.objects.values_list("id", "name", "measurement_unit")
+    with primary():
+        return IngredientIndex(rows.iterator(), version)
+
+
+def get_index():
+    """Актуальный индекс процесса, при необходимости пересобранный."""
+    global _index
+
+    version = cache.get(VERSION_KEY, 0)
+    index = _index
+    if index is not None and not _is_stale(index, version):
+        return index
+
+    with _lock:
+        index = _index
+        if index is None or _is_stale(index, version):
+            index = build_index(version)
+            _index = index
+    return index
+
+
+async def aget_index():
+    """То же для async-вью; пересборка — в потоке через sync_to_async."""
+    global _index
+
+    version = await cache.aget(VERSION_KEY, 0)
+    index = _index
+    if index is None or _is_stale(index, version):
+        # values_list().aiterator() в Django 4.2 не работает из event loop.
+        # В одном event loop параллельная пересборка лишь повторит работу
+        index = await sync_to_async(build_index)(version)
+        _index = index
+    return index
+
+
+def _is_stale(index, version):
+    age = time.monotonic() - index.built_at
+    return index.version != version or age > settings.INGREDIENT_INDEX_TTL
+
+
+def invalidate_index():
+    """Просит все процессы пересобрать индекс при следующем запросе."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def warm_up():
+    """Сборка индекса при старте воркера. До миграций просто откладывается."""
+    try:
+        get_index()
+    except DatabaseError:
+        pass
+
+
+class ILike(Lookup):
+    """name ILIKE pattern без UPPER(): такое условие обслуживает GIN-индекс.
+
+    Встроенные icontains и istartswith на PostgreSQL превращаются в
+    UPPER("name"::text) LIKE UPPER(%s), а индекс gin_trgm_ops построен по
+    самому столбцу, и вместе с %> такой фильтр читает всю таблицу.
+    """
+
+    lookup_name = "ilike"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} ILIKE {rhs}", [*lhs_params, *rhs_params]
+
+
+def fuzzy_queryset(query):
+    """Запрос нечёткого поиска для PostgreSQL, без LIMIT."""
+    pattern = connection.ops.prep_for_like_query(query)
+    return (
+        Ingredient.objects.filter(
+            Q(ILike(F("name"), f"%{pattern}%"))
+            | Q(name__trigram_word_similar=query)
+        )
+        .annotate(
+            prefix_rank=Case(
+                When(ILike(F("name"), f"{pattern}%"), then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ),
+            similarity=TrigramWordSimilarity(query, "name"),
+        )
+        .order_by("prefix_rank", "-similarity", "name")
+        .values("id", "name", "measurement_unit")
+    )
+
+
+def fuzzy_search(query, limit):
+    """Поиск с опечатками и по вхождению, не более limit результатов."""
+    threshold = settings.INGREDIENT_FUZZY_THRESHOLD
+    if connection.vendor != "postgresql":
+        return get_index().fuzzy_search(query, limit, threshold)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Порог оператора %>, по которому работает GIN-индекс
+            cursor.execute(
+                "SELECT set_config("
+                "'pg_trgm.word_similarity_threshold', %s, true)",
+                [str(threshold)],
+            )
+        return list(fuzzy_queryset(query)[:limit])
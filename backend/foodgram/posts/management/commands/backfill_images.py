@@ -0,0 +1,83 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from foodgram import images
+from posts.models import Recipe
+from users.models import User
+
+SOURCES = {
+    "recipes": (Recipe, "image"),
+    "avatars": (User, "avatar"),
+}
+
+
+def process(model_label, pk, field_name, name, force):
+    try:
+        return images.process_image(model_label, pk, field_name, name, force)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит существующие изображения на хранение по хешу и строит "
+        "производные размеры; параллельно в нескольких процессах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", nargs="*", choices=list(SOURCES), help="По умолчанию всё"
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересобрать производные, даже если они уже есть",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        tasks = []
+        for source in options["only"] or SOURCES:
+            model, field_name = SOURCES[source]
+            rows = (
+                model.objects.exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list("pk", field_name)
+            )
+            # Готовые (по хешу и с производными) process_image пропускает сам,
+            # так подхватываются и те, где воркер упал на середине
+            tasks.extend(
+                (model._meta.label, pk, field_name, name)
+                for pk, name in rows.iterator()
+            )
+        self.stdout.write(f"Изображений к обработке: {len(tasks)}")
+        if options["dry_run"] or not tasks:
+            return
+
+        # Дочерние процессы наследуют сокеты соединений — закрываем до fork
+        connections.close_all()
+        started = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = [
+                executor.submit(process, *task, options["force"])
+                for task in tasks
+            ]
+            for future in as_completed(futures):
+                if future.result() is None:
+                    failed += 1
+                done += 1
+                if done % 100 == 0:
+                    self.stderr.write(f"Обработано: {done}/{len(tasks)}")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: {done} за {elapsed:.1f} с, "
+                f"битых или пропавших: {failed}"
+            )
+        )
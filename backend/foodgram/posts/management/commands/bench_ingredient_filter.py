@@ -0,0 +1,95 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from posts.models import Recipe, RecipeIngredient
+from posts.recipe_ingredient_index import RecipeIngredientIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет фильтр рецептов по ингредиентам на инвертированном индексе. "
+        "По умолчанию на синтетических данных, с --orm — ещё и на базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--recipes", type=int, default=100_000)
+        parser.add_argument("--ingredients", type=int, default=2_200)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--orm", action="store_true", help="Сравнить с JOIN по базе"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        if options["orm"]:
+            pairs = list(
+                RecipeIngredient.objects.values_list(
+                    "recipe_id", "ingredient_id"
+                )
+            )
+        else:
+            pairs = self.synthetic_pairs(rng, options)
+
+        started = time.perf_counter()
+        index = RecipeIngredientIndex(pairs)
+        self.stdout.write(
+            f"Индекс: {len(index)} связей, "
+            f"{len(index.postings)} ингредиентов, "
+            f"{index.nbytes() / 2**20:.1f} МиБ, сборка "
+            f"{time.perf_counter() - started:.2f} с"
+        )
+
+        ingredient_ids = list(index.postings)
+        if not ingredient_ids:
+            return
+        queries = [
+            rng.sample(
+                ingredient_ids, min(len(ingredient_ids), rng.randint(2, 4))
+            )
+            for _ in range(options["queries"])
+        ]
+
+        self.report("index all", queries, index.match_all)
+        self.report("index any", queries, index.match_any)
+        if options["orm"]:
+            self.report("orm all", queries[:20], self.orm_match_all)
+
+    def synthetic_pairs(self, rng, options):
+        # Популярность ингредиентов неравномерная, как в настоящих рецептах
+        weights = [1 / (rank + 1) for rank in range(options["ingredients"])]
+        per_recipe = max(1, options["rows"] // options["recipes"])
+        population = range(1, options["ingredients"] + 1)
+        for recipe_id in range(1, options["recipes"] + 1):
+            for ingredient_id in set(
+                rng.choices(population, weights, k=per_recipe)
+            ):
+                yield recipe_id, ingredient_id
+
+    def orm_match_all(self, ingredient_ids):
+        queryset = Recipe.objects.all()
+        for ingredient_id in ingredient_ids:
+            queryset = queryset.filter(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"), ingredient_id=ingredient_id
+                    )
+                )
+            )
+        return list(queryset.values_list("id", flat=True))
+
+    def report(self, title, queries, match):
+        timings = []
+        for ingredient_ids in queries:
+            started = time.perf_counter()
+            match(ingredient_ids)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1000
+        p99 = timings[int(len(timings) * 0.99)] * 1000
+        self.stdout.write(f"{title:10} p50={p50:.2f} мс  p99={p99:.2f} мс")
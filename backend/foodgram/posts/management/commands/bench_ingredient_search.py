@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.ingredient_index import build_index
+from posts.models import Ingredient
+
+DEFAULT_PREFIXES = ["а", "мо", "мук", "сыр", "яй", "к", "помидор", "ёж", "х"]
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поиск ингредиентов по префиксу: индекс в памяти и ORM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("prefixes", nargs="*", default=DEFAULT_PREFIXES)
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        limit = options["limit"]
+        prefixes = options["prefixes"]
+
+        started = time.perf_counter()
+        index = build_index()
+        build_time = time.perf_counter() - started
+        self.stdout.write(
+            f"Индекс: {len(index)} ингредиентов, "
+            f"сборка {build_time * 1000:.1f} мс"
+        )
+
+        def orm_search(prefix):
+            qs = Ingredient.objects.filter(name__startswith=prefix)
+            if limit is not None:
+                qs = qs[:limit]
+            return list(qs.values("id", "name", "measurement_unit"))
+
+        for title, search in (
+            ("index", lambda prefix: index.search(prefix, limit)),
+            ("orm", orm_search),
+        ):
+            timings = []
+            for prefix in prefixes:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    search(prefix)
+                    timings.append(time.perf_counter() - started)
+            timings.sort()
+            p50 = timings[len(timings) // 2] * 1e6
+            p99 = timings[int(len(timings) * 0.99)] * 1e6
+            self.stdout.write(
+                f"{title:6} p50={p50:.1f} мкс  p99={p99:.1f} мкс"
+            )
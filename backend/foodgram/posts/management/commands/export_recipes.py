@@ -0,0 +1,112 @@
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from posts.models import Recipe, RecipeIngredient
+
+
+def recipe_record(recipe):
+    """Рецепт одной строкой NDJSON; ингредиенты — по (name, unit), не по id."""
+    return {
+        "short_code": recipe.short_code,
+        "author": {
+            "email": recipe.author.email,
+            "username": recipe.author.username,
+            "first_name": recipe.author.first_name,
+            "last_name": recipe.author.last_name,
+        },
+        "name": recipe.name,
+        "text": recipe.text,
+        "cooking_time": recipe.cooking_time,
+        "pub_date": recipe.pub_date.isoformat(),
+        "image": recipe.image.name or None,
+        "ingredients": [
+            {
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.recipeingredient_set.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Выгружает рецепты в NDJSON (по рецепту на строку)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            "-o",
+            default="-",
+            help="Файл NDJSON, по умолчанию stdout",
+        )
+        parser.add_argument(
+            "--images-dir",
+            help="Куда скопировать картинки рецептов (отдельно от NDJSON)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        images_dir = (
+            Path(options["images_dir"]) if options["images_dir"] else None
+        )
+
+        # Серверный курсор порциями по batch_size, ингредиенты —
+        # одним запросом на порцию
+        recipes = (
+            Recipe.objects.select_related("author")
+            .prefetch_related(
+                Prefetch(
+                    "recipeingredient_set",
+                    queryset=RecipeIngredient.objects.select_related(
+                        "ingredient"
+                    ),
+                )
+            )
+            .defer("search_vector")
+            .order_by("id")
+            .iterator(chunk_size=options["batch_size"])
+        )
+
+        if options["output"] == "-":
+            self.export(recipes, sys.stdout, images_dir, options["batch_size"])
+        else:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                self.export(recipes, output, images_dir, options["batch_size"])
+
+    def export(self, recipes, output, images_dir, report_every):
+        started = time.perf_counter()
+        exported = 0
+        for recipe in recipes:
+            output.write(json.dumps(recipe_record(recipe), ensure_ascii=False))
+            output.write("\n")
+            if images_dir is not None and recipe.image:
+                self.copy_image(recipe.image.name, images_dir)
+            exported += 1
+            if exported % report_every == 0:
+                self.report(exported, started)
+        self.report(exported, started, done=True)
+
+    def copy_image(self, name, images_dir):
+        target = images_dir / name
+        if target.exists() or not default_storage.exists(name):
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with default_storage.open(name, "rb") as source, open(
+            target, "wb"
+        ) as dest:
+            shutil.copyfileobj(source, dest)
+
+    def report(self, count, started, done=False):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        prefix = "Готово, выгружено" if done else "Выгружено"
+        # В stderr, чтобы не смешивать с выгрузкой в stdout
+        self.stderr.write(f"{prefix} рецептов: {count} ({rate:.0f}/с)")
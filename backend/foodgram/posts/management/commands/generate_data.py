@@ -0,0 +1,248 @@
+import io
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import short_codes
+from posts.models import (
+    Favourite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from posts.recipe_ingredient_index import reset_index
+from users.models import Subscription, User
+
+WORDS = (
+    "суп салат пирог каша запеканка рагу омлет паста курица говядина грибы "
+    "сыр томаты картофель тыква шоколад ягоды яблоки рис фасоль"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует тестовые данные пачками: пользователей, рецепты, "
+        "ингредиенты рецептов, избранное, корзины и подписки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10_000)
+        parser.add_argument(
+            "--ingredients-per-recipe", type=int, default=8, help="В среднем"
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="В среднем на пользователя",
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5, help="В среднем на пользователя"
+        )
+        parser.add_argument(
+            "--subscriptions",
+            type=int,
+            default=10,
+            help="В среднем на пользователя",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        # Метка запуска: повторный запуск не упирается в уникальные поля
+        self.run = uuid.uuid4().hex[:6]
+
+        if not Ingredient.objects.exists():
+            call_command("load_ingredients", stdout=self.stdout)
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+
+        user_ids = self.step(
+            "Пользователи", self.create_users, options["users"]
+        )
+        recipe_ids = self.step(
+            "Рецепты", self.create_recipes, options["recipes"], user_ids
+        )
+        self.step(
+            "Ингредиенты рецептов",
+            self.create_recipe_ingredients,
+            recipe_ids,
+            ingredient_ids,
+            options["ingredients_per_recipe"],
+        )
+        self.step(
+            "Избранное",
+            self.create_links,
+            Favourite,
+            "user_id",
+            "recipe_id",
+            user_ids,
+            recipe_ids,
+            options["favorites"],
+        )
+        self.step(
+            "Корзины",
+            self.create_links,
+            ShoppingCart,
+            "user_id",
+            "recipe_id",
+            user_ids,
+            recipe_ids,
+            options["carts"],
+        )
+        self.step(
+            "Подписки",
+            self.create_links,
+            Subscription,
+            "subscriber_id",
+            "author_id",
+            user_ids,
+            user_ids,
+            options["subscriptions"],
+        )
+
+        # bulk_create минует сигналы: пересчитываем всё производное,
+        # подробный вывод команд не нужен
+        quiet = io.StringIO()
+        self.step("Счётчики", call_command, "recompute_counters", stdout=quiet)
+        self.step(
+            "Суммы корзин",
+            call_command,
+            "reconcile_shopping_carts",
+            stdout=quiet,
+        )
+        self.step(
+            "Рейтинги", call_command, "refresh_popular", "--full", stdout=quiet
+        )
+        reset_index()
+
+    def step(self, title, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        count = len(result) if isinstance(result, list) else result
+        count = f": {count}" if isinstance(count, int) else ""
+        self.stdout.write(f"{title}{count} ({elapsed:.1f} с)")
+        return result
+
+    def bulk(self, model, objects):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size], ignore_conflicts=True
+            )
+
+    def past(self, days=30):
+        return self.now - timedelta(
+            seconds=self.random.randint(0, days * 86400)
+        )
+
+    def create_users(self, count):
+        # Хеш считается один раз: пароль у всех одинаковый
+        password = make_password("benchmark-password")
+        self.bulk(
+            User,
+            [
+                User(
+                    email=f"bench-{self.run}-{number}@example.com",
+                    username=f"bench-{self.run}-{number}",
+                    first_name="Имя",
+                    last_name="Фамилия",
+                    password=password,
+                )
+                for number in range(count)
+            ],
+        )
+        return list(
+            User.objects.filter(username__startswith=f"bench-{self.run}-")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def create_recipes(self, count, user_ids):
+        recipes = [
+            Recipe(
+                author_id=self.random.choice(user_ids),
+                name=(
+                    f"{' '.join(self.random.sample(WORDS, 3))} "
+                    f"{self.run}-{number}"
+                ),
+                text=" ".join(self.random.choices(WORDS, k=40)),
+                cooking_time=self.random.randint(5, 240),
+                short_code=f"{self.run}{number:x}",
+            )
+            for number in range(count)
+        ]
+        self.bulk(Recipe, recipes)
+        # Разносим даты публикации, иначе у всех рецептов одна и та же.
+        # Временный код с меткой запуска заменяется кодом от id
+        recipe_ids = list(
+            Recipe.objects.filter(short_code__startswith=self.run)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        dated = [
+            Recipe(
+                id=pk,
+                pub_date=self.past(365),
+                short_code=short_codes.encode(pk),
+            )
+            for pk in recipe_ids
+        ]
+        # UPDATE с CASE на тысячи веток медленный, поэтому пачки поменьше
+        Recipe.objects.bulk_update(
+            dated, ["pub_date", "short_code"], batch_size=500
+        )
+        return recipe_ids
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids, average):
+        rows = []
+        for recipe_id in recipe_ids:
+            size = max(
+                1, min(len(ingredient_ids), int(self.random.gauss(average, 2)))
+            )
+            for ingredient_id in self.random.sample(ingredient_ids, size):
+                rows.append(
+                    RecipeIngredient(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 500),
+                    )
+                )
+            if len(rows) >= self.batch_size:
+                self.bulk(RecipeIngredient, rows)
+                rows = []
+        self.bulk(RecipeIngredient, rows)
+
+    def create_links(
+        self, model, owner_field, target_field, owners, targets, average
+    ):
+        """Случайные связи owner -> target, возвращает их число."""
+        rows, total = [], 0
+        for owner_id in owners:
+            size = min(len(targets), int(self.random.expovariate(1 / average)))
+            # Квадрат равномерной величины: первые цели заметно популярнее
+            chosen = {
+                targets[int(self.random.random() ** 2 * len(targets))]
+                for _ in range(size)
+            }
+            chosen.discard(owner_id if owners is targets else None)
+            rows.extend(
+                model(**{owner_field: owner_id, target_field: target_id})
+                for target_id in chosen
+            )
+            if len(rows) >= self.batch_size:
+                total += len(rows)
+                self.bulk(model, rows)
+                rows = []
+        self.bulk(model, rows)
+        return total + len(rows)
@@ -0,0 +1,120 @@
+import csv
+import hashlib
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.ingredient_index import invalidate_index
+from posts.models import DataImport, Ingredient
+
+SOURCE = "ingredients"
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as f:
+        for item in json.load(f):
+            yield item["name"], item["measurement_unit"]
+
+
+READERS = {".csv": read_csv, ".json": read_json}
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает справочник ингредиентов из CSV или JSON "
+        "(повторно — без изменений)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=str(settings.BASE_DIR / "ingredients.csv"),
+            help="Файл ingredients.csv или ingredients.json",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Загрузить, даже если файл не менялся",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f"Неизвестный формат файла: {path.name}")
+        if not path.exists():
+            raise CommandError(f"Файл не найден: {path}")
+
+        started = time.perf_counter()
+        checksum = file_checksum(path)
+        last = DataImport.objects.filter(source=SOURCE).first()
+        if (
+            last is not None
+            and last.checksum == checksum
+            and not options["force"]
+        ):
+            self.stdout.write(
+                f"{path.name} не изменился с прошлой загрузки, пропуск"
+            )
+            return
+
+        with transaction.atomic():
+            before = Ingredient.objects.count()
+            total = self.load(reader(path), options["batch_size"])
+            inserted = Ingredient.objects.count() - before
+            DataImport.objects.update_or_create(
+                source=SOURCE, defaults={"checksum": checksum}
+            )
+        if inserted:
+            invalidate_index()
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк в файле: {total}, добавлено: {inserted}, "
+                f"уже было: {total - inserted} ({elapsed:.0f} мс)"
+            )
+        )
+
+    def load(self, rows, batch_size):
+        """Вставляет пачками, существующие пары (name, unit) пропускает."""
+        seen = set()
+        unique_rows = (
+            pair
+            for pair in ((name.strip(), unit.strip()) for name, unit in rows)
+            if all(pair) and pair not in seen and not seen.add(pair)
+        )
+        while True:
+            batch = list(islice(unique_rows, batch_size))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch
+                ],
+                ignore_conflicts=True,
+            )
+        return len(seen)
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from posts import short_codes
+from posts.models import LegacyShortCode, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит рецепты на короткие коды нового формата; старые коды "
+        "сохраняются в LegacyShortCode, и выданные ссылки продолжают работать"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, что изменится",
+        )
+
+    def handle(self, *args, **options):
+        checked = converted = kept = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                Recipe.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "short_code")[: options["batch_size"]]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            checked += len(rows)
+
+            changed = [
+                (pk, code, short_codes.encode(pk))
+                for pk, code in rows
+                if code != short_codes.encode(pk)
+            ]
+            legacy = [
+                LegacyShortCode(code=code, recipe_id=pk)
+                for pk, code, _ in changed
+                if code
+            ]
+            converted += len(changed)
+            kept += len(legacy)
+            if options["dry_run"] or not changed:
+                continue
+
+            with transaction.atomic():
+                LegacyShortCode.objects.bulk_create(
+                    legacy, ignore_conflicts=True
+                )
+                # Код нового формата может быть занят рецептом, которому его
+                # ошибочно присвоили (старый импорт переносил коды из другой
+                # базы), в том числе из этой же порции. Такой код всё равно
+                # разбирается в id владельца, поэтому сначала коды
+                # сбрасываются, а занявший получит свой в своей порции
+                Recipe.objects.filter(
+                    Q(pk__in=[pk for pk, _, _ in changed])
+                    | Q(short_code__in=[new for _, _, new in changed])
+                ).update(short_code=None)
+                Recipe.objects.bulk_update(
+                    [Recipe(pk=pk, short_code=new) for pk, _, new in changed],
+                    ["short_code"],
+                )
+            self.stderr.write(f"Обработано рецептов: {checked}")
+
+        action = "будет переведено" if options["dry_run"] else "переведено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Рецептов: {checked}, {action}: {converted}, "
+                f"старых кодов сохранено: {kept}"
+            )
+        )
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import capfirst
+
+from posts import counters
+from posts.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики пользователей и рецептов и чинит расхождения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения",
+        )
+
+    def handle(self, *args, **options):
+        for model in (User, Recipe):
+            checked, drifted = self.recompute_model(
+                model, options["batch_size"], options["dry_run"]
+            )
+            action = "найдено" if options["dry_run"] else "исправлено"
+            title = capfirst(model._meta.verbose_name_plural)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{title}: проверено {checked}, "
+                    f"{action} расхождений: {drifted}"
+                )
+            )
+
+    def recompute_model(self, model, batch_size, dry_run):
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+
+            with transaction.atomic():
+                # Блокируем пачку, чтобы не затереть параллельные
+                # F()-обновления
+                list(
+                    model.objects.select_for_update()
+                    .filter(pk__in=pks)
+                    .only("pk")
+                )
+                wrong = self.drifted(model, pks)
+                if wrong and not dry_run:
+                    counters.recompute(model, wrong)
+            drifted += len(wrong)
+        return checked, drifted
+
+    def drifted(self, model, pks):
+        wrong = []
+        for pk, values in counters.actual_counts(model, pks).items():
+            diffs = {
+                field: (stored, actual)
+                for field, (stored, actual) in values.items()
+                if stored != actual
+            }
+            if diffs:
+                wrong.append(pk)
+            for field, (stored, actual) in diffs.items():
+                self.stdout.write(
+                    f"{model._meta.verbose_name} {pk}: "
+                    f"{field} {stored} -> {actual}"
+                )
+        return wrong
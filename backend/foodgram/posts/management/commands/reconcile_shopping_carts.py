@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.cart_totals import actual_totals
+from posts.models import ShoppingCart, ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает суммы ингредиентов в корзинах и чинит расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list("user_id", flat=True))
+            | set(
+                ShoppingCartIngredient.objects.values_list(
+                    "user_id", flat=True
+                )
+            )
+        )
+
+        drifted_users = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                drifted = self.reconcile(batch, options["dry_run"])
+            drifted_users += len(drifted)
+            for user_id in drifted:
+                self.stdout.write(
+                    f"Расхождение в корзине пользователя {user_id}"
+                )
+
+        action = "найдено" if options["dry_run"] else "исправлено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проверено пользователей: {len(user_ids)}, {action} "
+                f"расхождений: {drifted_users}"
+            )
+        )
+
+    def reconcile(self, user_ids, dry_run):
+        expected = actual_totals(user_ids)
+        rows = ShoppingCartIngredient.objects.select_for_update().filter(
+            user_id__in=user_ids
+        )
+        stored = {
+            (row.user_id, row.ingredient_id): row.total_amount
+            for row in rows
+            if row.total_amount
+        }
+
+        drifted = {
+            user_id
+            for user_id, ingredient_id in expected.keys() | stored.keys()
+            if expected.get((user_id, ingredient_id))
+            != stored.get((user_id, ingredient_id))
+        }
+        if drifted and not dry_run:
+            ShoppingCartIngredient.objects.filter(user_id__in=drifted).delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                [
+                    ShoppingCartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total,
+                    )
+                    for (user_id, ingredient_id), total in expected.items()
+                    if user_id in drifted
+                ]
+            )
+        return sorted(drifted)
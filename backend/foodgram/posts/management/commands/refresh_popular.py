@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.popular import WINDOWS, refresh
+
+
+class Command(BaseCommand):
+    help = "Обновляет рейтинги популярных рецептов по новым событиям"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window",
+            choices=list(WINDOWS),
+            help="Только это окно (по умолчанию все)",
+        )
+        parser.add_argument(
+            "--full", action="store_true", help="Пересчитать окна целиком"
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Повторять каждые N секунд (0 — один запуск)",
+        )
+
+    def handle(self, *args, **options):
+        windows = [options["window"]] if options["window"] else list(WINDOWS)
+        full = options["full"]
+        while True:
+            for window in windows:
+                started = time.perf_counter()
+                changed = refresh(window, full=full)
+                elapsed = (time.perf_counter() - started) * 1000
+                if changed is None:
+                    result = "пересчитано целиком"
+                else:
+                    result = f"изменено рецептов: {changed}"
+                self.stdout.write(f"{window}: {result} за {elapsed:.1f} мс")
+
+            if not options["interval"]:
+                break
+            # Полный пересчёт только на первом проходе, дальше — дельты
+            full = False
+            connections.close_all()
+            time.sleep(options["interval"])
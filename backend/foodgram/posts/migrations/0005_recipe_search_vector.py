@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-18 03:08
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({row}text, '')), 'B')"
+)
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE OR REPLACE FUNCTION posts_recipe_search_vector_update() "
+        "RETURNS trigger AS $$ BEGIN "
+        f"NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW.')}; "
+        "RETURN NEW; END $$ LANGUAGE plpgsql"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER posts_recipe_search_vector_trigger "
+        "BEFORE INSERT OR UPDATE OF name, text ON posts_recipe "
+        "FOR EACH ROW EXECUTE FUNCTION posts_recipe_search_vector_update()"
+    )
+    schema_editor.execute(
+        f"UPDATE posts_recipe SET search_vector = {SEARCH_VECTOR_SQL.format(row='')}"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_search_vector_idx "
+        "ON posts_recipe USING gin (search_vector)"
+    )
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS recipe_search_vector_idx")
+    schema_editor.execute(
+        "DROP TRIGGER IF EXISTS posts_recipe_search_vector_trigger ON posts_recipe"
+    )
+    schema_editor.execute("DROP FUNCTION IF EXISTS posts_recipe_search_vector_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2 on 2026-10-18 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Сколько последних рецептов автора кладём в ленту подписчика
+BACKFILL_LIMIT = 100
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model("posts", "Recipe")
+    Subscription = apps.get_model("users", "Subscription")
+    TimelineEntry = apps.get_model("posts", "TimelineEntry")
+
+    for subscriber_id, author_id in Subscription.objects.values_list(
+        "subscriber_id", "author_id"
+    ).iterator():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            "-pub_date", "-id"
+        )
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=subscriber_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in recipes.values_list("id", "pub_date")[
+                    :BACKFILL_LIMIT
+                ]
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_shoppingcartingredient'),
+        ('users', '0004_rename_subsciber_subscription_subscriber'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_timeline_recipe'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2 on 2026-10-18 03:18
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, link):
+    rows = (
+        model.objects.filter(**{link: models.OuterRef("pk")})
+        .order_by()
+        .values(link)
+        .annotate(total=models.Count("pk"))
+        .values("total")
+    )
+    return Coalesce(models.Subquery(rows), models.Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Favourite = apps.get_model("posts", "Favourite")
+    Recipe = apps.get_model("posts", "Recipe")
+    ShoppingCart = apps.get_model("posts", "ShoppingCart")
+    Recipe.objects.update(
+        favorites_count=count_of(Favourite, "recipe"),
+        in_carts_count=count_of(ShoppingCart, "recipe"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
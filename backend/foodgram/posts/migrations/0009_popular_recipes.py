@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 03:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def date_existing_events(apps, schema_editor):
+    # Когда были добавлены старые записи, неизвестно: считаем, что в день
+    # публикации рецепта, чтобы они не попали разом в окно «24 часа»
+    for model_name in ("Favourite", "ShoppingCart"):
+        model = apps.get_model("posts", model_name)
+        model.objects.update(
+            created=models.Subquery(
+                apps.get_model("posts", "Recipe")
+                .objects.filter(pk=models.OuterRef("recipe_id"))
+                .values("pub_date")[:1]
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularRefresh',
+            fields=[
+                ('window', models.CharField(choices=[('24h', '24 часа'), ('7d', '7 дней'), ('all', 'Всё время')], max_length=8, primary_key=True, serialize=False)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Пересчёт рейтинга',
+                'verbose_name_plural': 'Пересчёты рейтингов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favourite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(date_existing_events, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='PopularRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('24h', '24 часа'), ('7d', '7 дней'), ('all', 'Всё время')], max_length=8)),
+                ('score', models.IntegerField(default=0)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='posts.recipe')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='popularrecipe',
+            index=models.Index(fields=['window', '-score', '-recipe'], name='popular_window_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='popularrecipe',
+            constraint=models.UniqueConstraint(fields=('window', 'recipe'), name='unique_window_popular_recipe'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+# max_ingredient_amount на момент миграции
+MAX_AMOUNT = 32000
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    # Дубли (name, measurement_unit) сливаются в ингредиент с меньшим id
+    Ingredient = apps.get_model("posts", "Ingredient")
+    RecipeIngredient = apps.get_model("posts", "RecipeIngredient")
+    ShoppingCartIngredient = apps.get_model("posts", "ShoppingCartIngredient")
+
+    groups = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep_id=models.Min("id"), total=models.Count("id"))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        keep_id = group["keep_id"]
+        duplicate_ids = list(
+            Ingredient.objects.filter(
+                name=group["name"], measurement_unit=group["measurement_unit"]
+            )
+            .exclude(id=keep_id)
+            .values_list("id", flat=True)
+        )
+        for row in RecipeIngredient.objects.filter(ingredient_id__in=duplicate_ids):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=row.recipe_id, ingredient_id=keep_id
+            ).first()
+            if kept is None:
+                row.ingredient_id = keep_id
+                row.save(update_fields=["ingredient"])
+            else:
+                # Сумма может выйти за предел поля; итоги корзин после
+                # этого сверяет reconcile_shopping_carts
+                kept.amount = min(kept.amount + row.amount, MAX_AMOUNT)
+                kept.save(update_fields=["amount"])
+                row.delete()
+        for row in ShoppingCartIngredient.objects.filter(
+            ingredient_id__in=duplicate_ids
+        ):
+            kept = ShoppingCartIngredient.objects.filter(
+                user_id=row.user_id, ingredient_id=keep_id
+            ).first()
+            if kept is None:
+                row.ingredient_id = keep_id
+                row.save(update_fields=["ingredient"])
+            else:
+                kept.total_amount += row.total_amount
+                kept.save(update_fields=["total_amount"])
+                row.delete()
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+    if schema_editor.connection.vendor == "postgresql":
+        # Отложенные проверки внешних ключей — сейчас, иначе ALTER TABLE
+        # в той же транзакции падает с «pending trigger events»
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_popular_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataImport',
+            fields=[
+                ('source', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('checksum', models.CharField(max_length=64)),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Загрузка данных',
+                'verbose_name_plural': 'Загрузки данных',
+            },
+        ),
+        migrations.RunPython(merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
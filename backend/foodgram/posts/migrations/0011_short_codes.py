@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 03:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_ingredient_unique_and_data_import'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(blank=True, max_length=16, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='LegacyShortCode',
+            fields=[
+                ('code', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legacy_short_codes', to='posts.recipe')),
+            ],
+            options={
+                'verbose_name': 'Старый короткий код',
+                'verbose_name_plural': 'Старые короткие коды',
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from users.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -7,10 +8,12 @@ from foodgram.common_classes import (
     min_ingredient_amount,
     max_ingredient_amount,
 )
-import uuid
 import string
 import random
 
+from posts import short_codes
+from posts.counters import CounterFieldsMixin
+
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=256, blank=False)
@@ -20,6 +23,12 @@ class Ingredient(models.Model):
         ordering = ["name"]
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "measurement_unit"],
+                name="unique_ingredient_unit",
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.measurement_unit})"
@@ -30,7 +39,7 @@ def generate_short_code(length=5):
     return "".join(random.choice(chars) for _ in range(length))
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="recipes", blank=False
     )
@@ -54,24 +63,59 @@ class Recipe(models.Model):
             ),
         ],
     )
-    short_code = models.CharField(max_length=16, unique=True, blank=True)
+    # Код из posts.short_codes.encode(id), выставляется сразу после вставки
+    short_code = models.CharField(
+        max_length=16, unique=True, null=True, blank=True
+    )
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Заполняется триггером в PostgreSQL (см. миграцию 0005):
+    # name — вес A, text — B
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Поддерживаются в posts.counters, пересчёт — recompute_counters
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ("favorites_count", "in_carts_count")
 
     class Meta:
         ordering = ["-pub_date"]  # Сортировка по дате публикации (новые сначала)
+        indexes = [
+            # Ключ keyset-пагинации ленты
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+        ]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
     def save(self, *args, **kwargs):
-        # Генерируем код только один раз — при создании
-        if not self.short_code:
-            self.short_code = uuid.uuid4().hex[:6]  # например: "3d0a9f"
         super().save(*args, **kwargs)
+        # Код зависит от id, поэтому считается только после вставки
+        if not self.short_code:
+            self.short_code = short_codes.encode(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_code=self.short_code
+            )
 
     def __str__(self):
         return self.name
 
 
+class LegacyShortCode(models.Model):
+    """Короткий код старого формата, перенесённый migrate_short_codes."""
+
+    code = models.CharField(max_length=16, primary_key=True)
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="legacy_short_codes"
+    )
+
+    class Meta:
+        verbose_name = "Старый короткий код"
+        verbose_name_plural = "Старые короткие коды"
+
+    def __str__(self):
+        return self.code
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
@@ -107,6 +151,7 @@ class Favourite(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name="favorited_by"
     )
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         ordering = ["-recipe__pub_date"]
@@ -129,6 +174,7 @@ class ShoppingCart(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name="in_carts"
     )
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "Корзина покупок"
@@ -141,3 +187,136 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.name}"
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Поддерживается в posts.cart_totals при изменении корзины и рецептов,
+    расхождения чинит команда reconcile_shopping_carts.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="cart_ingredients"
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    total_amount = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Ингредиент корзины"
+        verbose_name_plural = "Ингредиенты корзин"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_user_cart_ingredient",
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user.username} - {self.ingredient.name}: "
+            f"{self.total_amount}"
+        )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика (рассылка при публикации, posts.feed)."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline"
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи лент"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_user_timeline_recipe"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_date_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.recipe.name}"
+
+
+class PopularRecipe(models.Model):
+    """Предпосчитанный рейтинг рецепта за окно (posts.popular).
+
+    score — сколько раз рецепт добавили в избранное и в корзину за окно.
+    Хранятся только рецепты с ненулевым рейтингом.
+    """
+
+    WINDOW_CHOICES = [
+        ("24h", "24 часа"),
+        ("7d", "7 дней"),
+        ("all", "Всё время"),
+    ]
+
+    window = models.CharField(max_length=8, choices=WINDOW_CHOICES)
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="popularity"
+    )
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["window", "recipe"],
+                name="unique_window_popular_recipe",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["window", "-score", "-recipe"],
+                name="popular_window_score_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.window}: {self.recipe_id} - {self.score}"
+
+
+class PopularRefresh(models.Model):
+    """До какого момента события учтены в рейтинге окна."""
+
+    window = models.CharField(
+        max_length=8, choices=PopularRecipe.WINDOW_CHOICES, primary_key=True
+    )
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Пересчёт рейтинга"
+        verbose_name_plural = "Пересчёты рейтингов"
+
+    def __str__(self):
+        return f"{self.window}: {self.refreshed_at}"
+
+
+class DataImport(models.Model):
+    """Контрольная сумма последней загрузки справочника (load_ingredients)."""
+
+    source = models.CharField(max_length=64, primary_key=True)
+    checksum = models.CharField(max_length=64)
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка данных"
+        verbose_name_plural = "Загрузки данных"
+
+    def __str__(self):
+        return f"{self.source}: {self.checksum[:12]}"
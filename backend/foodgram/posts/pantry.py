@@ -0,0 +1,102 @@
+"""Подбор рецептов по продуктам, которые есть у пользователя.
+
+Матрица инцидентности «рецепт × ингредиент» хранится в CSR-виде на
+массивах NumPy: indptr/indices плюс id рецептов по строкам. Покрытие всех
+рецептов набором продуктов считается одной векторной операцией, без
+цикла по рецептам. Матрица синхронизируется с базой тем же журналом
+изменений, что и инвертированный индекс ингредиентов.
+"""
+import copy
+import time
+
+import numpy as np
+
+from posts.recipe_ingredient_index import SyncedIndex
+
+
+class PantryMatrix:
+    def __init__(self, pairs, sequence=0):
+        recipe_ids, ingredient_ids = [], []
+        for recipe_id, ingredient_id in pairs:
+            recipe_ids.append(recipe_id)
+            ingredient_ids.append(ingredient_id)
+        self._build(
+            np.array(recipe_ids, dtype=np.int64),
+            np.array(ingredient_ids, dtype=np.int32),
+        )
+        self.sequence = sequence
+        self.built_at = time.monotonic()
+
+    def _build(self, recipe_of, ingredient_of):
+        # Только для ещё не опубликованной матрицы: из __init__ и replay()
+        self.recipe_ids, rows = np.unique(recipe_of, return_inverse=True)
+        order = np.argsort(rows, kind="stable")
+        self.indices = ingredient_of[order]
+        self.totals = np.bincount(rows, minlength=len(self.recipe_ids)).astype(
+            np.int32
+        )
+        self.indptr = np.zeros(len(self.recipe_ids) + 1, dtype=np.int64)
+        np.cumsum(self.totals, out=self.indptr[1:])
+
+    def nbytes(self):
+        return (
+            self.recipe_ids.nbytes
+            + self.indices.nbytes
+            + self.totals.nbytes
+            + self.indptr.nbytes
+        )
+
+    def replay(self, recipe_ids, pairs, sequence):
+        """Новая матрица, где строки изменённых рецептов заменены на pairs из
+        базы. Эта не меняется: её без блокировки читают другие потоки."""
+        recipe_of = np.repeat(self.recipe_ids, self.totals)
+        keep = ~np.isin(recipe_of, np.fromiter(recipe_ids, dtype=np.int64))
+        new_pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        matrix = copy.copy(self)
+        matrix._build(
+            np.concatenate([recipe_of[keep], new_pairs[:, 0]]),
+            np.concatenate(
+                [self.indices[keep], new_pairs[:, 1].astype(np.int32)]
+            ),
+        )
+        matrix.sequence = sequence
+        return matrix
+
+    def rank(self, pantry_ids, limit):
+        """Лучшие по покрытию рецепты: [(recipe_id, coverage, missing_ids)]."""
+        if not len(self.recipe_ids):
+            return []
+
+        size = int(self.indices.max()) + 1
+        in_pantry = np.zeros(size, dtype=np.int32)
+        in_pantry[[pk for pk in pantry_ids if pk < size]] = 1
+
+        covered = np.add.reduceat(in_pantry[self.indices], self.indptr[:-1])
+        candidates = np.flatnonzero(covered)
+        if not len(candidates):
+            return []
+
+        coverage = covered[candidates] / self.totals[candidates]
+        missing = self.totals[candidates] - covered[candidates]
+        # Больше покрытие, меньше недостающих, новее рецепт
+        order = np.lexsort((-self.recipe_ids[candidates], missing, -coverage))
+        top = candidates[order[:limit]]
+
+        result = []
+        for row, share in zip(top, coverage[order[:limit]]):
+            ingredients = self.indices[self.indptr[row]:self.indptr[row + 1]]
+            result.append(
+                (
+                    int(self.recipe_ids[row]),
+                    round(float(share), 4),
+                    [int(pk) for pk in ingredients if not in_pantry[pk]],
+                )
+            )
+        return result
+
+
+_matrix = SyncedIndex(PantryMatrix)
+
+
+def get_matrix():
+    return _matrix.get()
@@ -0,0 +1,174 @@
+"""Предпосчитанный рейтинг популярных рецептов.
+
+Рейтинг рецепта за окно — сколько раз его добавили в избранное и в
+корзину за это время. Он хранится в PopularRecipe и обновляется командой
+refresh_popular по дельте с прошлого запуска: события, созданные после
+него, прибавляются, а вышедшие за границу окна — вычитаются. Удаления из
+избранного и корзины вычитаются сразу (forget_events), чтобы рейтинг
+не расходился с таблицами событий.
+"""
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from posts.models import Favourite, PopularRecipe, PopularRefresh, ShoppingCart
+
+# Окно -> длительность, None — за всё время
+WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "all": None,
+}
+EVENT_MODELS = (Favourite, ShoppingCart)
+UPDATE_BATCH_SIZE = 500
+
+
+def count_events(**filters):
+    """Число событий по рецептам: Counter({recipe_id: count})."""
+    counts = Counter()
+    for model in EVENT_MODELS:
+        rows = (
+            model.objects.filter(**filters)
+            .order_by()
+            .values("recipe_id")
+            .annotate(total=Count("id"))
+            .values_list("recipe_id", "total")
+        )
+        counts.update(dict(rows))
+    return counts
+
+
+def apply_delta(window, delta):
+    """Прибавляет delta {recipe_id: score} к рейтингу окна."""
+    delta = {recipe_id: score for recipe_id, score in delta.items() if score}
+    if not delta:
+        return
+
+    PopularRecipe.objects.bulk_create(
+        [
+            PopularRecipe(window=window, recipe_id=recipe_id)
+            for recipe_id, score in delta.items()
+            if score > 0
+        ],
+        ignore_conflicts=True,
+    )
+    items = list(delta.items())
+    for start in range(0, len(items), UPDATE_BATCH_SIZE):
+        batch = items[start:start + UPDATE_BATCH_SIZE]
+        PopularRecipe.objects.filter(
+            window=window, recipe_id__in=[recipe_id for recipe_id, _ in batch]
+        ).update(
+            score=F("score")
+            + Case(
+                *[
+                    When(recipe_id=recipe_id, then=Value(score))
+                    for recipe_id, score in batch
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+    PopularRecipe.objects.filter(window=window, score__lte=0).delete()
+
+
+def rebuild(window, now):
+    """Полный пересчёт окна по таблицам событий."""
+    duration = WINDOWS[window]
+    filters = {"created__lte": now}
+    if duration is not None:
+        filters["created__gt"] = now - duration
+
+    PopularRecipe.objects.filter(window=window).delete()
+    PopularRecipe.objects.bulk_create(
+        [
+            PopularRecipe(window=window, recipe_id=recipe_id, score=score)
+            for recipe_id, score in count_events(**filters).items()
+        ],
+        batch_size=UPDATE_BATCH_SIZE,
+    )
+
+
+def refresh(window, now=None, full=False):
+    """Доводит рейтинг окна до момента now.
+
+    Без прошлого запуска (или с full=True) окно пересчитывается целиком.
+    Возвращает число рецептов, чей рейтинг изменился, или None при полном
+    пересчёте.
+    """
+    now = now or timezone.now()
+    duration = WINDOWS[window]
+    with transaction.atomic():
+        state = (
+            PopularRefresh.objects.select_for_update()
+            .filter(window=window)
+            .first()
+        )
+        if state is None or full:
+            rebuild(window, now)
+            PopularRefresh.objects.update_or_create(
+                window=window, defaults={"refreshed_at": now}
+            )
+            return None
+        if state.refreshed_at >= now:
+            return 0
+
+        since = state.refreshed_at
+        delta = count_events(created__gt=since, created__lte=now)
+        if duration is not None:
+            delta.subtract(
+                count_events(
+                    created__gt=since - duration, created__lte=now - duration
+                )
+            )
+        apply_delta(window, delta)
+        state.refreshed_at = now
+        state.save(update_fields=["refreshed_at"])
+    return sum(1 for score in delta.values() if score)
+
+
+def forget_events(events):
+    """Вычитает из рейтингов удалённые события [(recipe_id, created)].
+
+    Событие учтено окном, если оно не позже последнего пересчёта и ещё
+    не вышло за границу окна. Вызывать в транзакции удаления.
+    """
+    if not events:
+        return
+    # Все окна сразу: один UPDATE и один DELETE вместо пары на окно
+    counted = Counter()
+    for state in PopularRefresh.objects.all():
+        duration = WINDOWS.get(state.window)
+        counted.update(
+            (state.window, recipe_id)
+            for recipe_id, created in events
+            if created <= state.refreshed_at
+            and (duration is None or created > state.refreshed_at - duration)
+        )
+    if not counted:
+        return
+    rows = PopularRecipe.objects.filter(
+        reduce(
+            or_,
+            (
+                Q(window=window, recipe_id=recipe_id)
+                for window, recipe_id in counted
+            ),
+        )
+    )
+    rows.update(
+        score=F("score")
+        - Case(
+            *[
+                When(window=window, recipe_id=recipe_id, then=Value(count))
+                for (window, recipe_id), count in counted.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    rows.filter(score__lte=0).delete()
@@ -0,0 +1,217 @@
+"""Инвертированный индекс «ингредиент → рецепты» в памяти воркера.
+
+Для каждого ингредиента хранится отсортированный array('q') с id рецептов,
+пересечение и объединение считаются в памяти. Изменения рецептов
+публикуются в общий кэш журналом (номер + id рецепта), и воркеры
+догоняют его, перечитывая из базы только изменённые рецепты. Если журнал
+потерян или отстал больше чем на MAX_REPLAY записей, индекс
+пересобирается целиком.
+"""
+import bisect
+import copy
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.db_router import primary
+from posts.models import RecipeIngredient
+
+SEQUENCE_KEY = "recipe-ingredient-index:seq"
+CHANGE_KEY = "recipe-ingredient-index:change:{}"
+MAX_REPLAY = 50
+
+
+class RecipeIngredientIndex:
+    def __init__(self, pairs, sequence=0):
+        postings = defaultdict(list)
+        for recipe_id, ingredient_id in pairs:
+            postings[ingredient_id].append(recipe_id)
+        self.postings = {
+            ingredient_id: array("q", sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self.sequence = sequence
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return sum(len(recipe_ids) for recipe_ids in self.postings.values())
+
+    def nbytes(self):
+        return sum(
+            recipe_ids.itemsize * len(recipe_ids)
+            for recipe_ids in self.postings.values()
+        )
+
+    def match_all(self, ingredient_ids):
+        """Рецепты, в которых есть все ингредиенты, по возрастанию id."""
+        lists = sorted(
+            (
+                self.postings.get(ingredient_id, ())
+                for ingredient_id in ingredient_ids
+            ),
+            key=len,
+        )
+        if not lists:
+            return []
+        result = list(lists[0])
+        for recipe_ids in lists[1:]:
+            result = [
+                recipe_id
+                for recipe_id in result
+                if _contains(recipe_ids, recipe_id)
+            ]
+            if not result:
+                break
+        return result
+
+    def match_any(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        result = set()
+        for ingredient_id in ingredient_ids:
+            result.update(self.postings.get(ingredient_id, ()))
+        return sorted(result)
+
+    def replay(self, recipe_ids, pairs, sequence):
+        """Снимок, где наборы ингредиентов рецептов recipe_ids заменены на
+        pairs из базы. Сам снимок не меняется: его без блокировки читают
+        другие потоки. Копируются только затронутые списки."""
+        postings = dict(self.postings)
+        copied = set()
+
+        def writable(ingredient_id):
+            if ingredient_id not in copied:
+                postings[ingredient_id] = array(
+                    "q", postings.get(ingredient_id, ())
+                )
+                copied.add(ingredient_id)
+            return postings[ingredient_id]
+
+        for ingredient_id, recipes in self.postings.items():
+            for recipe_id in recipe_ids:
+                if _contains(recipes, recipe_id):
+                    ids = writable(ingredient_id)
+                    del ids[bisect.bisect_left(ids, recipe_id)]
+
+        for recipe_id, ingredient_id in pairs:
+            ids = postings.get(ingredient_id, ())
+            position = bisect.bisect_left(ids, recipe_id)
+            if position == len(ids) or ids[position] != recipe_id:
+                writable(ingredient_id).insert(position, recipe_id)
+
+        snapshot = copy.copy(self)
+        snapshot.postings = postings
+        snapshot.sequence = sequence
+        return snapshot
+
+
+def _contains(sorted_ids, value):
+    position = bisect.bisect_left(sorted_ids, value)
+    return position < len(sorted_ids) and sorted_ids[position] == value
+
+
+def _load_pairs(recipe_ids=None):
+    queryset = RecipeIngredient.objects.order_by()
+    if recipe_ids is not None:
+        queryset = queryset.filter(recipe_id__in=recipe_ids)
+    return queryset.values_list("recipe_id", "ingredient_id").iterator()
+
+
+class SyncedIndex:
+    """Снимок в памяти процесса, который догоняет журнал изменений рецептов.
+
+    factory(pairs, sequence) строит снимок из пар (recipe_id, ingredient_id),
+    у снимка должны быть атрибуты sequence, built_at и метод replay(),
+    который возвращает новый снимок. Читатели берут self.index без
+    блокировки, поэтому снимок после публикации не меняется, а заменяется
+    целиком.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.index = None
+
+    def get(self):
+        sequence = cache.get(SEQUENCE_KEY, 0)
+        index = self.index
+        if (
+            index is not None
+            and index.sequence == sequence
+            and not _expired(index)
+        ):
+            return index
+
+        # Снимок догоняет журнал по основной базе: реплика могла ещё не
+        # получить изменения, и журнал ушёл бы дальше данных
+        with self.lock, primary():
+            index = self.index
+            if index is not None and not _expired(index):
+                index = _catch_up(index, sequence)
+            else:
+                index = None
+            if index is None:
+                index = self.factory(_load_pairs(), sequence)
+            self.index = index
+        return index
+
+
+def _expired(index):
+    return (
+        time.monotonic() - index.built_at
+        > settings.RECIPE_INGREDIENT_INDEX_TTL
+    )
+
+
+def _catch_up(index, sequence):
+    """Снимок, догнавший журнал, или None, если нужна полная пересборка."""
+    if index.sequence == sequence:
+        return index
+    if not 0 < sequence - index.sequence <= MAX_REPLAY:
+        return None
+
+    keys = [
+        CHANGE_KEY.format(number)
+        for number in range(index.sequence + 1, sequence + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+
+    recipe_ids = set(changes.values())
+    return index.replay(recipe_ids, _load_pairs(recipe_ids), sequence)
+
+
+_inverted_index = SyncedIndex(RecipeIngredientIndex)
+
+
+def get_index():
+    """Актуальный индекс процесса, догнавший журнал изменений."""
+    return _inverted_index.get()
+
+
+def _next_sequence(step=1):
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    try:
+        return cache.incr(SEQUENCE_KEY, step)
+    except ValueError:
+        cache.set(SEQUENCE_KEY, step, timeout=None)
+        return step
+
+
+def publish_recipe_change(recipe_id):
+    """Сообщает всем воркерам, что ингредиенты рецепта изменились."""
+    sequence = _next_sequence()
+    cache.set(
+        CHANGE_KEY.format(sequence),
+        recipe_id,
+        timeout=settings.RECIPE_INGREDIENT_INDEX_TTL,
+    )
+
+
+def reset_index():
+    """Полная пересборка во всех воркерах (после массовой загрузки)."""
+    _next_sequence(MAX_REPLAY + 1)
@@ -0,0 +1,149 @@
+"""Избранное, корзина и подписки: запись пачкой за один проход.
+
+Добавление — один INSERT … ON CONFLICT DO NOTHING RETURNING, удаление —
+один DELETE … RETURNING (PostgreSQL и SQLite 3.35+). Повторное
+добавление или удаление ничего не меняет, а возвращённые строки — ровно
+те связи, что изменил этот запрос, даже при параллельных кликах. По ним
+же обновляется всё, что зависит от связей и что при таких запросах не
+ловится сигналами: счётчики, суммы корзины, рейтинги и ленты.
+"""
+from django.db import connections, router, transaction
+
+from foodgram import background
+from posts import cart_totals, counters, feed, popular
+from posts.models import Favourite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+
+def _add(model, owner_field, target_field, owner_id, target_ids):
+    """Создаёт недостающие связи, возвращает id целей, для которых создал."""
+    target_ids = _unique(target_ids)
+    if not target_ids:
+        return []
+    using = router.db_for_write(model)
+    quote = connections[using].ops.quote_name
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    params = []
+    for target_id in target_ids:
+        row = model(**{owner_field: owner_id, target_field: target_id})
+        params.extend(
+            field.get_db_prep_save(
+                field.pre_save(row, True), connections[using]
+            )
+            for field in fields
+        )
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} "
+        f"({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES {', '.join([f'({placeholders})'] * len(target_ids))} "
+        f"ON CONFLICT DO NOTHING "
+        f"RETURNING {quote(model._meta.pk.column)}, "
+        f"{quote(model._meta.get_field(target_field).column)}"
+    )
+    created = {
+        getattr(row, target_field)
+        for row in model.objects.raw(sql, params, using=using)
+    }
+    return [target_id for target_id in target_ids if target_id in created]
+
+
+def _remove(model, owner_field, target_field, owner_id, target_ids, *fields):
+    """Удаляет связи, возвращает строки (target_id, *fields) удалённых."""
+    target_ids = _unique(target_ids)
+    if not target_ids:
+        return []
+    using = router.db_for_write(model)
+    quote = connections[using].ops.quote_name
+    meta = model._meta
+    returning = ", ".join(
+        quote(meta.get_field(name).column)
+        for name in (meta.pk.name, target_field, *fields)
+    )
+    sql = (
+        f"DELETE FROM {quote(meta.db_table)} "
+        f"WHERE {quote(meta.get_field(owner_field).column)} = %s "
+        f"AND {quote(meta.get_field(target_field).column)} IN "
+        f"({', '.join(['%s'] * len(target_ids))}) "
+        f"RETURNING {returning}"
+    )
+    rows = model.objects.raw(sql, [owner_id, *target_ids], using=using)
+    return sorted(
+        (getattr(row, target_field), *(getattr(row, name) for name in fields))
+        for row in rows
+    )
+
+
+@transaction.atomic
+def add_favorites(user_id, recipe_ids):
+    added = _add(Favourite, "user_id", "recipe_id", user_id, recipe_ids)
+    counters.adjust(Recipe, added, favorites_count=1)
+    return added
+
+
+@transaction.atomic
+def remove_favorites(user_id, recipe_ids):
+    rows = _remove(
+        Favourite, "user_id", "recipe_id", user_id, recipe_ids, "created"
+    )
+    removed = [recipe_id for recipe_id, _ in rows]
+    counters.adjust(Recipe, removed, favorites_count=-1)
+    popular.forget_events(rows)
+    return removed
+
+
+@transaction.atomic
+def add_to_cart(user_id, recipe_ids):
+    added = _add(ShoppingCart, "user_id", "recipe_id", user_id, recipe_ids)
+    if added:
+        counters.adjust(Recipe, added, in_carts_count=1)
+        cart_totals.add_recipes(user_id, added)
+    return added
+
+
+@transaction.atomic
+def remove_from_cart(user_id, recipe_ids):
+    rows = _remove(
+        ShoppingCart, "user_id", "recipe_id", user_id, recipe_ids, "created"
+    )
+    removed = [recipe_id for recipe_id, _ in rows]
+    if removed:
+        counters.adjust(Recipe, removed, in_carts_count=-1)
+        cart_totals.remove_recipes(user_id, removed)
+        popular.forget_events(rows)
+    return removed
+
+
+@transaction.atomic
+def subscribe(user_id, author_ids):
+    added = _add(
+        Subscription, "subscriber_id", "author_id", user_id, author_ids
+    )
+    counters.adjust(User, added, subscribers_count=1)
+    for author_id in added:
+        transaction.on_commit(
+            lambda author_id=author_id: background.submit(
+                feed.backfill_subscription, user_id, author_id
+            )
+        )
+    return added
+
+
+@transaction.atomic
+def unsubscribe(user_id, author_ids):
+    rows = _remove(
+        Subscription, "subscriber_id", "author_id", user_id, author_ids
+    )
+    removed = [author_id for (author_id,) in rows]
+    if removed:
+        counters.adjust(User, removed, subscribers_count=-1)
+        feed.remove_subscription(user_id, removed)
+    return removed
@@ -0,0 +1,205 @@
+"""Короткие ссылки на рецепты без обращения к базе.
+
+Код — это id рецепта, сдвинутый на CHECK_BITS нулевых бит и переставленный
+ключевой сетью Фейстеля (ключ SHORT_LINK_KEY), записанный в base62 ровно
+CODE_LENGTH символами. Обратное преобразование даёт id; если младшие биты
+не нули, код не наш. Подобрать чужой код перебором id нельзя без ключа.
+
+Коды старого формата (uuid4().hex[:6] и импортированные) переносятся в
+LegacyShortCode командой migrate_short_codes и разрешаются через
+ограниченный LRU-кэш процесса; неизвестные коды кэшируются как отсутствующие
+на SHORT_LINK_NEGATIVE_TTL секунд. Код, который декодируется нашим ключом,
+всегда означает локальный id: import_recipes предупреждает о таких исходных
+кодах, ссылки по ним на импортированные рецепты не ведут.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+CODE_LENGTH = 8
+# 62**8 > 2**47: в код помещаются 35 бит id и 12 проверочных
+CHECK_BITS = 12
+ID_BITS = 35
+HALF_BITS = 24
+HALF_MASK = (1 << HALF_BITS) - 1
+DOMAIN = len(ALPHABET) ** CODE_LENGTH
+ROUNDS = 4
+
+_index = {char: position for position, char in enumerate(ALPHABET)}
+
+
+def _key():
+    return _derive_key(settings.SHORT_LINK_KEY)
+
+
+@lru_cache(maxsize=4)
+def _derive_key(secret):
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def _round(key, number, half):
+    digest = hashlib.blake2b(
+        half.to_bytes(3, "big"),
+        key=key,
+        digest_size=3,
+        person=bytes([number]) * 16,
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _encrypt(value, key):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for number in range(ROUNDS):
+        left, right = right, left ^ _round(key, number, right)
+    return (left << HALF_BITS) | right
+
+
+def _decrypt(value, key):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for number in reversed(range(ROUNDS)):
+        left, right = right ^ _round(key, number, left), left
+    return (left << HALF_BITS) | right
+
+
+def encode(recipe_id):
+    if not 0 < recipe_id < 1 << ID_BITS:
+        raise ValueError(f"id {recipe_id} не помещается в короткий код")
+    key = _key()
+    # Перестановка 48-битная, а кодов меньше: «прокручиваем» значение,
+    # пока оно не попадёт в диапазон (cycle walking)
+    value = _encrypt(recipe_id << CHECK_BITS, key)
+    while value >= DOMAIN:
+        value = _encrypt(value, key)
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def decode(code):
+    """id рецепта или None, если код не нашего формата."""
+    if len(code) != CODE_LENGTH:
+        return None
+    value = 0
+    for char in code:
+        digit = _index.get(char)
+        if digit is None:
+            return None
+        value = value * len(ALPHABET) + digit
+    key = _key()
+    value = _decrypt(value, key)
+    while value >= DOMAIN:
+        value = _decrypt(value, key)
+    if value & ((1 << CHECK_BITS) - 1):
+        return None
+    return (value >> CHECK_BITS) or None
+
+
+class LRUCache:
+    """Ограниченный кэш code -> (recipe_id или None, срок годности)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def get(self, code):
+        with self.lock:
+            item = self.items.get(code)
+            if item is None:
+                return False, None
+            recipe_id, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self.items[code]
+                return False, None
+            self.items.move_to_end(code)
+            return True, recipe_id
+
+    def set(self, code, recipe_id, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.items[code] = (recipe_id, expires)
+            self.items.move_to_end(code)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+_legacy = None
+
+
+def legacy_cache():
+    global _legacy
+    if _legacy is None:
+        _legacy = LRUCache(settings.SHORT_LINK_CACHE_SIZE)
+    return _legacy
+
+
+def resolve(code):
+    """id рецепта по короткому коду или None."""
+    recipe_id = decode(code)
+    if recipe_id is not None:
+        return recipe_id
+
+    found, recipe_id = legacy_cache().get(code)
+    if found:
+        return recipe_id
+
+    from posts.models import LegacyShortCode, Recipe
+
+    recipe_id = (
+        LegacyShortCode.objects.filter(code=code)
+        .values_list("recipe_id", flat=True)
+        .first()
+    )
+    if recipe_id is None:
+        # Ещё не перенесённые командой migrate_short_codes
+        recipe_id = (
+            Recipe.objects.filter(short_code=code)
+            .values_list("id", flat=True)
+            .first()
+        )
+    return remember(code, recipe_id)
+
+
+async def aresolve(code):
+    """То же через async ORM."""
+    recipe_id = decode(code)
+    if recipe_id is not None:
+        return recipe_id
+
+    found, recipe_id = legacy_cache().get(code)
+    if found:
+        return recipe_id
+
+    from posts.models import LegacyShortCode, Recipe
+
+    recipe_id = await (
+        LegacyShortCode.objects.filter(code=code)
+        .values_list("recipe_id", flat=True)
+        .afirst()
+    )
+    if recipe_id is None:
+        recipe_id = await (
+            Recipe.objects.filter(short_code=code)
+            .values_list("id", flat=True)
+            .afirst()
+        )
+    return remember(code, recipe_id)
+
+
+def remember(code, recipe_id):
+    if recipe_id is None:
+        legacy_cache().set(code, None, ttl=settings.SHORT_LINK_NEGATIVE_TTL)
+    else:
+        legacy_cache().set(code, recipe_id)
+    return recipe_id
@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from foodgram import background
+from posts import cart_totals, counters, feed
+from posts.cache import invalidate_recipe_fragments
+from posts.ingredient_index import invalidate_index
+from posts.recipe_ingredient_index import publish_recipe_change
+from posts.models import Ingredient, Recipe, RecipeIngredient
+from users.models import User
+
+# Поля пользователя, которые попадают в блок author фрагмента рецепта
+AUTHOR_FRAGMENT_FIELDS = {
+    "email",
+    "username",
+    "first_name",
+    "last_name",
+    "avatar",
+}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def publish_recipe_ingredients(sender, instance, **kwargs):
+    # После коммита: ингредиенты рецепта к этому моменту уже записаны
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: publish_recipe_change(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(User, [instance.author_id], recipes_count=1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    counters.adjust(User, [instance.author_id], recipes_count=-1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    if not created:
+        return
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: background.submit(feed.fan_out_recipe, recipe_id)
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_cart_totals(sender, instance, **kwargs):
+    # До каскадного удаления, пока ингредиенты и корзины ещё на месте
+    old_amounts = cart_totals.recipe_amounts(instance.pk)
+    cart_totals.recipe_changed(instance.pk, old_amounts, {})
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, instance, **kwargs):
+    invalidate_index()
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_recipe_fragments(
+        instance.recipeingredient_set.values_list("recipe_id", flat=True)
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not AUTHOR_FRAGMENT_FIELDS & set(
+        update_fields
+    ):
+        return
+    invalidate_recipe_fragments(instance.recipes.values_list("id", flat=True))
@@ -1 +1,895 @@
-# Create your tests here.
+import io
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from posts import (
+    cart_totals,
+    counters,
+    ingredient_index,
+    pantry,
+    popular,
+    relations,
+    short_codes,
+)
+from posts.pantry import PantryMatrix
+from posts.recipe_ingredient_index import (
+    RecipeIngredientIndex,
+    SyncedIndex,
+    publish_recipe_change,
+    reset_index,
+)
+from posts.models import (
+    Favourite,
+    Ingredient,
+    LegacyShortCode,
+    PopularRecipe,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+from users.models import Subscription, User
+
+
+def make_user(number):
+    return User.objects.create_user(
+        username=f"user{number}",
+        email=f"user{number}@example.com",
+        first_name="Имя",
+        last_name="Фамилия",
+        password="password-123",
+    )
+
+
+def make_recipe(author, ingredients, number, **fields):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=f"Рецепт {number}",
+        text="Описание",
+        cooking_time=10,
+        **fields,
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, ingredient=ingredient, amount=number + 1
+        )
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+def call(command, *args, **options):
+    """Вызов команды с подавленным выводом."""
+    out = io.StringIO()
+    call_command(command, *args, stdout=out, stderr=io.StringIO(), **options)
+    return out.getvalue()
+
+
+class PostsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        short_codes.legacy_cache().clear()
+        self.author = make_user(1)
+        self.flour = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        self.milk = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+
+
+class ShortCodeTests(PostsTestCase):
+    def test_round_trip(self):
+        for recipe_id in (1, 2, 61, 62, 1000, 123_456_789, (1 << 35) - 1):
+            code = short_codes.encode(recipe_id)
+            self.assertEqual(len(code), short_codes.CODE_LENGTH)
+            self.assertEqual(short_codes.decode(code), recipe_id)
+
+    def test_foreign_codes_do_not_decode(self):
+        self.assertIsNone(short_codes.decode("abc123"))
+        self.assertIsNone(short_codes.decode("!!!!!!!!"))
+        # Из 4096 кодов нужной длины наш формат — примерно один
+        decoded = sum(
+            short_codes.decode(f"{number:08d}") is not None
+            for number in range(4096)
+        )
+        self.assertLess(decoded, 10)
+
+    def test_key_changes_codes(self):
+        code = short_codes.encode(42)
+        with self.settings(SHORT_LINK_KEY="другой ключ"):
+            self.assertNotEqual(short_codes.encode(42), code)
+            self.assertNotEqual(short_codes.decode(code), 42)
+
+    def test_new_recipe_gets_code_from_id(self):
+        recipe = make_recipe(self.author, [self.flour], 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.short_code, short_codes.encode(recipe.pk))
+        self.assertEqual(short_codes.resolve(recipe.short_code), recipe.pk)
+
+    def test_legacy_codes_and_negative_cache(self):
+        recipe = make_recipe(self.author, [self.flour], 1)
+        LegacyShortCode.objects.create(code="abc123", recipe=recipe)
+        with self.assertNumQueries(1):
+            self.assertEqual(short_codes.resolve("abc123"), recipe.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(short_codes.resolve("abc123"), recipe.pk)
+        # Неизвестный: ищется в старых кодах и ещё не перенесённых,
+        # потом кэшируется
+        with self.assertNumQueries(2):
+            self.assertIsNone(short_codes.resolve("nope42"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(short_codes.resolve("nope42"))
+
+    def test_redirect(self):
+        recipe = make_recipe(self.author, [self.flour], 1)
+        recipe.refresh_from_db()
+        response = self.client.get(f"/api/short_link/{recipe.short_code}/")
+        self.assertRedirects(
+            response, f"/recipes/{recipe.pk}/", fetch_redirect_response=False
+        )
+        self.assertEqual(
+            self.client.get("/api/short_link/zzzzzzzz/").status_code, 404
+        )
+
+    def test_migrate_repairs_taken_codes(self):
+        first = make_recipe(self.author, [self.flour], 1)
+        second = make_recipe(self.author, [self.flour], 2)
+        # Как после старого импорта: у первого рецепта код второго
+        Recipe.objects.filter(pk=second.pk).update(short_code="old001")
+        Recipe.objects.filter(pk=first.pk).update(
+            short_code=short_codes.encode(second.pk)
+        )
+        call("migrate_short_codes", batch_size=1)
+        for recipe in (first, second):
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.short_code, short_codes.encode(recipe.pk))
+        self.assertEqual(short_codes.resolve("old001"), second.pk)
+
+
+class LoadIngredientsTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def test_csv(self):
+        path = self.write("ingredients.csv", "соль,г\nмука,г\n соль , г\n,г\n")
+        self.assertIn(
+            "добавлено: 1, уже было: 1", call("load_ingredients", path)
+        )
+        self.assertTrue(Ingredient.objects.filter(name="соль").exists())
+
+        # Файл не менялся — загрузка пропускается
+        self.assertIn("пропуск", call("load_ingredients", path))
+        self.assertIn(
+            "добавлено: 0", call("load_ingredients", path, force=True)
+        )
+
+        self.write("ingredients.csv", "соль,г\nсахар,г\n")
+        self.assertIn("добавлено: 1", call("load_ingredients", path))
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_json(self):
+        path = self.write(
+            "ingredients.json",
+            json.dumps([{"name": "сахар", "measurement_unit": "г"}]),
+        )
+        self.assertIn(
+            "добавлено: 1", call("load_ingredients", path, batch_size=1)
+        )
+
+    def test_bad_path(self):
+        for path in (
+            self.write("ingredients.txt", ""),
+            str(self.directory / "x.csv"),
+        ):
+            with self.assertRaises(CommandError):
+                call("load_ingredients", path)
+
+
+class ImportRecipesTests(PostsTestCase):
+    def write_ndjson(self, records):
+        directory = tempfile.mkdtemp()
+        path = Path(directory) / "recipes.ndjson"
+        path.write_text(
+            "".join(
+                json.dumps(record, ensure_ascii=False) + "\n"
+                for record in records
+            ),
+            encoding="utf-8",
+        )
+        return str(path)
+
+    def record(self, name, short_code):
+        return {
+            "short_code": short_code,
+            "author": {"email": "chef@example.com", "username": "chef"},
+            "name": name,
+            "text": "Описание",
+            "cooking_time": 15,
+            "pub_date": "2024-01-01T10:00:00+00:00",
+            "image": None,
+            "ingredients": [
+                {"name": "мука", "measurement_unit": "г", "amount": 100},
+                {"name": "молоко", "measurement_unit": "мл", "amount": 200},
+            ],
+        }
+
+    def test_imported_recipes_get_local_codes(self):
+        local = make_recipe(self.author, [self.flour], 1)
+        path = self.write_ndjson([self.record("Блины", "old003")])
+
+        output = call("import_recipes", input=path)
+        self.assertIn("старых ссылок не перенесено: 0", output)
+        imported = Recipe.objects.get(name="Блины")
+        self.assertEqual(imported.pk, local.pk + 1)
+        self.assertEqual(imported.short_code, short_codes.encode(imported.pk))
+        self.assertEqual(imported.recipeingredient_set.count(), 2)
+        self.assertEqual(imported.pub_date.year, 2024)
+        self.assertEqual(short_codes.resolve("old003"), imported.pk)
+
+    def test_colliding_source_code(self):
+        # Код из базы с тем же ключом: здесь он декодируется в id, который
+        # достанется другому рецепту
+        local = make_recipe(self.author, [self.flour], 1)
+        foreign = short_codes.encode(local.pk + 2)
+        path = self.write_ndjson([self.record("Блины", foreign)])
+
+        errors = io.StringIO()
+        call_command(
+            "import_recipes", input=path, stdout=io.StringIO(), stderr=errors
+        )
+        self.assertIn(f"Код {foreign} совпадает", errors.getvalue())
+        imported = Recipe.objects.get(name="Блины")
+        self.assertEqual(imported.short_code, short_codes.encode(imported.pk))
+
+        # Ссылка остаётся за локальным рецептом с этим id
+        created = make_recipe(self.author, [self.flour], 3)
+        created.refresh_from_db()
+        self.assertEqual(created.short_code, foreign)
+        self.assertEqual(short_codes.resolve(foreign), created.pk)
+        # Повторный импорт всё равно узнаёт рецепт по исходному коду
+        output = call("import_recipes", input=path)
+        self.assertIn("Загружено: 0, уже были: 1", output)
+
+    def test_reimport_is_idempotent(self):
+        records = [
+            self.record("Блины", "old001"),
+            self.record("Оладьи", "old002"),
+        ]
+        path = self.write_ndjson(records)
+        call("import_recipes", input=path)
+        output = call("import_recipes", input=path)
+        self.assertIn("Загружено: 0, уже были: 2", output)
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(
+            short_codes.resolve("old002"), Recipe.objects.get(name="Оладьи").pk
+        )
+
+    def test_export_import_round_trip(self):
+        make_recipe(self.author, [self.flour, self.milk], 1)
+        make_recipe(self.author, [self.milk], 2)
+        path = Path(tempfile.mkdtemp()) / "export.ndjson"
+        call("export_recipes", output=str(path))
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual(
+            {record["name"] for record in records}, {"Рецепт 1", "Рецепт 2"}
+        )
+
+        Recipe.objects.all().delete()
+        call("import_recipes", input=str(path))
+        recipe = Recipe.objects.get(name="Рецепт 1")
+        self.assertEqual(
+            sorted(
+                recipe.recipeingredient_set.values_list(
+                    "ingredient__name", "amount"
+                )
+            ),
+            [("молоко", 2), ("мука", 2)],
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+
+    def test_invalid_records_are_skipped(self):
+        broken = self.record("Без ингредиентов", "old003")
+        broken["ingredients"] = [
+            {"name": "соль", "measurement_unit": "г", "amount": 1}
+        ]
+        no_author = self.record("Без автора", "old004")
+        del no_author["author"]
+        path = self.write_ndjson(
+            [self.record("Блины", "old001"), broken, no_author]
+        )
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("{не json\n")
+
+        output = call("import_recipes", input=path, batch_size=2)
+        self.assertIn(
+            "Загружено: 1, уже были: 0, пропущено с ошибками: 3", output
+        )
+        self.assertIn("новых авторов: 1", output)
+        self.assertEqual(
+            list(Recipe.objects.values_list("name", flat=True)), ["Блины"]
+        )
+        self.assertTrue(User.objects.filter(email="chef@example.com").exists())
+
+    def test_images_round_trip(self):
+        recipe = make_recipe(self.author, [self.flour], 1)
+        recipe.image.save("recipes/images/cake.png", ContentFile(b"image"))
+        images_dir = Path(tempfile.mkdtemp())
+        path = images_dir / "export.ndjson"
+        call("export_recipes", output=str(path), images_dir=str(images_dir))
+        self.assertEqual(
+            (images_dir / recipe.image.name).read_bytes(), b"image"
+        )
+
+        Recipe.objects.all().delete()
+        default_storage.delete(recipe.image.name)
+        call("import_recipes", input=str(path), images_dir=str(images_dir))
+        imported = Recipe.objects.get()
+        with default_storage.open(imported.image.name) as image:
+            self.assertEqual(image.read(), b"image")
+
+
+class GenerateDataTests(PostsTestCase):
+    def generate(self):
+        return call(
+            "generate_data",
+            users=20,
+            recipes=30,
+            ingredients_per_recipe=2,
+            favorites=3,
+            carts=2,
+            subscriptions=3,
+            batch_size=7,
+        )
+
+    def test_generate(self):
+        output = self.generate()
+        self.assertIn("Пользователи: 20", output)
+        self.assertIn("Рецепты: 30", output)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(
+            Recipe.objects.filter(recipeingredient__isnull=True).count(), 0
+        )
+        recipe = Recipe.objects.order_by("?").first()
+        self.assertEqual(short_codes.resolve(recipe.short_code), recipe.pk)
+        self.assertFalse(
+            Subscription.objects.filter(author=F("subscriber")).exists()
+        )
+
+        # Производные данные пересчитаны после bulk_create
+        self.assertEqual(
+            call("recompute_counters").count("исправлено расхождений: 0"), 2
+        )
+        self.assertIn("расхождений: 0", call("reconcile_shopping_carts"))
+        self.assertEqual(
+            PopularRecipe.objects.filter(window="all").count(),
+            len(popular.count_events()),
+        )
+
+        # Повторный запуск не упирается в уникальные поля
+        self.generate()
+        self.assertEqual(Recipe.objects.count(), 60)
+
+
+class RelationsTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user(2)
+        self.pancakes = make_recipe(self.author, [self.flour, self.milk], 1)
+        self.bread = make_recipe(self.author, [self.flour], 2)
+
+    def totals(self):
+        return dict(
+            ShoppingCartIngredient.objects.filter(
+                user=self.reader
+            ).values_list("ingredient__name", "total_amount")
+        )
+
+    def assert_counters_actual(self):
+        checks = (
+            (Recipe, [self.pancakes.pk, self.bread.pk]),
+            (User, [self.author.pk, self.reader.pk]),
+        )
+        for model, pks in checks:
+            for values in counters.actual_counts(model, pks).values():
+                for field, (stored, actual) in values.items():
+                    self.assertEqual(stored, actual, field)
+
+    def test_favorites(self):
+        recipe_ids = [self.pancakes.pk, self.bread.pk, self.pancakes.pk]
+        self.assertEqual(
+            relations.add_favorites(self.reader.pk, recipe_ids),
+            [self.pancakes.pk, self.bread.pk],
+        )
+        self.assertEqual(
+            relations.add_favorites(self.reader.pk, recipe_ids), []
+        )
+        self.assertEqual(Favourite.objects.count(), 2)
+        self.pancakes.refresh_from_db()
+        self.assertEqual(self.pancakes.favorites_count, 1)
+        self.assertEqual(
+            relations.remove_favorites(self.reader.pk, recipe_ids),
+            [self.pancakes.pk, self.bread.pk],
+        )
+        self.assertEqual(
+            relations.remove_favorites(self.reader.pk, recipe_ids), []
+        )
+        self.assert_counters_actual()
+
+    def test_favorite_click_queries(self):
+        # Не считая SAVEPOINT и RELEASE от atomic: INSERT … RETURNING и
+        # UPDATE счётчика; повтор — только INSERT, который ничего не вставил
+        with self.assertNumQueries(4):
+            relations.add_favorites(self.reader.pk, [self.pancakes.pk])
+        with self.assertNumQueries(3):
+            relations.add_favorites(self.reader.pk, [self.pancakes.pk])
+        # DELETE … RETURNING, счётчик и состояние окон рейтинга
+        with self.assertNumQueries(5):
+            relations.remove_favorites(self.reader.pk, [self.pancakes.pk])
+        self.assert_counters_actual()
+
+    def test_cart_totals_change_only_for_added(self):
+        relations.add_to_cart(self.reader.pk, [self.pancakes.pk])
+        self.assertEqual(self.totals(), {"мука": 2, "молоко": 2})
+        added = relations.add_to_cart(
+            self.reader.pk, [self.pancakes.pk, self.bread.pk, self.bread.pk]
+        )
+        self.assertEqual(added, [self.bread.pk])
+        self.assertEqual(self.totals(), {"мука": 5, "молоко": 2})
+        self.assertEqual(
+            self.totals(),
+            {
+                Ingredient.objects.get(pk=ingredient_id).name: total
+                for (_, ingredient_id), total in cart_totals.actual_totals(
+                    [self.reader.pk]
+                ).items()
+            },
+        )
+        relations.remove_from_cart(
+            self.reader.pk, [self.pancakes.pk, self.pancakes.pk]
+        )
+        self.assertEqual(self.totals(), {"мука": 3})
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.assert_counters_actual()
+
+    def test_reconcile_shopping_carts(self):
+        relations.add_to_cart(
+            self.reader.pk, [self.pancakes.pk, self.bread.pk]
+        )
+        ShoppingCartIngredient.objects.filter(ingredient=self.flour).update(
+            total_amount=1
+        )
+        ShoppingCartIngredient.objects.filter(ingredient=self.milk).delete()
+
+        output = call("reconcile_shopping_carts", dry_run=True)
+        self.assertIn(f"пользователя {self.reader.pk}", output)
+        self.assertEqual(self.totals(), {"мука": 1})
+
+        call("reconcile_shopping_carts", batch_size=1)
+        self.assertEqual(self.totals(), {"мука": 5, "молоко": 2})
+        self.assertIn("расхождений: 0", call("reconcile_shopping_carts"))
+
+    def test_subscriptions(self):
+        self.assertEqual(
+            relations.subscribe(self.reader.pk, [self.author.pk]),
+            [self.author.pk],
+        )
+        self.assertEqual(
+            relations.subscribe(self.reader.pk, [self.author.pk]), []
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assert_counters_actual()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(
+                subscriber=self.reader, author=self.author
+            )
+
+
+class CountersTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user(2)
+        self.recipe = make_recipe(self.author, [self.flour], 1)
+        relations.add_favorites(self.reader.pk, [self.recipe.pk])
+        relations.add_to_cart(self.reader.pk, [self.recipe.pk])
+
+    def counts(self, model, pk):
+        return counters.actual_counts(model, [pk])[pk]
+
+    def test_recipe_create_and_delete(self):
+        make_recipe(self.author, [], 2)
+        self.assertEqual(
+            self.counts(User, self.author.pk)["recipes_count"], (2, 2)
+        )
+        self.recipe.delete()
+        self.assertEqual(
+            self.counts(User, self.author.pk)["recipes_count"], (1, 1)
+        )
+
+    def test_recompute_counters(self):
+        User.objects.filter(pk=self.author.pk).update(recipes_count=5)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            favorites_count=0, in_carts_count=3
+        )
+
+        output = call("recompute_counters", dry_run=True)
+        self.assertIn("recipes_count 5 -> 1", output)
+        self.assertIn("in_carts_count 3 -> 1", output)
+        self.assertEqual(
+            self.counts(User, self.author.pk)["recipes_count"], (5, 1)
+        )
+
+        call("recompute_counters", batch_size=1)
+        self.assertEqual(
+            self.counts(Recipe, self.recipe.pk),
+            {"favorites_count": (1, 1), "in_carts_count": (1, 1)},
+        )
+        self.assertEqual(
+            self.counts(User, self.author.pk)["recipes_count"], (1, 1)
+        )
+        output = call("recompute_counters")
+        self.assertEqual(output.count("исправлено расхождений: 0"), 2)
+
+    def test_save_keeps_counters(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        relations.remove_favorites(self.reader.pk, [self.recipe.pk])
+        stale.name = "Новое имя"
+        stale.save()
+        self.assertEqual(
+            self.counts(Recipe, self.recipe.pk)["favorites_count"], (0, 0)
+        )
+
+    def test_save_skips_deferred_fields(self):
+        recipe = Recipe.objects.only("name", "short_code").get(
+            pk=self.recipe.pk
+        )
+        recipe.name = "Новое имя"
+        with self.assertNumQueries(1):
+            recipe.save()
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).text, self.recipe.text
+        )
+
+
+class PopularTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.users = [make_user(number) for number in range(2, 5)]
+        self.a, self.b, self.c = (
+            make_recipe(self.author, [], number) for number in range(3)
+        )
+        first, second, third = self.users
+        self.event(Favourite, first, self.a, hours=30)
+        self.event(Favourite, second, self.a, hours=2)
+        self.event(ShoppingCart, first, self.b, hours=1)
+        self.event(Favourite, third, self.b, hours=3)
+        self.event(Favourite, first, self.c, hours=240)
+
+    def event(self, model, user, recipe, hours):
+        if model is Favourite:
+            relations.add_favorites(user.pk, [recipe.pk])
+        else:
+            relations.add_to_cart(user.pk, [recipe.pk])
+        model.objects.filter(user=user, recipe=recipe).update(
+            created=self.now - timedelta(hours=hours)
+        )
+
+    def scores(self, window):
+        return dict(
+            PopularRecipe.objects.filter(window=window).values_list(
+                "recipe_id", "score"
+            )
+        )
+
+    def test_rebuild(self):
+        for window in popular.WINDOWS:
+            self.assertIsNone(popular.refresh(window, self.now))
+        self.assertEqual(self.scores("24h"), {self.a.pk: 1, self.b.pk: 2})
+        self.assertEqual(self.scores("7d"), {self.a.pk: 2, self.b.pk: 2})
+        self.assertEqual(
+            self.scores("all"), {self.a.pk: 2, self.b.pk: 2, self.c.pk: 1}
+        )
+
+    def test_delta_matches_rebuild(self):
+        popular.refresh("24h", self.now)
+        self.event(Favourite, self.users[1], self.c, hours=-0.5)
+        self.assertEqual(
+            popular.refresh("24h", self.now + timedelta(hours=1)), 1
+        )
+        self.assertEqual(
+            self.scores("24h"), {self.a.pk: 1, self.b.pk: 2, self.c.pk: 1}
+        )
+
+        # Через сутки старые события вышли из окна
+        later = self.now + timedelta(hours=23)
+        popular.refresh("24h", later)
+        self.assertEqual(self.scores("24h"), {self.c.pk: 1})
+        incremental = self.scores("24h")
+        popular.refresh("24h", later, full=True)
+        self.assertEqual(self.scores("24h"), incremental)
+
+        # Удалённое событие вычитается сразу
+        relations.remove_favorites(self.users[1].pk, [self.c.pk])
+        self.assertEqual(self.scores("24h"), {})
+
+    def test_endpoint(self):
+        call("refresh_popular", window="all")
+        # При равном рейтинге первым идёт рецепт с большим id
+        expected = [self.b.pk, self.a.pk, self.c.pk]
+        recipe_ids, url = [], "/api/recipes/popular/?window=all&limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            recipe_ids += [item["id"] for item in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(recipe_ids, expected)
+        response = self.client.get("/api/recipes/popular/?window=1y")
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeIngredientIndexTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.salt = Ingredient.objects.create(
+            name="соль", measurement_unit="г"
+        )
+        self.pancakes = make_recipe(self.author, [self.flour, self.milk], 1)
+        self.bread = make_recipe(self.author, [self.flour, self.salt], 2)
+        self.synced = SyncedIndex(RecipeIngredientIndex)
+
+    def test_match(self):
+        index = self.synced.get()
+        self.assertEqual(
+            index.match_all([self.flour.pk]), [self.pancakes.pk, self.bread.pk]
+        )
+        self.assertEqual(
+            index.match_all([self.flour.pk, self.milk.pk]), [self.pancakes.pk]
+        )
+        self.assertEqual(index.match_all([self.milk.pk, self.salt.pk]), [])
+        self.assertEqual(
+            index.match_any([self.milk.pk, self.salt.pk]),
+            [self.pancakes.pk, self.bread.pk],
+        )
+
+    def test_replay_makes_new_snapshot(self):
+        old = self.synced.get()
+        RecipeIngredient.objects.filter(
+            recipe=self.pancakes, ingredient=self.milk
+        ).update(ingredient=self.salt)
+        publish_recipe_change(self.pancakes.pk)
+
+        new = self.synced.get()
+        self.assertIsNot(new, old)
+        self.assertIs(self.synced.index, new)
+        self.assertEqual(new.built_at, old.built_at)
+        self.assertEqual(new.match_any([self.milk.pk]), [])
+        self.assertEqual(
+            new.match_all([self.salt.pk]), [self.pancakes.pk, self.bread.pk]
+        )
+        # Старый снимок, который мог читать другой поток, не изменился
+        self.assertEqual(old.match_any([self.milk.pk]), [self.pancakes.pk])
+        self.assertEqual(old.match_all([self.salt.pk]), [self.bread.pk])
+        self.assertIs(self.synced.get(), new)
+
+    def test_reset_rebuilds(self):
+        old = self.synced.get()
+        reset_index()
+        new = self.synced.get()
+        self.assertIsNot(new, old)
+        self.assertGreater(new.built_at, old.built_at)
+        self.assertEqual(len(new), 4)
+
+    def test_filter_by_ingredients(self):
+        # Снимок процесса мог остаться от данных другого теста
+        reset_index()
+        ids = f"{self.flour.pk},{self.milk.pk}"
+        response = self.client.get(f"/api/recipes/?ingredients={ids}")
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            [self.pancakes.pk],
+        )
+        response = self.client.get(
+            f"/api/recipes/?ingredients={ids}&match=any"
+        )
+        self.assertEqual(response.data["count"], 2)
+
+
+class PantryTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.salt = Ingredient.objects.create(
+            name="соль", measurement_unit="г"
+        )
+        self.pancakes = make_recipe(self.author, [self.flour, self.milk], 1)
+        self.bread = make_recipe(self.author, [self.flour, self.salt], 2)
+        self.synced = SyncedIndex(PantryMatrix)
+
+    def test_rank(self):
+        ranked = self.synced.get().rank({self.flour.pk, self.milk.pk}, 10)
+        self.assertEqual(
+            ranked,
+            [
+                (self.pancakes.pk, 1.0, []),
+                (self.bread.pk, 0.5, [self.salt.pk]),
+            ],
+        )
+        self.assertEqual(self.synced.get().rank({10**6}, 10), [])
+
+    def test_replay_makes_new_matrix(self):
+        old = self.synced.get()
+        RecipeIngredient.objects.filter(
+            recipe=self.bread, ingredient=self.salt
+        ).delete()
+        publish_recipe_change(self.bread.pk)
+
+        new = self.synced.get()
+        self.assertIsNot(new, old)
+        self.assertEqual(
+            new.rank({self.flour.pk}, 10)[0], (self.bread.pk, 1.0, [])
+        )
+        # Старая матрица, которую мог читать другой поток, не изменилась
+        missing = {pk: ids for pk, _, ids in old.rank({self.flour.pk}, 10)}
+        self.assertEqual(missing[self.bread.pk], [self.salt.pk])
+        self.assertEqual(len(old.indices), 4)
+        self.assertEqual(len(new.indices), 3)
+
+    def test_endpoint(self):
+        pantry._matrix.index = None
+        response = self.client.get(
+            f"/api/recipes/pantry/?ingredients={self.flour.pk},{self.salt.pk}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["coverage"]) for item in response.data],
+            [(self.bread.pk, 1.0), (self.pancakes.pk, 0.5)],
+        )
+        self.assertEqual(
+            response.data[1]["missing_ingredients"],
+            [{"id": self.milk.pk, "name": "молоко", "measurement_unit": "мл"}],
+        )
+        response = self.client.get("/api/recipes/pantry/?ingredients=a")
+        self.assertEqual(response.status_code, 400)
+
+
+class IngredientIndexTests(PostsTestCase):
+    def setUp(self):
+        super().setUp()
+        ingredient_index._index = None
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name="Мёд", measurement_unit="г"),
+                Ingredient(name="мед липовый", measurement_unit="г"),
+                Ingredient(name="сгущённое молоко", measurement_unit="г"),
+            ]
+        )
+
+    def names(self, items):
+        return [item["name"] for item in items]
+
+    def test_prefix(self):
+        index = ingredient_index.get_index()
+        self.assertEqual(self.names(index.search("мо")), ["молоко"])
+        # Регистр и ё не важны
+        self.assertEqual(
+            self.names(index.search("МЕД")), ["Мёд", "мед липовый"]
+        )
+        self.assertEqual(self.names(index.search("ме", limit=1)), ["Мёд"])
+        self.assertEqual(index.search("я"), [])
+        self.assertEqual(
+            index.by_ids([self.milk.pk, 10**6, self.flour.pk]),
+            [
+                {
+                    "id": self.milk.pk,
+                    "name": "молоко",
+                    "measurement_unit": "мл",
+                },
+                {"id": self.flour.pk, "name": "мука", "measurement_unit": "г"},
+            ],
+        )
+
+    def test_rebuilt_after_change(self):
+        index = ingredient_index.get_index()
+        self.assertIs(ingredient_index.get_index(), index)
+        Ingredient.objects.create(name="масло", measurement_unit="г")
+        rebuilt = ingredient_index.get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(self.names(rebuilt.search("ма")), ["масло"])
+
+    def test_fuzzy(self):
+        # Опечатка и вхождение в середине названия; префиксные — первыми
+        self.assertIn(
+            "молоко", self.names(ingredient_index.fuzzy_search("малоко", 10))
+        )
+        self.assertEqual(
+            self.names(ingredient_index.fuzzy_search("молоко", 10)),
+            ["молоко", "сгущённое молоко"],
+        )
+        self.assertEqual(
+            self.names(ingredient_index.fuzzy_search("липов", 10)),
+            ["мед липовый"],
+        )
+        self.assertEqual(ingredient_index.fuzzy_search("", 10), [])
+
+    def test_endpoint(self):
+        ingredient_index.get_index()
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/ingredients/?name=м&limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response.data), ["Мёд", "мед липовый"])
+
+        response = self.client.get(
+            "/api/ingredients/?name=сгущеное&mode=fuzzy"
+        )
+        self.assertEqual(self.names(response.data), ["сгущённое молоко"])
+        for query in ("mode=exact", "limit=0", "limit=x"):
+            response = self.client.get(f"/api/ingredients/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+
+class MergeDuplicateIngredientsTests(TransactionTestCase):
+    before = [("posts", "0009_popular_recipes")]
+    after = [("posts", "0010_ingredient_unique_and_data_import")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_merged_amount_is_clamped(self):
+        apps = self.migrate(self.before)
+        Ingredient = apps.get_model("posts", "Ingredient")
+        Recipe = apps.get_model("posts", "Recipe")
+        RecipeIngredient = apps.get_model("posts", "RecipeIngredient")
+        # Состояние users в apps — только предки posts 0009, а таблица
+        # пользователей уже в текущей схеме
+        recipe = Recipe.objects.create(
+            author_id=make_user(1).pk,
+            name="Рецепт",
+            text="Описание",
+            cooking_time=10,
+        )
+        first, second = (
+            Ingredient.objects.create(name="мука", measurement_unit="г")
+            for _ in range(2)
+        )
+        for ingredient in (first, second):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=20000
+            )
+
+        apps = self.migrate(self.after)
+        rows = apps.get_model("posts", "RecipeIngredient").objects.filter(
+            recipe_id=recipe.pk
+        )
+        self.assertEqual(
+            list(rows.values_list("ingredient_id", "amount")),
+            [(first.pk, 32000)],
+        )
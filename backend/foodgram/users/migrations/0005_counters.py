@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 03:18
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, link):
+    rows = (
+        model.objects.filter(**{link: models.OuterRef("pk")})
+        .order_by()
+        .values(link)
+        .annotate(total=models.Count("pk"))
+        .values("total")
+    )
+    return Coalesce(models.Subquery(rows), models.Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("posts", "Recipe")
+    Subscription = apps.get_model("users", "Subscription")
+    User = apps.get_model("users", "User")
+    User.objects.update(
+        recipes_count=count_of(Recipe, "author"),
+        subscribers_count=count_of(Subscription, "author"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_timelineentry'),
+        ('users', '0004_rename_subsciber_subscription_subscriber'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
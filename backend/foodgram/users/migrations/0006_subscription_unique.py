@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 04:03
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    Subscription = apps.get_model("users", "Subscription")
+    User = apps.get_model("users", "User")
+    duplicates = (
+        Subscription.objects.values("subscriber", "author")
+        .annotate(first=models.Min("pk"), total=models.Count("pk"))
+        .filter(total__gt=1)
+    )
+    authors = set()
+    for row in duplicates:
+        Subscription.objects.filter(
+            subscriber=row["subscriber"], author=row["author"]
+        ).exclude(pk=row["first"]).delete()
+        authors.add(row["author"])
+    if authors:
+        # Дубликаты попали и в счётчики подписчиков
+        subscribers = (
+            Subscription.objects.filter(author=models.OuterRef("pk"))
+            .order_by()
+            .values("author")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        )
+        User.objects.filter(pk__in=authors).update(
+            subscribers_count=Coalesce(models.Subquery(subscribers), models.Value(0))
+        )
+    if schema_editor.connection.vendor == "postgresql":
+        # Отложенные проверки внешних ключей — сейчас, иначе ALTER TABLE
+        # в той же транзакции падает с «pending trigger events»
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('subscriber', 'author'), name='unique_subscriber_author'),
+        ),
+    ]
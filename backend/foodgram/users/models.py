@@ -2,13 +2,15 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
+from posts.counters import CounterFieldsMixin
+
 username_validator = RegexValidator(
     regex=r"^[\w.@+-]+\Z",
     message="Username may contain only letters, numbers, and @/./+/-/_ characters.",
 )
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True)
     username = models.CharField(
         max_length=50, unique=True, validators=[username_validator]
@@ -19,6 +21,11 @@ class User(AbstractUser):
 
     avatar = models.ImageField(null=True)
 
+    # Поддерживаются в posts.counters, пересчёт — recompute_counters
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ("recipes_count", "subscribers_count")
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name", "username"]
 
@@ -30,3 +37,11 @@ class Subscription(models.Model):
     author = models.ForeignKey(
         User, related_name="subscribers", on_delete=models.CASCADE
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["subscriber", "author"],
+                name="unique_subscriber_author",
+            )
+        ]